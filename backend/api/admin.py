@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import HealthMetric, Meal, FitnessGoal
+from .models import HealthMetric, Meal, FitnessGoal, DailyRollup, ImportJob, MetricArchiveBlock, Task, Tombstone
 
 # Simple registration for basic admin access
 @admin.register(HealthMetric)
@@ -20,6 +20,37 @@ class FitnessGoalAdmin(admin.ModelAdmin):
     list_filter = ('user', 'completed', 'created_at')
     search_fields = ('user__username', 'goal_text')
 
+@admin.register(DailyRollup)
+class DailyRollupAdmin(admin.ModelAdmin):
+    list_display = ('user', 'date', 'steps_sum', 'hr_count', 'weight_last', 'calories_sum', 'meal_count')
+    list_filter = ('user', 'date')
+    search_fields = ('user__username',)
+
+@admin.register(ImportJob)
+class ImportJobAdmin(admin.ModelAdmin):
+    list_display = ('user', 'resource', 'filename', 'status', 'rows_processed', 'rows_imported', 'updated_at')
+    list_filter = ('status', 'resource')
+    search_fields = ('user__username', 'filename')
+
+@admin.register(MetricArchiveBlock)
+class MetricArchiveBlockAdmin(admin.ModelAdmin):
+    list_display = ('user', 'month', 'row_count', 'first_timestamp', 'last_timestamp', 'updated_at')
+    list_filter = ('month',)
+    search_fields = ('user__username',)
+    exclude = ('data',) # Compressed arrays (api/archive.py)
+
+@admin.register(Tombstone)
+class TombstoneAdmin(admin.ModelAdmin):
+    list_display = ('user', 'resource', 'object_id', 'deleted_at')
+    list_filter = ('resource',)
+    search_fields = ('user__username',)
+
+@admin.register(Task)
+class TaskAdmin(admin.ModelAdmin):
+    list_display = ('id', 'kind', 'user', 'status', 'attempts', 'created_at', 'finished_at')
+    list_filter = ('status', 'kind')
+    search_fields = ('user__username',)
+
 # You might want to customize the User admin as well if needed
 # from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 # from django.contrib.auth.models import User
@@ -0,0 +1,430 @@
+# backend/api/archive.py
+
+"""
+Hot/cold tiering of HealthMetric rows.
+
+`manage.py archive_metrics --older-than DAYS` moves old rows out of the
+HealthMetric table in whole calendar months (UTC). Each user's month becomes
+one MetricArchiveBlock holding the ids, timestamps, steps, heart rates and
+weights as int64 arrays. Ids and timestamps are delta-encoded, then every
+column is byte-shuffled and the lot is zlib-compressed: a few bytes per row
+instead of a table row plus its index entries. The hot table keeps only the
+recent rows, so its indexes stay small.
+
+The reads that can reach old data merge the blocks back in, so their output
+doesn't change when rows are archived:
+
+- the metric list: archived_page(), merged on the keyset position;
+- the export: iter_archived_rows();
+- summaries and rollups: aggregate_archive();
+- the series endpoint: archived_series();
+- import duplicate detection: archived_timestamps();
+- retrieving one row by id: archived_row();
+- the first pass of delta sync: archived_page().
+
+Each starts with one indexed query on the block table, and reads no blocks
+for users or ranges without archived months. Blocks record the range of ids
+they hold, so a lookup by id only unpacks the blocks that can hold it.
+
+Updating or deleting an archived row first moves it back into the hot table
+(restore_row()), and the write then goes through the usual path. Rows written
+into an archived month later stay in the hot table until the next archive run
+folds them into the block.
+"""
+
+import datetime
+import struct
+import zlib
+from decimal import Decimal
+from typing import NamedTuple
+
+import numpy as np
+from django.db import transaction
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from .models import HealthMetric, MetricArchiveBlock
+from .versions import bump_data_version
+
+FORMAT_VERSION = 1
+DELETE_BATCH_SIZE = 1000 # Raw rows per DELETE statement
+
+_HEADER = struct.Struct('<4sHI') # Magic, format version, row count; the compressed columns follow
+_MAGIC = b'HMAB'
+_NULL = -1 # Missing steps, heart rate or weight (none of them is negative)
+_DELTA_COLUMNS = ('ids', 'times') # Increasing: stored as differences from the previous row
+
+_EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+_MICROSECOND = datetime.timedelta(microseconds=1)
+
+
+class ArchivedColumns(NamedTuple):
+    """Archived rows in (timestamp, id) order as parallel int64 arrays; -1 marks a missing value."""
+    ids: np.ndarray
+    times: np.ndarray      # Microseconds since the epoch
+    steps: np.ndarray
+    heart_rate: np.ndarray
+    weight: np.ndarray     # Hundredths: the column has two decimal places
+
+    def take(self, selection):
+        return ArchivedColumns(*(column[selection] for column in self))
+
+
+def to_microseconds(value):
+    return (value - _EPOCH) // _MICROSECOND
+
+
+def from_microseconds(value):
+    return _EPOCH + datetime.timedelta(microseconds=int(value))
+
+
+def month_bounds(month):
+    """Aware UTC datetimes for the start of `month` (a date) and of the month after it."""
+    start = datetime.datetime(month.year, month.month, 1, tzinfo=datetime.timezone.utc)
+    following = (start + datetime.timedelta(days=32)).replace(day=1)
+    return start, following
+
+
+def columns_from_rows(rows):
+    """ArchivedColumns from (id, timestamp, steps, heart_rate, weight) tuples, in (timestamp, id) order."""
+    def column(values):
+        return np.fromiter((_NULL if value is None else value for value in values), np.int64, len(rows))
+
+    columns = ArchivedColumns(
+        ids=column(row[0] for row in rows),
+        times=column(to_microseconds(row[1]) for row in rows),
+        steps=column(row[2] for row in rows),
+        heart_rate=column(row[3] for row in rows),
+        weight=column(None if row[4] is None else int(row[4].scaleb(2).to_integral_value()) for row in rows),
+    )
+    return columns.take(np.lexsort((columns.ids, columns.times)))
+
+
+def merge_columns(*parts):
+    """One ArchivedColumns holding the rows of all `parts`, in (timestamp, id) order."""
+    columns = ArchivedColumns(*(np.concatenate(arrays) for arrays in zip(*parts)))
+    return columns.take(np.lexsort((columns.ids, columns.times)))
+
+
+def pack_columns(columns):
+    """The compressed block format stored in MetricArchiveBlock.data."""
+    parts = []
+    for name, column in zip(ArchivedColumns._fields, columns):
+        column = column.astype('<i8')
+        if name in _DELTA_COLUMNS:
+            column = np.diff(column, prepend=0)
+        # Byte-shuffle: every value's first byte, then every second byte, ... so the
+        # mostly-zero high bytes form long runs
+        parts.append(column.view(np.uint8).reshape(-1, 8).T.tobytes())
+    return _HEADER.pack(_MAGIC, FORMAT_VERSION, len(columns.ids)) + zlib.compress(b''.join(parts), 6)
+
+
+def unpack_columns(data):
+    """ArchivedColumns from pack_columns() output."""
+    data = bytes(data) # PostgreSQL returns a memoryview
+    magic, version, count = _HEADER.unpack_from(data)
+    if magic != _MAGIC or version != FORMAT_VERSION:
+        raise ValueError(f"Unsupported archive block format: {magic!r} version {version}.")
+    raw = np.frombuffer(zlib.decompress(data[_HEADER.size:]), dtype=np.uint8)
+    size = count * 8
+    columns = []
+    for i, name in enumerate(ArchivedColumns._fields):
+        column = raw[i * size:(i + 1) * size].reshape(8, count).T.copy().view('<i8').ravel().astype(np.int64)
+        columns.append(np.cumsum(column) if name in _DELTA_COLUMNS else column)
+    return ArchivedColumns(*columns)
+
+
+def _iter_blocks(user_id, start=None, end=None, descending=False):
+    """
+    ArchivedColumns of each of the user's blocks, cut to [start, end), oldest
+    month first (newest first if `descending`). One block in memory at a time.
+    """
+    blocks = MetricArchiveBlock.objects.filter(user_id=user_id)
+    if start is not None:
+        blocks = blocks.filter(last_timestamp__gte=start)
+    if end is not None:
+        blocks = blocks.filter(first_timestamp__lt=end)
+    block_ids = list(blocks.order_by('-month' if descending else 'month').values_list('id', flat=True))
+    for block_id in block_ids:
+        data = MetricArchiveBlock.objects.filter(pk=block_id).values_list('data', flat=True).first()
+        if data is None:
+            continue # Deleted with its user since the listing
+        columns = unpack_columns(data)
+        lo = 0 if start is None else np.searchsorted(columns.times, to_microseconds(start), 'left')
+        hi = len(columns.times) if end is None else np.searchsorted(columns.times, to_microseconds(end), 'left')
+        if lo < hi:
+            yield columns.take(slice(lo, hi))
+
+
+def to_rows(columns):
+    """
+    Row dicts shaped like HealthMetric.objects.values(*row_fields(HealthMetricSerializer())),
+    in array order.
+    """
+    rows = []
+    for pk, micros, steps, heart_rate, weight in zip(*(column.tolist() for column in columns)):
+        rows.append({
+            'id': pk,
+            'weight': None if weight == _NULL else Decimal(weight).scaleb(-2),
+            'steps': None if steps == _NULL else steps,
+            'heart_rate': None if heart_rate == _NULL else heart_rate,
+            'timestamp': _EPOCH + datetime.timedelta(microseconds=micros),
+        })
+    return rows
+
+
+def iter_archived_rows(user_id, start=None, end=None):
+    """The user's archived rows in [start, end) as row dicts, oldest first."""
+    for columns in _iter_blocks(user_id, start, end):
+        yield from to_rows(columns)
+
+
+def archived_page(user_id, limit, start=None, end=None, after=None, stop=None, reverse=False):
+    """
+    Up to `limit` archived rows in [start, end) for a keyset page, newest first
+    (oldest first if `reverse`). `after` is the cursor's (timestamp, id): only rows
+    past it in page order qualify. `stop` is the timestamp the hot rows already
+    fill the page to; rows past it in page order can't make the page.
+    """
+    # Narrow [start, end) to the timestamps the page can still take; the cursor's
+    # own timestamp stays in, as ties are decided by id
+    cursor = [] if after is None else [after[0]]
+    if reverse:
+        floors, ceilings = cursor, [] if stop is None else [stop + _MICROSECOND]
+    else:
+        floors, ceilings = [] if stop is None else [stop], [bound + _MICROSECOND for bound in cursor]
+    lower = max([bound for bound in (start, *floors) if bound is not None], default=None)
+    upper = min([bound for bound in (end, *ceilings) if bound is not None], default=None)
+    if lower is not None and upper is not None and lower >= upper:
+        return []
+
+    rows = []
+    for columns in _iter_blocks(user_id, lower, upper, descending=not reverse):
+        if after is not None:
+            micros, pk = to_microseconds(after[0]), after[1]
+            if reverse:
+                past = (columns.times > micros) | ((columns.times == micros) & (columns.ids > pk))
+            else:
+                past = (columns.times < micros) | ((columns.times == micros) & (columns.ids < pk))
+            columns = columns.take(past)
+        indices = np.arange(len(columns.ids))
+        if not reverse:
+            indices = indices[::-1]
+        rows.extend(to_rows(columns.take(indices[:limit - len(rows)])))
+        if len(rows) >= limit:
+            break
+    return rows
+
+
+def archived_series(user_id, field, start=None, end=None):
+    """
+    The user's archived non-null `field` samples in [start, end), oldest first:
+    timestamps in microseconds since the epoch (int64) and values (float64).
+    """
+    times, values = [np.empty(0, dtype=np.int64)], [np.empty(0, dtype=np.float64)]
+    for columns in _iter_blocks(user_id, start, end):
+        column = getattr(columns, field)
+        present = column != _NULL
+        times.append(columns.times[present])
+        values.append(column[present] / 100 if field == 'weight' else column[present].astype(np.float64))
+    return np.concatenate(times), np.concatenate(values)
+
+
+def _blocks_holding(user_id, pk):
+    return MetricArchiveBlock.objects.filter(user_id=user_id, min_id__lte=pk, max_id__gte=pk)
+
+
+def archived_row(user_id, pk):
+    """The user's archived row with id `pk` as a row dict (see to_rows()), or None."""
+    for data in _blocks_holding(user_id, pk).values_list('data', flat=True):
+        columns = unpack_columns(data)
+        found = columns.ids == pk
+        if found.any():
+            return to_rows(columns.take(found))[0]
+    return None
+
+
+def restore_row(user_id, pk):
+    """
+    Move the user's archived row with id `pk` back into the HealthMetric table,
+    keeping its id, and return it; None if the user has no such row. A row
+    restored concurrently is returned from the table.
+    """
+    with transaction.atomic():
+        for block in _blocks_holding(user_id, pk).select_for_update():
+            columns = unpack_columns(block.data)
+            found = columns.ids == pk
+            if not found.any():
+                continue
+            row = to_rows(columns.take(found))[0]
+            rest = columns.take(~found)
+            if len(rest.ids):
+                _write_block(block, rest)
+            else:
+                block.delete()
+            return HealthMetric.objects.create(user_id=user_id, **row)
+        return HealthMetric.objects.filter(user_id=user_id, pk=pk).first()
+
+
+def archived_timestamps(user_id, timestamps):
+    """The members of `timestamps` (aware datetimes) the user has archived rows at."""
+    if not timestamps:
+        return set()
+    wanted = np.unique(np.fromiter((to_microseconds(ts) for ts in timestamps), np.int64, len(timestamps)))
+    found = set()
+    for columns in _iter_blocks(user_id, min(timestamps), max(timestamps) + _MICROSECOND):
+        found.update(wanted[np.isin(wanted, columns.times)].tolist())
+    return {ts for ts in timestamps if to_microseconds(ts) in found}
+
+
+# --- Aggregates ---
+
+def _period_start(day, bucket):
+    if bucket == 'week':
+        return day - datetime.timedelta(days=day.weekday()) # ISO weeks start on Monday
+    if bucket == 'month':
+        return day.replace(day=1)
+    return day
+
+
+def _next_period(day, bucket):
+    if bucket == 'week':
+        return day + datetime.timedelta(days=7)
+    if bucket == 'month':
+        return (day + datetime.timedelta(days=32)).replace(day=1)
+    return day + datetime.timedelta(days=1)
+
+
+def _period_edges(first, last, bucket, tz):
+    """
+    The periods covering microsecond timestamps first..last: their first days, and
+    the start of each (local midnight in `tz`, in microseconds) plus the end of the last.
+    """
+    day = _period_start(timezone.localtime(from_microseconds(first), tz).date(), bucket)
+    days, edges = [], []
+    while not edges or edges[-1] <= last:
+        days.append(day)
+        edges.append(to_microseconds(timezone.make_aware(datetime.datetime.combine(day, datetime.time.min), tz)))
+        day = _next_period(day, bucket)
+    return days[:-1], edges
+
+
+def merge_aggregates(current, other):
+    """
+    Combine the aggregates of two disjoint sets of rows (as produced by
+    aggregate_archive()); `current` may be None. On equal weight timestamps the
+    weight in `current` wins.
+    """
+    if current is None:
+        return dict(other)
+    merged = dict(current)
+    if other['steps_sum'] is not None:
+        merged['steps_sum'] = other['steps_sum'] + (current['steps_sum'] or 0)
+    merged['hr_sum'] = current['hr_sum'] + other['hr_sum']
+    merged['hr_count'] = current['hr_count'] + other['hr_count']
+    for name, pick in (('hr_min', min), ('hr_max', max)):
+        values = [value for value in (current[name], other[name]) if value is not None]
+        merged[name] = pick(values) if values else None
+    if other['weight_at'] is not None and (current['weight_at'] is None or other['weight_at'] > current['weight_at']):
+        merged['weight_at'], merged['weight_last'] = other['weight_at'], other['weight_last']
+    return merged
+
+
+def aggregate_archive(user_id, bucket, tz, start=None, end=None):
+    """
+    Aggregate the user's archived rows in [start, end) into `bucket` periods
+    ('day', 'week' or 'month', starting at local midnight in `tz`, as in
+    api/summaries.py). Returns {first day of period: {steps_sum, hr_sum, hr_count,
+    hr_min, hr_max, weight_at, weight_last}} for the periods that have rows;
+    `weight_at` is the timestamp of the period's last weight.
+    """
+    results = {}
+    for columns in _iter_blocks(user_id, start, end):
+        days, edges = _period_edges(columns.times[0], columns.times[-1], bucket, tz)
+        bounds = np.searchsorted(columns.times, edges, 'left')
+        for day, lo, hi in zip(days, bounds[:-1], bounds[1:]):
+            if lo == hi:
+                continue
+            steps, heart_rate, weight = columns.steps[lo:hi], columns.heart_rate[lo:hi], columns.weight[lo:hi]
+            steps = steps[steps != _NULL]
+            heart_rate = heart_rate[heart_rate != _NULL]
+            weighed = np.flatnonzero(weight != _NULL)
+            values = {
+                'steps_sum': int(steps.sum()) if len(steps) else None,
+                'hr_sum': int(heart_rate.sum()),
+                'hr_count': len(heart_rate),
+                'hr_min': int(heart_rate.min()) if len(heart_rate) else None,
+                'hr_max': int(heart_rate.max()) if len(heart_rate) else None,
+                'weight_at': None,
+                'weight_last': None,
+            }
+            if len(weighed):
+                last = weighed[-1] # Rows are in (timestamp, id) order
+                values['weight_at'] = from_microseconds(columns.times[lo + last])
+                values['weight_last'] = Decimal(int(weight[last])).scaleb(-2)
+            results[day] = merge_aggregates(results.get(day), values)
+    return results
+
+
+# --- Archiving ---
+
+def archivable_months(user_id, before):
+    """First days of the months (UTC) with rows of the user before `before`, the start of a month."""
+    months = (
+        HealthMetric.objects.filter(user_id=user_id, timestamp__lt=before)
+        .annotate(month=TruncMonth('timestamp', tzinfo=datetime.timezone.utc))
+        .values_list('month', flat=True)
+        .distinct()
+        .order_by('month')
+    )
+    return [month.date() for month in months]
+
+
+def archive_month(user_id, month, batch_size=DELETE_BATCH_SIZE):
+    """
+    Move the user's HealthMetric rows in `month` (its first day, UTC) into the
+    month's MetricArchiveBlock, merged with any rows archived there before. The
+    block write and the deletes (by id, `batch_size` per statement) share one
+    transaction. Returns the number of rows moved.
+    """
+    start, end = month_bounds(month)
+    with transaction.atomic():
+        rows = list(
+            HealthMetric.objects.select_for_update()
+            .filter(user_id=user_id, timestamp__gte=start, timestamp__lt=end)
+            .order_by('timestamp', 'id')
+            .values_list('id', 'timestamp', 'steps', 'heart_rate', 'weight')
+        )
+        if not rows:
+            return 0
+        columns = columns_from_rows(rows)
+        block = MetricArchiveBlock.objects.select_for_update().filter(user_id=user_id, month=month).first()
+        if block is None:
+            block = MetricArchiveBlock(user_id=user_id, month=month)
+        else:
+            columns = merge_columns(unpack_columns(block.data), columns)
+        _write_block(block, columns)
+
+        ids = [row[0] for row in rows]
+        for i in range(0, len(ids), batch_size):
+            HealthMetric.objects.filter(pk__in=ids[i:i + batch_size]).delete()
+        # Responses cached from the raw rows are rebuilt from the block
+        bump_data_version(user_id, 'healthmetric')
+    return len(rows)
+
+
+def _write_block(block, columns):
+    """Save `columns` (at least one row) as the contents of `block`."""
+    block.row_count = len(columns.ids)
+    block.first_timestamp = from_microseconds(columns.times[0])
+    block.last_timestamp = from_microseconds(columns.times[-1])
+    block.min_id = int(columns.ids.min())
+    block.max_id = int(columns.ids.max())
+    block.data = pack_columns(columns)
+    block.save()
+
+
+def archive_user(user_id, before, batch_size=DELETE_BATCH_SIZE):
+    """Archive every month of the user's rows before `before` (the start of a month). Returns (rows, months)."""
+    months = archivable_months(user_id, before)
+    return sum(archive_month(user_id, month, batch_size) for month in months), len(months)
@@ -0,0 +1,29 @@
+# backend/api/async_cache.py
+
+"""
+Cache helpers: access from async views, and whether a cache is shared.
+
+Django's async cache API (aget, aset, ...) runs the sync method in a worker
+thread for backends without a native async client, which in Django 5.2 means all
+of the built-in ones. For the in-process LocMemCache there is no I/O to wait for
+and the thread hop costs more than the lookup, so it is called directly.
+"""
+
+from django.conf import settings
+from django.core.cache.backends.locmem import LocMemCache
+
+
+async def cache_call(cache, method, *args, **kwargs):
+    """`await cache_call(cache, 'get', key)`: cache.get(key) without blocking the event loop."""
+    if isinstance(cache, LocMemCache):
+        return getattr(cache, method)(*args, **kwargs)
+    return await getattr(cache, f'a{method}')(*args, **kwargs)
+
+
+def is_shared(cache):
+    """
+    True when every worker process sees the same entries in `cache`. A per-process
+    LocMemCache only counts when settings.SINGLE_WORKER_PROCESS says one process
+    serves all requests; otherwise an invalidation in one worker never reaches the others.
+    """
+    return not isinstance(cache, LocMemCache) or getattr(settings, 'SINGLE_WORKER_PROCESS', False)
@@ -0,0 +1,135 @@
+# backend/api/async_views.py
+
+"""
+Native async GET path for the read endpoints under ASGI.
+
+DRF views are synchronous, so under config/asgi.py Django runs each request in
+a worker thread. For the list, detail and dashboard endpoints, `async_read_view`
+wraps the regular DRF view in a coroutine view. It serves JSON GETs with the
+view's async handler (`alist`, `aretrieve`, `aget`): authentication (with the
+view's own authentication classes), version checks and response cache reads go
+through the async auth, cache and ORM APIs, and the event loop never parks a
+thread on a waiting request. Everything else
+(writes, OPTIONS, the browsable API) is handed to the unchanged sync view.
+
+That only holds while every middleware in settings.MIDDLEWARE is
+async-capable: Django runs the whole chain in a worker thread if one isn't
+(StaticFilesMiddleware in api/middleware.py replaces WhiteNoise's for this).
+
+The handlers reuse the views' own querysets, filters, pagination, ETags and
+response cache, so the output is byte-for-byte the same as the sync path.
+Enabled by settings.ASYNC_READ_VIEWS, which config/asgi.py switches on.
+"""
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import AnonymousUser
+from django.http import HttpResponse
+from django.urls import URLPattern, URLResolver
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import exceptions
+from rest_framework.renderers import JSONRenderer
+
+from .middleware import timed
+
+
+def _async_handler_name(view):
+    actions = getattr(view, 'actions', None)
+    action = actions.get('get') if actions is not None else 'get'
+    return f'a{action}' if action else None
+
+
+def async_read_view(view):
+    """
+    Wrap a DRF view callable (from `as_view()`) so JSON GETs use its async handler.
+    Returns `view` unchanged when the view class has no async handler for GET.
+    """
+    cls = getattr(view, 'cls', None)
+    handler_name = _async_handler_name(view)
+    if cls is None or handler_name is None or not hasattr(cls, handler_name):
+        return view
+    actions = getattr(view, 'actions', None)
+    sync_view = sync_to_async(view)
+
+    async def async_view(request, *args, **kwargs):
+        if request.method != 'GET':
+            return await sync_view(request, *args, **kwargs)
+
+        self = cls(**view.initkwargs)
+        if actions is not None: # What ViewSet.as_view() does per request
+            self.action_map = actions
+            for method, action in actions.items():
+                setattr(self, method, getattr(self, action))
+        if hasattr(self, 'get') and not hasattr(self, 'head'):
+            self.head = self.get
+        self.args, self.kwargs = args, kwargs
+        self.format_kwarg = self.get_format_suffix(**kwargs)
+        drf_request = self.initialize_request(request, *args, **kwargs)
+        self.request = drf_request
+        self.headers = self.default_response_headers
+
+        try:
+            renderer, _ = self.perform_content_negotiation(drf_request)
+        except exceptions.NotAcceptable:
+            renderer = None
+        if type(renderer) is not JSONRenderer:
+            return await sync_view(request, *args, **kwargs)
+
+        try:
+            await aauthenticate(drf_request)
+            self.initial(drf_request, *args, **kwargs) # Negotiation, permissions, throttles: no I/O
+            response = await getattr(self, handler_name)(drf_request, *args, **kwargs)
+        except Exception as exc:
+            response = self.handle_exception(exc)
+        return _to_http_response(self.finalize_response(drf_request, response, *args, **kwargs))
+
+    async_view.cls = cls
+    async_view.initkwargs = view.initkwargs
+    if actions is not None:
+        async_view.actions = actions
+    return csrf_exempt(async_view)
+
+
+async def aauthenticate(request):
+    """
+    DRF's Request._authenticate() for the async path, over the same authenticators
+    (the view's authentication_classes). Those with an async `aauthenticate`, like
+    CachedTokenAuthentication, are awaited; others run in a worker thread. The
+    first to return a user wins and is set on the DRF request.
+    """
+    for authenticator in request.authenticators:
+        if hasattr(authenticator, 'aauthenticate'):
+            user_auth = await authenticator.aauthenticate(request._request)
+        else:
+            user_auth = await sync_to_async(authenticator.authenticate)(request)
+        if user_auth is not None:
+            request._authenticator = authenticator
+            request.user, request.auth = user_auth
+            return
+    request._authenticator = None
+    request.user, request.auth = AnonymousUser(), None # The permission check answers 401
+
+
+def _to_http_response(response):
+    """
+    Render a DRF Response into a plain HttpResponse. Django's async handler would
+    otherwise call its render() through a worker thread.
+    """
+    if not hasattr(response, 'render'):
+        return response
+    with timed('serialize'):
+        response.render()
+    return HttpResponse(response.content, status=response.status_code, headers=response.headers)
+
+
+def async_read_urls(patterns):
+    """Apply async_read_view() to every route in a list of URL patterns, including router.urls."""
+    converted = []
+    for pattern in patterns:
+        if isinstance(pattern, URLPattern):
+            pattern = URLPattern(pattern.pattern, async_read_view(pattern.callback),
+                                 pattern.default_args, pattern.name)
+        elif isinstance(pattern, URLResolver) and isinstance(pattern.urlconf_name, list):
+            pattern = URLResolver(pattern.pattern, async_read_urls(pattern.urlconf_name),
+                                  pattern.default_kwargs, pattern.app_name, pattern.namespace)
+        converted.append(pattern)
+    return converted
@@ -0,0 +1,126 @@
+# backend/api/authentication.py
+
+import hashlib
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication, get_authorization_header
+from rest_framework.authtoken.models import Token
+
+from .async_cache import cache_call, is_shared
+from .middleware import timed
+
+
+def _token_cache():
+    return caches[getattr(settings, 'AUTH_TOKEN_CACHE_ALIAS', 'default')]
+
+
+def token_cache_ttl():
+    """
+    settings.AUTH_TOKEN_CACHE_TTL, cut to AUTH_TOKEN_LOCAL_CACHE_TTL when the cache
+    is per process: there a token deleted through another worker is only dropped
+    from this worker's copy when the entry expires.
+    """
+    ttl = getattr(settings, 'AUTH_TOKEN_CACHE_TTL', 300)
+    if not is_shared(_token_cache()):
+        ttl = min(ttl, getattr(settings, 'AUTH_TOKEN_LOCAL_CACHE_TTL', 5))
+    return ttl
+
+
+def token_cache_key(key):
+    """Cache key for a token. The raw token never appears in the cache key space."""
+    return 'auth:token:' + hashlib.sha256(key.encode()).hexdigest()
+
+
+def cache_token(token):
+    """
+    Store a Token (with its user already loaded) in the token cache. Used on
+    authentication misses and to pre-warm the cache at login.
+    """
+    token.user  # Make sure the user travels with the cached token
+    _token_cache().set(token_cache_key(token.key), token, token_cache_ttl())
+
+
+async def acache_token(token):
+    await cache_call(_token_cache(), 'set', token_cache_key(token.key), token, token_cache_ttl())
+
+
+def invalidate_token(key):
+    _token_cache().delete(token_cache_key(key))
+
+
+def invalidate_user_tokens(user_id):
+    """
+    Drop cached tokens of a user (e.g. after deactivation or a profile change).
+    Saving a User does this (api/signals.py); QuerySet.update() sends no signal,
+    so code that deactivates users that way must call it for each of them.
+    """
+    keys = list(Token.objects.filter(user_id=user_id).values_list('key', flat=True))
+    if keys:
+        _token_cache().delete_many([token_cache_key(key) for key in keys])
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    TokenAuthentication with the token -> user lookup kept in Django's cache
+    framework (settings.AUTH_TOKEN_CACHE_ALIAS, default 'default') for
+    settings.AUTH_TOKEN_CACHE_TTL seconds. A hit costs one cache read instead of
+    the Token + User join on every request.
+
+    Entries are dropped as soon as a token is deleted or its user is saved
+    (deactivated, renamed, ...) or deleted; see api/signals.py. Inactive users
+    are never cached, because the database path rejects them first. Revocation
+    reaches every worker only through a shared cache; with a per-process one,
+    entries are kept a few seconds at most (token_cache_ttl()).
+    """
+
+    def authenticate(self, request):
+        with timed('auth'):
+            return super().authenticate(request)
+
+    def authenticate_credentials(self, key):
+        token = _token_cache().get(token_cache_key(key))
+        if token is not None and token.user.is_active:
+            return (token.user, token)
+
+        user, token = super().authenticate_credentials(key)
+        cache_token(token)
+        return (user, token)
+
+    # --- Async path (api/async_views.py) ---
+
+    async def aauthenticate(self, request):
+        """authenticate() for async views: same header rules, async cache and ORM lookups."""
+        with timed('auth'):
+            return await self._aauthenticate(request)
+
+    async def _aauthenticate(self, request):
+        auth = get_authorization_header(request).split()
+        if not auth or auth[0].lower() != self.keyword.lower().encode():
+            return None
+        if len(auth) == 1:
+            raise exceptions.AuthenticationFailed(_('Invalid token header. No credentials provided.'))
+        if len(auth) > 2:
+            raise exceptions.AuthenticationFailed(_('Invalid token header. Token string should not contain spaces.'))
+        try:
+            key = auth[1].decode()
+        except UnicodeError:
+            raise exceptions.AuthenticationFailed(
+                _('Invalid token header. Token string should not contain invalid characters.'))
+        return await self.aauthenticate_credentials(key)
+
+    async def aauthenticate_credentials(self, key):
+        token = await cache_call(_token_cache(), 'get', token_cache_key(key))
+        if token is not None and token.user.is_active:
+            return (token.user, token)
+
+        try:
+            token = await self.get_model().objects.select_related('user').aget(key=key)
+        except self.get_model().DoesNotExist:
+            raise exceptions.AuthenticationFailed(_('Invalid token.'))
+        if not token.user.is_active:
+            raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+        await acache_token(token)
+        return (token.user, token)
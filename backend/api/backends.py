@@ -0,0 +1,68 @@
+# backend/api/backends.py
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.core.exceptions import PermissionDenied
+from django.db.models import Value
+from django.db.models.functions import Lower
+from rest_framework.request import Request
+
+from .hashing import HashingBusy, hash_password, verify_password
+
+
+def users_by_email(email):
+    """
+    Users whose email matches `email` case-insensitively. Written to match the
+    unique index on LOWER(email) WHERE email > '' (migration 0005), so it is an
+    index lookup rather than a scan of the user table.
+    """
+    UserModel = get_user_model()
+    return (UserModel._default_manager.alias(email_lower=Lower('email'))
+            .filter(email_lower=Lower(Value(email)), email__gt='')) # The database's LOWER() on both sides
+
+
+class PooledHashingModelBackend(ModelBackend):
+    """
+    ModelBackend that checks passwords in the hashing pool (api/hashing.py), so
+    login is subject to the same admission limit as registration. An unknown
+    username still costs one hash, as in ModelBackend, to keep timings alike.
+
+    The username may also be an email address (any case): when no user has
+    that username, the user with that email is tried.
+
+    When no hashing slot is free, API logins get HashingBusy, which DRF answers
+    with 429 and Retry-After. Plain Django views such as the admin login would
+    answer it with 500; for them the login fails instead (PermissionDenied, which
+    authenticate() reports as invalid credentials).
+    """
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        try:
+            return self._authenticate(username, password, **kwargs)
+        except HashingBusy:
+            if isinstance(request, Request):
+                raise
+            raise PermissionDenied
+
+    def _authenticate(self, username, password, **kwargs):
+        UserModel = get_user_model()
+        if username is None:
+            username = kwargs.get(UserModel.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+        user = self.get_user_by_login(username)
+        if user is None:
+            hash_password(password)
+            return None
+        if verify_password(user, password) and self.user_can_authenticate(user):
+            return user
+        return None
+
+    def get_user_by_login(self, login):
+        UserModel = get_user_model()
+        try:
+            return UserModel._default_manager.get_by_natural_key(login)
+        except UserModel.DoesNotExist:
+            pass
+        if '@' not in login:
+            return None
+        return users_by_email(login).first() # At most one, thanks to the unique index
@@ -0,0 +1,96 @@
+# backend/api/exports.py
+
+"""
+Streaming CSV / NDJSON export of a user's full history.
+
+Rows are read with `queryset.values().iterator(chunk_size=...)` (a server-side
+cursor on PostgreSQL), rendered a chunk at a time with the same field rules as
+the list endpoints and yielded as bytes, so memory stays flat however long the
+history is and the first bytes go out as soon as the first chunk is read.
+Archived metric months are unpacked one block at a time and merged in.
+"""
+
+import csv
+import heapq
+import io
+import zlib
+
+from rest_framework.utils.encoders import JSONEncoder
+
+from .archive import iter_archived_rows
+from .models import FitnessGoal, HealthMetric, Meal
+from .serializers import (
+    FitnessGoalSerializer, HealthMetricSerializer, MealSerializer, row_fields, serialize_rows,
+)
+
+# resource name -> (model, serializer class, time ordering field)
+EXPORT_RESOURCES = {
+    'metrics': (HealthMetric, HealthMetricSerializer, 'timestamp'),
+    'meals': (Meal, MealSerializer, 'timestamp'),
+    'goals': (FitnessGoal, FitnessGoalSerializer, 'created_at'),
+}
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson',
+}
+
+DEFAULT_CHUNK_SIZE = 2000
+
+
+def _chunks(rows, size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def iter_export(user, resource, fmt, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Yield the export of `user`'s `resource` rows (oldest first) as encoded chunks
+    in format `fmt` ('csv' or 'ndjson').
+    """
+    model, serializer_class, time_field = EXPORT_RESOURCES[resource]
+    serializer = serializer_class()
+    names = [name for name, field in serializer.fields.items() if not field.write_only]
+    rows = (model.objects.filter(user=user)
+            .order_by(time_field, 'id')
+            .values(*row_fields(serializer))
+            .iterator(chunk_size=chunk_size))
+    if model is HealthMetric:
+        # Archived months (api/archive.py), interleaved in the same (timestamp, id) order
+        rows = heapq.merge(rows, iter_archived_rows(user.id), key=lambda row: (row['timestamp'], row['id']))
+
+    if fmt == 'csv':
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(names)
+        yield buffer.getvalue().encode() # Header goes out before the first query returns
+        for chunk in _chunks(rows, chunk_size):
+            buffer.seek(0)
+            buffer.truncate()
+            for item in serialize_rows(serializer, chunk, user.username):
+                writer.writerow(['' if item[name] is None else item[name] for name in names])
+            yield buffer.getvalue().encode()
+    else:
+        encoder = JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+        for chunk in _chunks(rows, chunk_size):
+            items = serialize_rows(serializer, chunk, user.username)
+            yield ''.join(encoder.encode(item) + '\n' for item in items).encode()
+
+
+def gzip_stream(chunks, level=6):
+    """
+    Gzip an iterable of byte chunks on the fly. Each chunk is sync-flushed so the
+    client keeps receiving data at the pace the rows are read.
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31) # wbits=31: gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        if data:
+            yield data
+    yield compressor.flush()
@@ -0,0 +1,66 @@
+# backend/api/filters.py
+
+import datetime
+
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework import serializers
+from rest_framework.filters import BaseFilterBackend
+
+
+def parse_time_bound(value, param, end=False):
+    """
+    Parse a ?from= / ?to= query value into an aware datetime.
+
+    Accepts full ISO-8601 datetimes or plain dates. A plain date is read in the
+    current time zone; as an upper bound (`end=True`) it covers the whole day,
+    so `?to=2025-05-07` includes everything logged on the 7th.
+    Raises a ValidationError (400) for anything else.
+    """
+    if value in (None, ''):
+        return None
+
+    # Dates first: parse_datetime() also accepts a bare date (as midnight) on Python 3.11+
+    try:
+        day = parse_date(value)
+    except ValueError:
+        day = None
+    if day is None:
+        try:
+            parsed = parse_datetime(value)
+        except ValueError:
+            parsed = None
+        if parsed is None:
+            raise serializers.ValidationError({param: "Expected an ISO-8601 date or datetime."})
+        if timezone.is_naive(parsed):
+            parsed = timezone.make_aware(parsed)
+        return parsed
+
+    if end:
+        day += datetime.timedelta(days=1)
+    return timezone.make_aware(datetime.datetime.combine(day, datetime.time.min))
+
+
+def parse_time_range(query_params):
+    """The (start, end) datetimes of ?from= / ?to=, either of them None when absent."""
+    return (parse_time_bound(query_params.get('from'), 'from'),
+            parse_time_bound(query_params.get('to'), 'to', end=True))
+
+
+class TimeRangeFilter(BaseFilterBackend):
+    """
+    Restrict a list to the half-open window [from, to) on the view's
+    `time_range_field`. Combined with the per-user composite indexes this is an
+    index range scan rather than a scan over all of the user's rows.
+    """
+    def filter_queryset(self, request, queryset, view):
+        field = getattr(view, 'time_range_field', None)
+        if not field:
+            return queryset
+
+        start, end = parse_time_range(request.query_params)
+        if start is not None:
+            queryset = queryset.filter(**{f'{field}__gte': start})
+        if end is not None:
+            queryset = queryset.filter(**{f'{field}__lt': end})
+        return queryset
@@ -0,0 +1,85 @@
+# backend/api/hashing.py
+
+"""
+Password hashing with admission control.
+
+PBKDF2 takes hundreds of milliseconds of CPU by design. During a burst of
+sign-ins, every worker can end up hashing while the cheap data endpoints
+wait behind them. So at most settings.PASSWORD_HASHING_MAX_CONCURRENT
+sign-ins hash at once, across all worker processes. Each admitted sign-in
+holds a slot, which is a lock on one of that many files in
+settings.PASSWORD_HASHING_LOCK_DIR. When no slot is free, the request is
+rejected straight away with 429 and Retry-After instead of queueing up.
+The OS releases a slot if its process dies.
+
+The admission limit is the whole mechanism: the hash runs on the request
+thread, which is blocked until it is done either way. Code on the ASGI
+path that must not block the event loop should call these functions
+through sync_to_async.
+"""
+
+import fcntl
+import os
+import tempfile
+
+from django.conf import settings
+from django.contrib.auth.hashers import check_password, make_password
+from rest_framework.exceptions import Throttled
+
+
+class HashingBusy(Throttled):
+    default_detail = 'Too many sign-ins are being processed. Please retry shortly.'
+    default_code = 'hashing_busy'
+
+
+def _default_directory():
+    base = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+    return os.path.join(base, 'health-tracker-hashing')
+
+
+class PasswordHashingPool:
+    """Runs password hashing behind a cross-process admission limit."""
+
+    def _acquire_slot(self):
+        """An open, locked slot file, or None if every slot is taken."""
+        directory = getattr(settings, 'PASSWORD_HASHING_LOCK_DIR', None) or _default_directory()
+        os.makedirs(directory, exist_ok=True)
+        for i in range(max(1, getattr(settings, 'PASSWORD_HASHING_MAX_CONCURRENT', 4))):
+            fd = os.open(os.path.join(directory, f'slot-{i}.lock'), os.O_RDWR | os.O_CREAT, 0o600)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB) # Per open file: threads don't share slots
+                return fd
+            except BlockingIOError:
+                os.close(fd)
+        return None
+
+    def run(self, fn, *args):
+        """Call fn(*args) while holding a slot and return its result; raise HashingBusy if no slot is free."""
+        slot = self._acquire_slot()
+        if slot is None:
+            raise HashingBusy(wait=getattr(settings, 'PASSWORD_HASHING_RETRY_AFTER', 1))
+        try:
+            return fn(*args)
+        finally:
+            os.close(slot) # Releases the lock
+
+
+hashing_pool = PasswordHashingPool()
+
+
+def hash_password(raw_password):
+    """make_password() behind the admission limit."""
+    return hashing_pool.run(make_password, raw_password)
+
+
+def verify_password(user, raw_password):
+    """
+    user.check_password() with the hash check behind the admission limit. A hash
+    made with outdated hasher settings is upgraded and saved, as Django does.
+    """
+    outdated = []
+    valid = hashing_pool.run(check_password, raw_password, user.password, outdated.append)
+    if valid and outdated:
+        user.password = hash_password(raw_password)
+        user.save(update_fields=['password'])
+    return valid
@@ -0,0 +1,208 @@
+# backend/api/importers.py
+
+"""
+Batched CSV import of health metrics and meals (e.g. exports from other trackers).
+
+The file is parsed as a stream and each row is validated with the field rules
+of the matching serializer. Valid rows are inserted in fixed-size `bulk_create`
+batches, one transaction per batch, together with the job's progress counter
+and the affected daily rollups. Memory is bounded by the batch size, and an
+interrupted import of the same file resumes after the last committed batch.
+
+Rows whose (user, timestamp) already exists, in the database or earlier in the
+same batch, are skipped as duplicates.
+"""
+
+import csv
+import hashlib
+import io
+import itertools
+
+from django.db import transaction
+from rest_framework import serializers
+
+from .archive import archived_timestamps
+from .models import HealthMetric, ImportJob, Meal
+from .rollups import refresh_rollups
+from .serializers import HealthMetricSerializer, MealSerializer
+from .versions import data_changed
+
+IMPORT_RESOURCES = {
+    'metrics': (HealthMetric, HealthMetricSerializer),
+    'meals': (Meal, MealSerializer),
+}
+
+# Header spellings seen in other apps' exports -> serializer field names
+COLUMN_ALIASES = {
+    'date': 'timestamp', 'datetime': 'timestamp', 'time': 'timestamp', 'start': 'timestamp',
+    'start_date': 'timestamp', 'recorded_at': 'timestamp',
+    'step_count': 'steps', 'stepcount': 'steps',
+    'hr': 'heart_rate', 'heartrate': 'heart_rate', 'bpm': 'heart_rate', 'heart_rate_bpm': 'heart_rate',
+    'weight_kg': 'weight', 'body_weight': 'weight', 'bodyweight': 'weight',
+    'meal': 'name', 'food': 'name', 'description': 'name',
+    'kcal': 'calories', 'energy_kcal': 'calories', 'energy': 'calories',
+}
+
+DEFAULT_BATCH_SIZE = 5000
+MAX_STORED_ERRORS = 100
+_IN_CHUNK = 500
+
+
+class ImportFormatError(Exception):
+    """The file can't be imported at all (bad header, unknown resource...)."""
+
+
+def _checked_rows(reader):
+    """The rows of a csv.reader; text that isn't UTF-8 or isn't CSV raises ImportFormatError."""
+    try:
+        yield from reader
+    except UnicodeDecodeError:
+        # Text is decoded ahead of the parser, so the bad byte may be a few lines further on
+        raise ImportFormatError(f"The file isn't UTF-8 text (an undecodable byte at or after line "
+                                f"{reader.line_num + 1}). Save it as UTF-8 CSV and import it again.")
+    except csv.Error as e:
+        raise ImportFormatError(f"Line {reader.line_num}: the file isn't valid CSV ({e}).")
+
+
+def file_digest(fileobj):
+    """SHA-256 of a binary file object, read in blocks; rewinds it afterwards."""
+    digest = hashlib.sha256()
+    for block in iter(lambda: fileobj.read(1024 * 1024), b''):
+        digest.update(block)
+    fileobj.seek(0)
+    return digest.hexdigest()
+
+
+def import_result(job):
+    """The API representation of an ImportJob's outcome."""
+    return {
+        'id': job.id,
+        'status': job.status,
+        'rows_processed': job.rows_processed,
+        'rows_imported': job.rows_imported,
+        'rows_duplicate': job.rows_duplicate,
+        'rows_invalid': job.rows_invalid,
+        'errors': job.errors,
+    }
+
+
+def _canonical(column):
+    name = column.strip().lower().replace(' ', '_').replace('-', '_')
+    return COLUMN_ALIASES.get(name, name)
+
+
+class HealthDataImporter:
+    """
+    Imports one CSV file of `resource` rows for `user`. Call `run()` with a binary
+    file object; it returns the ImportJob with final counts.
+    """
+
+    def __init__(self, user, resource, batch_size=DEFAULT_BATCH_SIZE, progress=None):
+        if resource not in IMPORT_RESOURCES:
+            raise ImportFormatError(f"Unknown resource '{resource}'. Expected one of: {', '.join(IMPORT_RESOURCES)}.")
+        self.user = user
+        self.resource = resource
+        self.model, serializer_class = IMPORT_RESOURCES[resource]
+        self.fields = {name: field for name, field in serializer_class().fields.items() if not field.read_only}
+        self.batch_size = max(1, batch_size)
+        self.progress = progress # Optional callable(job) after each committed batch
+
+    def run(self, fileobj, filename=''):
+        job, _ = ImportJob.objects.get_or_create(
+            user=self.user, resource=self.resource, source_sha256=file_digest(fileobj),
+            defaults={'filename': filename[:255]},
+        )
+        if job.status == ImportJob.STATUS_COMPLETED:
+            return job # Same file imported before: nothing to do
+
+        job.status = ImportJob.STATUS_RUNNING
+        job.save(update_fields=['status', 'updated_at'])
+        try:
+            self._import(job, fileobj)
+        except Exception as e:
+            job.status = ImportJob.STATUS_FAILED
+            job.errors = (job.errors + [{'line': None, 'errors': str(e)}])[-MAX_STORED_ERRORS:]
+            job.save(update_fields=['status', 'errors', 'updated_at'])
+            raise
+        job.status = ImportJob.STATUS_COMPLETED
+        job.save(update_fields=['status', 'updated_at'])
+        return job
+
+    def _import(self, job, fileobj):
+        reader = _checked_rows(csv.reader(io.TextIOWrapper(fileobj, encoding='utf-8-sig', newline='')))
+        header = next(reader, None)
+        if not header:
+            raise ImportFormatError("The file is empty.")
+        self.columns = [name if name in self.fields else None for name in map(_canonical, header)]
+        if 'timestamp' not in self.columns:
+            raise ImportFormatError("The file needs a timestamp (or date) column.")
+        missing = [name for name, field in self.fields.items() if field.required and name not in self.columns]
+        if missing:
+            raise ImportFormatError(f"Missing required column(s): {', '.join(missing)}.")
+
+        # Resume: skip the rows committed by an earlier, interrupted run
+        rows = itertools.islice(reader, job.rows_processed, None)
+        line = job.rows_processed + 1 # 1-based data row number (header excluded)
+        while True:
+            batch = list(itertools.islice(rows, self.batch_size))
+            if not batch:
+                break
+            self._import_batch(job, batch, line)
+            line += len(batch)
+            if self.progress:
+                self.progress(job)
+
+    def _validate(self, values):
+        data, errors = {}, {}
+        for index, name in enumerate(self.columns):
+            if name is None:
+                continue
+            raw = values[index].strip() if index < len(values) else ''
+            if raw == '':
+                if name == 'timestamp' or self.fields[name].required:
+                    errors[name] = ["This field is required."]
+                continue
+            try:
+                data[name] = self.fields[name].run_validation(raw)
+            except serializers.ValidationError as e:
+                errors[name] = e.detail
+        return data, errors
+
+    def _import_batch(self, job, batch, first_line):
+        valid, invalid = [], []
+        for offset, values in enumerate(batch):
+            data, errors = self._validate(values)
+            if errors:
+                invalid.append({'line': first_line + offset, 'errors': errors})
+            else:
+                valid.append(data)
+
+        # Duplicate detection on (user, timestamp): against the table (and archive), then within the batch
+        timestamps = list({data['timestamp'] for data in valid})
+        existing = set()
+        for i in range(0, len(timestamps), _IN_CHUNK):
+            existing.update(self.model.objects.filter(user=self.user, timestamp__in=timestamps[i:i + _IN_CHUNK])
+                            .values_list('timestamp', flat=True))
+        if self.model is HealthMetric:
+            existing.update(archived_timestamps(self.user.id, timestamps))
+        instances = []
+        for data in valid:
+            if data['timestamp'] in existing:
+                continue
+            existing.add(data['timestamp'])
+            instances.append(self.model(user=self.user, **data))
+
+        with transaction.atomic():
+            created = self.model.objects.bulk_create(instances, batch_size=1000)
+            refresh_rollups(self.user.id, [obj.timestamp for obj in created])
+            job.rows_processed += len(batch)
+            job.rows_imported += len(created)
+            job.rows_duplicate += len(valid) - len(instances)
+            job.rows_invalid += len(invalid)
+            job.errors = (job.errors + invalid)[:MAX_STORED_ERRORS]
+            job.save(update_fields=['rows_processed', 'rows_imported', 'rows_duplicate',
+                                    'rows_invalid', 'errors', 'updated_at'])
+            if created:
+                # Same invalidation as writes through the viewsets: ETags, cached responses, live streams
+                data_changed(self.user.id, self.model._meta.model_name, 'created',
+                             [obj.pk for obj in created if obj.pk is not None])
@@ -0,0 +1,328 @@
+# backend/api/live.py
+
+"""
+Live change events for open clients: GET /api/stream/, as Server-Sent Events.
+
+Every create, update, delete or batch insert made through a
+BaseUserOwnedViewSet publishes one small event after its transaction commits:
+
+    event: change
+    data: {"resource":"meals","action":"created","ids":[42]}
+
+`resource` is a key of the sync response (metrics, meals, goals). `ids` is
+null when a batch touched more than MAX_EVENT_IDS rows. Clients refetch what
+they show or run a delta sync (api/sync.py). A stream opens with a `ready`
+event; fetch after it, and no change can fall between the fetch and the stream.
+
+Fan-out has two steps. `hub` holds the open streams of this process, by user.
+publish_change() hands each event to the backend named by
+settings.LIVE_EVENTS_BACKEND, which calls hub.deliver() in every process that
+may hold one of the user's streams:
+
+- LocalBackend delivers in this process only. It suits a single ASGI worker
+  and the tests.
+- PostgresBackend uses NOTIFY/LISTEN on the application database. Each
+  process runs one listener thread.
+
+Each stream reads from a queue bounded by settings.LIVE_EVENTS_QUEUE_SIZE. A
+stalled socket stops the server from pulling more output, so a slow consumer
+would otherwise buffer without limit. When its queue is full, the backlog is
+dropped and replaced with a single `resync` event, and the client refetches
+everything. Idle streams get a comment line every LIVE_EVENTS_HEARTBEAT
+seconds, so proxies keep them open and dead peers are noticed. A stream is
+closed after LIVE_EVENTS_MAX_SECONDS, and the client reconnects, which also
+checks its credentials again. An open stream costs one queue and no thread.
+
+EventSource can't send an Authorization header, so browsers open the stream
+with ?ticket=: a single-use ticket from POST /api/stream/ticket/ that expires
+after settings.LIVE_EVENTS_TICKET_SECONDS. Other clients can authenticate the
+stream request itself, as with any other endpoint.
+"""
+
+import asyncio
+import datetime
+import json
+import logging
+import secrets
+import select
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection, connections, transaction
+from django.http import HttpResponseNotAllowed, JsonResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from rest_framework import exceptions
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from .async_views import aauthenticate
+from .models import StreamTicket
+from .sync import SYNC_RESOURCES
+
+logger = logging.getLogger(__name__)
+
+# Model name -> resource key in events
+RESOURCE_KEYS = {model._meta.model_name: key for key, (model, _) in SYNC_RESOURCES.items()}
+MAX_EVENT_IDS = 100 # Larger batches are announced without their ids
+RETRY_MS = 3000 # EventSource reconnect delay
+
+RESYNC = object() # Queued in place of the events a slow stream could not take
+
+
+def change_event(resource, action, ids=()):
+    ids = list(ids)
+    return {'resource': RESOURCE_KEYS.get(resource, resource), 'action': action,
+            'ids': ids if len(ids) <= MAX_EVENT_IDS else None}
+
+
+def publish_change(user_id, resource, action, ids=()):
+    """Send a change event to the user's open streams once the current transaction commits."""
+    event = change_event(resource, action, ids)
+    # robust: a lost live event is logged, never turned into a failed write
+    transaction.on_commit(lambda: get_backend().publish(user_id, event), robust=True)
+
+
+class Subscription:
+    """One open stream: a bounded queue filled from any thread, read on the stream's event loop."""
+
+    def __init__(self, hub, user_id, maxsize):
+        self.hub = hub
+        self.user_id = user_id
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize)
+        self.overflowed = False
+        self.dropped = 0
+
+    def offer(self, event):
+        """Queue `event`; runs on self.loop. A full queue is replaced by RESYNC."""
+        if self.overflowed:
+            self.dropped += 1
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.dropped += self.queue.qsize() + 1
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(RESYNC)
+            self.overflowed = True
+            logger.info("Live stream of user %s fell behind; asking it to resync", self.user_id)
+
+    async def get(self, timeout):
+        """The next event (or RESYNC), or None after `timeout` seconds without one."""
+        try:
+            async with asyncio.timeout(timeout): # No task per wait, unlike wait_for()
+                event = await self.queue.get()
+        except TimeoutError:
+            return None
+        if event is RESYNC:
+            self.overflowed = False
+        return event
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.hub.unsubscribe(self)
+
+
+class EventHub:
+    """The open streams of this process, by user id. Thread-safe."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions = {}
+
+    def subscribe(self, user_id, maxsize=None):
+        """Register a stream for `user_id`. Call on the stream's event loop; use as a context manager."""
+        get_backend().start()
+        subscription = Subscription(self, user_id, maxsize or getattr(settings, 'LIVE_EVENTS_QUEUE_SIZE', 100))
+        with self._lock:
+            self._subscriptions.setdefault(user_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.user_id, set())
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                self._subscriptions.pop(subscription.user_id, None)
+
+    def stream_count(self, user_id=None):
+        with self._lock:
+            if user_id is not None:
+                return len(self._subscriptions.get(user_id, ()))
+            return sum(len(subscriptions) for subscriptions in self._subscriptions.values())
+
+    def deliver(self, user_id, event):
+        """Hand `event` to every stream of `user_id` in this process. Callable from any thread."""
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(user_id, ()))
+        for subscription in subscriptions:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.offer, event)
+            except RuntimeError: # Its event loop has closed; the stream is on its way out
+                pass
+
+
+hub = EventHub()
+
+
+# --- Cross-process backends ---
+
+class LocalBackend:
+    """Delivers to the streams of this process only."""
+
+    def __init__(self, hub):
+        self.hub = hub
+
+    def start(self):
+        pass
+
+    def publish(self, user_id, event):
+        self.hub.deliver(user_id, event)
+
+
+class PostgresBackend:
+    """
+    Events go out with NOTIFY on the 'default' database, which must be
+    PostgreSQL (psycopg2). Every process with open streams LISTENs on a
+    connection of its own, from a daemon thread started with its first stream.
+    Payloads stay well under PostgreSQL's 8000-byte limit (see MAX_EVENT_IDS).
+    """
+    channel = 'health_tracker_live'
+    reconnect_delay = 1 # Seconds
+
+    def __init__(self, hub):
+        self.hub = hub
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._listen, name='live-events-listener', daemon=True)
+                self._thread.start()
+
+    def publish(self, user_id, event):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_notify(%s, %s)',
+                           [self.channel, json.dumps([user_id, event], separators=(',', ':'))])
+
+    def _listen(self):
+        while True:
+            try:
+                self._listen_once()
+            except Exception:
+                logger.exception("Live events listener lost its database connection; reconnecting")
+            time.sleep(self.reconnect_delay)
+
+    def _listen_once(self):
+        wrapper = connections['default']
+        conn = wrapper.get_new_connection(wrapper.get_connection_params())
+        try:
+            conn.autocommit = True
+            with conn.cursor() as cursor:
+                cursor.execute(f'LISTEN {self.channel}')
+            while True:
+                if select.select([conn], [], [], 60) == ([], [], []):
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    user_id, event = json.loads(conn.notifies.pop(0).payload)
+                    self.hub.deliver(user_id, event)
+        finally:
+            conn.close()
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    """The backend of settings.LIVE_EVENTS_BACKEND, built once per process (and again if the setting changes)."""
+    global _backend
+    path = getattr(settings, 'LIVE_EVENTS_BACKEND', 'api.live.LocalBackend')
+    with _backend_lock:
+        if _backend is None or _backend[0] != path:
+            _backend = (path, import_string(path)(hub))
+        return _backend[1]
+
+
+# --- The stream ---
+
+def format_event(name, data):
+    return f'event: {name}\ndata: {json.dumps(data, separators=(",", ":"))}\n\n'
+
+
+async def event_stream(user_id):
+    """The text/event-stream body for one client of `user_id`."""
+    heartbeat = getattr(settings, 'LIVE_EVENTS_HEARTBEAT', 15)
+    deadline = time.monotonic() + getattr(settings, 'LIVE_EVENTS_MAX_SECONDS', 3600)
+    with hub.subscribe(user_id) as subscription:
+        yield f'retry: {RETRY_MS}\n' + format_event('ready', {})
+        while (remaining := deadline - time.monotonic()) > 0:
+            event = await subscription.get(min(heartbeat, remaining))
+            if event is None:
+                yield ': ping\n\n'
+            elif event is RESYNC:
+                yield format_event('resync', {})
+            else:
+                yield format_event('change', event)
+
+
+def issue_ticket(user):
+    """A new stream ticket for `user`. Expired tickets nobody redeemed are deleted on the way."""
+    now = timezone.now()
+    StreamTicket.objects.filter(expires_at__lte=now).delete()
+    ticket = StreamTicket.objects.create(
+        key=secrets.token_urlsafe(32), user=user,
+        expires_at=now + datetime.timedelta(seconds=getattr(settings, 'LIVE_EVENTS_TICKET_SECONDS', 30)))
+    return ticket.key
+
+
+async def redeem_ticket(key):
+    """The active user a live ticket was issued to, or None. The ticket is used up either way."""
+    ticket = await StreamTicket.objects.select_related('user').filter(pk=key).afirst()
+    if ticket is None:
+        return None
+    deleted, _ = await StreamTicket.objects.filter(pk=key).adelete()
+    if not deleted or ticket.expires_at <= timezone.now() or not ticket.user.is_active:
+        return None # Redeemed concurrently, expired or deactivated
+    return ticket.user
+
+
+async def _authenticate(request):
+    """The user of ?ticket= or, without one, of the API's authentication classes."""
+    key = request.GET.get('ticket')
+    if key:
+        user = await redeem_ticket(key)
+        if user is None:
+            raise exceptions.AuthenticationFailed('Invalid or expired stream ticket.')
+        return user
+    drf_request = Request(request, authenticators=[auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES])
+    await aauthenticate(drf_request)
+    return drf_request.user if drf_request.user.is_authenticated else None
+
+
+async def live_stream(request):
+    """GET /api/stream/: the user's change events until the client disconnects."""
+    if request.method != 'GET':
+        return HttpResponseNotAllowed(['GET'])
+    try:
+        user = await _authenticate(request)
+    except exceptions.AuthenticationFailed as e:
+        return JsonResponse({'detail': str(e.detail)}, status=401, headers={'WWW-Authenticate': 'Token'})
+    if user is None:
+        return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=401,
+                            headers={'WWW-Authenticate': 'Token'})
+    if hub.stream_count(user.pk) >= getattr(settings, 'LIVE_EVENTS_MAX_STREAMS_PER_USER', 10):
+        return JsonResponse({'detail': 'Too many open streams.'}, status=429,
+                            headers={'Retry-After': str(RETRY_MS // 1000)})
+
+    response = StreamingHttpResponse(event_stream(user.pk), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no' # nginx: pass events through unbuffered
+    return response
@@ -0,0 +1,107 @@
+"""Helpers shared by the bench_* management commands (ignored as a command: leading underscore)."""
+
+import asyncio
+import contextlib
+import math
+import os
+import socket
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import CommandError
+
+SERVERS = {
+    # Sync DRF views, one request at a time per gunicorn worker process
+    'wsgi': lambda port, workers: [
+        sys.executable, '-m', 'gunicorn', 'config.wsgi:application',
+        '--workers', str(workers), '--bind', f'127.0.0.1:{port}', '--backlog', '2048', '--log-level', 'warning',
+    ],
+    # Async read views (api/async_views.py), one event loop per uvicorn worker process
+    'asgi': lambda port, workers: [
+        sys.executable, '-m', 'uvicorn', 'config.asgi:application',
+        '--workers', str(workers), '--host', '127.0.0.1', '--port', str(port), '--backlog', '2048',
+        '--lifespan', 'off', '--no-access-log', '--log-level', 'warning',
+    ],
+}
+
+
+class QueryCounter:
+    """execute_wrapper that counts statements (query logging caps out at 9000)."""
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted, non-empty list."""
+    return sorted_values[max(0, math.ceil(fraction * len(sorted_values)) - 1)]
+
+
+class HTTPConnection:
+    """Minimal HTTP/1.1 client connection: keep-alive when the server allows it, reconnects otherwise."""
+
+    def __init__(self, port):
+        self.port = port
+        self.reader = self.writer = None
+
+    async def send(self, request):
+        """Send a raw request and read the response; returns the status code."""
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection('127.0.0.1', self.port)
+        self.writer.write(request)
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionError("Server closed the connection")
+        length, close = 0, False
+        while True:
+            line = await self.reader.readline()
+            if line in (b'\r\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            name = name.strip().lower()
+            if name == 'content-length':
+                length = int(value)
+            elif name == 'connection' and value.strip().lower() == 'close':
+                close = True
+        await self.reader.readexactly(length)
+        if close:
+            self.close()
+        return int(status_line.split()[1])
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.reader = self.writer = None
+
+
+@contextlib.contextmanager
+def run_server(name, workers, env=None):
+    """Start one of SERVERS on a free local port with `env` added; yields the port."""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    process = subprocess.Popen(SERVERS[name](port, workers), cwd=settings.BASE_DIR, env={**os.environ, **(env or {})})
+    try:
+        _wait_until_up(process, port)
+        yield port
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+
+
+def _wait_until_up(process, port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise CommandError(f"Server exited with status {process.returncode}")
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.5).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise CommandError(f"Server did not start listening on port {port}")
@@ -0,0 +1,67 @@
+import datetime
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+from django.utils import timezone
+
+from api.archive import DELETE_BATCH_SIZE, archivable_months, archive_month, month_bounds
+from api.models import HealthMetric
+from api.tasks import enqueue_for_users
+
+
+class Command(BaseCommand):
+    help = (
+        "Move old HealthMetric rows into compressed per-user monthly archive blocks (api/archive.py). "
+        "Archives every calendar month (UTC) that ended more than --older-than days ago, one transaction "
+        "per user and month, and deletes the archived rows in batches. Every read keeps returning archived "
+        "rows, and editing or deleting one by id moves it back into the table first. "
+        "Safe to re-run: rows added to an archived month since are merged into its block."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than', type=int, required=True, metavar='DAYS',
+                            help="Archive the months that ended at least this many days ago.")
+        parser.add_argument('--user', action='append', dest='users', default=[],
+                            help="Username to archive (repeatable). Defaults to all users.")
+        parser.add_argument('--batch-size', type=int, default=DELETE_BATCH_SIZE,
+                            help="Raw rows deleted per statement.")
+        parser.add_argument('--dry-run', action='store_true', help="Report what would be archived; change nothing.")
+        parser.add_argument('--enqueue', action='store_true',
+                            help="Queue one background task per user for `run_worker` instead of working here.")
+
+    def handle(self, *args, **options):
+        if options['older_than'] < 0:
+            raise CommandError("--older-than must be zero or more days.")
+        # Whole months only: the cutoff moves back to the start of its month (UTC)
+        cutoff = timezone.now().astimezone(datetime.timezone.utc) - datetime.timedelta(days=options['older_than'])
+        before, _ = month_bounds(cutoff.date())
+
+        if options['enqueue'] and not options['dry_run']:
+            tasks = enqueue_for_users('archive_metrics', options['users'], args={
+                'before': before.isoformat(), 'batch_size': max(options['batch_size'], 1)})
+            self.stdout.write(self.style.SUCCESS(
+                f"Queued {len(tasks)} archive tasks (before {before.date().isoformat()})."))
+            return
+
+        users = User.objects.order_by('id')
+        if options['users']:
+            users = users.filter(username__in=options['users'])
+
+        total_rows = total_months = 0
+        for user_id, username in users.values_list('id', 'username').iterator(chunk_size=500):
+            months = archivable_months(user_id, before)
+            if not months:
+                continue
+            if options['dry_run']:
+                rows = HealthMetric.objects.filter(user_id=user_id, timestamp__lt=before).aggregate(rows=Count('id'))['rows']
+            else:
+                rows = sum(archive_month(user_id, month, max(options['batch_size'], 1)) for month in months)
+            total_rows += rows
+            total_months += len(months)
+            self.stdout.write(f"{username}: {rows} metrics in {len(months)} months")
+
+        verb = "Would archive" if options['dry_run'] else "Archived"
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {total_rows} metrics in {total_months} user-months (before {before.date().isoformat()})."
+        ))
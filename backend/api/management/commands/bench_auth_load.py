@@ -0,0 +1,129 @@
+import asyncio
+import io
+import json
+import tempfile
+import time
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+
+from ._bench import HTTPConnection, percentile, run_server
+
+PREFIX = 'bench-auth'
+PASSWORD = 'bench-auth-password'
+# Throttles off in every scenario: all clients share one IP, and the point is the hashing limit
+NO_THROTTLES = {'AUTH_THROTTLE_IP_RATE': '', 'AUTH_THROTTLE_USERNAME_RATE': ''}
+
+
+class Command(BaseCommand):
+    help = (
+        "Mixed-workload benchmark: clients reading a data endpoint while other clients log in as fast as "
+        "they can, against gunicorn (config/wsgi.py) on a local port. Compares a data-only baseline, "
+        "unbounded password hashing and the bounded hashing pool (PASSWORD_HASHING_MAX_CONCURRENT), and "
+        "reports data latency and throughput next to login outcomes. Seeds throwaway users with "
+        "seed_load_data and deletes them afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help="gunicorn worker processes.")
+        parser.add_argument('--data-clients', type=int, default=20)
+        parser.add_argument('--login-clients', type=int, default=20)
+        parser.add_argument('--max-concurrent', type=int, default=1,
+                            help="PASSWORD_HASHING_MAX_CONCURRENT in the bounded scenario.")
+        parser.add_argument('--duration', type=float, default=10.0, help="Seconds of load per scenario.")
+        parser.add_argument('--warmup', type=float, default=2.0, help="Seconds of load before measuring.")
+        parser.add_argument('--users', type=int, default=20)
+        parser.add_argument('--path', default='/api/metrics/?page_size=50', help="Data endpoint to read.")
+
+    def handle(self, *args, **options):
+        call_command('seed_load_data', users=options['users'], metrics_per_user=200, meals_per_user=20,
+                     goals_per_user=2, prefix=PREFIX, password=PASSWORD, clear=True, stdout=io.StringIO())
+        try:
+            users = list(User.objects.filter(username__startswith=f'{PREFIX}-')
+                         .order_by('id').values_list('username', 'auth_token__key'))
+            data_requests = [
+                (f"GET {options['path']} HTTP/1.1\r\nHost: 127.0.0.1\r\nAccept: application/json\r\n"
+                 f"Authorization: Token {token}\r\n\r\n").encode()
+                for _, token in users
+            ]
+            login_requests = []
+            for username, _ in users:
+                body = json.dumps({'username': username, 'password': PASSWORD}).encode()
+                login_requests.append(
+                    (f"POST /api/login/ HTTP/1.1\r\nHost: 127.0.0.1\r\nContent-Type: application/json\r\n"
+                     f"Content-Length: {len(body)}\r\n\r\n").encode() + body)
+
+            scenarios = [
+                ('data only', 0, {'PASSWORD_HASHING_MAX_CONCURRENT': '1'}),
+                ('unbounded', options['login_clients'], {'PASSWORD_HASHING_MAX_CONCURRENT': '100000'}),
+                (f"bounded ({options['max_concurrent']})", options['login_clients'],
+                 {'PASSWORD_HASHING_MAX_CONCURRENT': str(options['max_concurrent'])}),
+            ]
+            results = []
+            for name, login_clients, env in scenarios:
+                with tempfile.TemporaryDirectory() as lock_dir:
+                    env = {**env, **NO_THROTTLES, 'DEBUG': 'False', 'RESPONSE_CACHE_ENABLED': 'False',
+                           'PASSWORD_HASHING_LOCK_DIR': lock_dir}
+                    with run_server('wsgi', options['workers'], env) as port:
+                        results.append((name, self.load(port, data_requests, login_requests, options['data_clients'],
+                                                        login_clients, options['duration'], options['warmup'])))
+        finally:
+            User.objects.filter(username__startswith=f'{PREFIX}-').delete()
+
+        duration = options['duration']
+        self.stdout.write(f"{options['data_clients']} data clients on {options['path']}, "
+                          f"{options['login_clients']} login clients, {options['workers']} workers, {duration:.0f}s")
+        self.stdout.write(f"{'scenario':<14} {'data req/s':>10} {'p50 ms':>8} {'p99 ms':>8} {'data err':>8} "
+                          f"{'logins/s':>9} {'429/s':>7} {'login p50':>10} {'login err':>9}")
+        for name, (data, logins) in results:
+            latencies = sorted(data['latencies'])
+            login_latencies = sorted(logins['latencies'])
+            self.stdout.write(
+                f"{name:<14} {len(latencies) / duration:>10.1f} "
+                f"{percentile(latencies, 0.5) * 1000 if latencies else 0:>8.1f} "
+                f"{percentile(latencies, 0.99) * 1000 if latencies else 0:>8.1f} {data['errors']:>8} "
+                f"{len(login_latencies) / duration:>9.1f} {logins['rejected'] / duration:>7.1f} "
+                f"{percentile(login_latencies, 0.5) * 1000 if login_latencies else 0:>10.1f} {logins['errors']:>9}"
+            )
+
+    def load(self, port, data_requests, login_requests, data_clients, login_clients, duration, warmup):
+        """Run both kinds of clients for `warmup + duration` seconds; count what completes inside the window."""
+        async def client(index, requests, stats, window):
+            connection = HTTPConnection(port)
+            i = index
+            try:
+                while True:
+                    started = time.monotonic()
+                    try:
+                        status = await connection.send(requests[i % len(requests)])
+                    except (OSError, ConnectionError, asyncio.IncompleteReadError):
+                        connection.close()
+                        status = None
+                    finished = time.monotonic()
+                    if window[0] <= finished <= window[1]:
+                        if status == 200:
+                            stats['latencies'].append(finished - started)
+                        elif status == 429:
+                            stats['rejected'] += 1
+                        else:
+                            stats['errors'] += 1
+                    if status == 429:
+                        await asyncio.sleep(0.05) # A well-behaved client backs off a little
+                    i += 1
+            finally:
+                connection.close()
+
+        async def run():
+            data = {'latencies': [], 'rejected': 0, 'errors': 0}
+            logins = {'latencies': [], 'rejected': 0, 'errors': 0}
+            window = (time.monotonic() + warmup, time.monotonic() + warmup + duration)
+            tasks = [asyncio.create_task(client(i, data_requests, data, window)) for i in range(data_clients)]
+            tasks += [asyncio.create_task(client(i, login_requests, logins, window)) for i in range(login_clients)]
+            await asyncio.sleep(warmup + duration)
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            return data, logins
+
+        return asyncio.run(run())
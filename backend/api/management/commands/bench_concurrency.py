@@ -0,0 +1,123 @@
+import asyncio
+import datetime
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from api.models import HealthMetric
+
+from ._bench import SERVERS, HTTPConnection, percentile, run_server
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the read endpoints under concurrent clients: the sync WSGI app (config/wsgi.py on "
+        "gunicorn) against the async ASGI app (config/asgi.py on uvicorn). Starts each server on a local "
+        "port against the configured database, with a throwaway user that is deleted afterwards, and "
+        "reports requests/s and latency percentiles per concurrency level."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', default='50,200,1000',
+                            help="Comma-separated numbers of concurrent clients.")
+        parser.add_argument('--duration', type=float, default=10.0, help="Seconds of load per level.")
+        parser.add_argument('--warmup', type=float, default=3.0,
+                            help="Seconds of load before measuring each level.")
+        parser.add_argument('--workers', type=int, default=2, help="Server worker processes (both servers).")
+        parser.add_argument('--path', action='append', dest='paths', default=[],
+                            help="Endpoint to request (repeatable; clients rotate through them). "
+                                 "Defaults to the metrics list, a metric detail and the dashboard.")
+        parser.add_argument('--server', action='append', dest='servers', choices=list(SERVERS), default=[],
+                            help="Only benchmark this server (repeatable).")
+        parser.add_argument('--rows', type=int, default=2000, help="HealthMetric rows for the benchmark user.")
+        parser.add_argument('--response-cache', action='store_true',
+                            help="Keep the response cache on (off by default, so every request runs the view). "
+                                 "With several workers it needs a shared CACHE_BACKEND; see settings.")
+
+    def handle(self, *args, **options):
+        try:
+            levels = [int(level) for level in options['concurrency'].split(',')]
+        except ValueError:
+            raise CommandError("--concurrency expects comma-separated integers, e.g. 50,200,1000.")
+
+        user = User.objects.create_user('bench-concurrency', 'bench-concurrency@example.com', 'unused-password')
+        try:
+            token = Token.objects.create(user=user)
+            start = timezone.now() - datetime.timedelta(minutes=options['rows'])
+            HealthMetric.objects.bulk_create([
+                HealthMetric(user=user, steps=i, heart_rate=60 + i % 40, timestamp=start + datetime.timedelta(minutes=i))
+                for i in range(options['rows'])
+            ], batch_size=1000)
+            paths = options['paths'] or [
+                '/api/metrics/?page_size=50',
+                f"/api/metrics/{HealthMetric.objects.filter(user=user).latest('timestamp').pk}/",
+                '/api/dashboard/',
+            ]
+            requests = [
+                (f'GET {path} HTTP/1.1\r\nHost: 127.0.0.1\r\nAccept: application/json\r\n'
+                 f'Authorization: Token {token.key}\r\n\r\n').encode()
+                for path in paths
+            ]
+
+            results = []
+            for server in options['servers'] or list(SERVERS):
+                env = {
+                    'DEBUG': 'False', # No per-query bookkeeping or debug logging in the workers
+                    'RESPONSE_CACHE_ENABLED': 'True' if options['response_cache'] else 'False',
+                }
+                with run_server(server, options['workers'], env) as port:
+                    for level in levels:
+                        results.append((server, level, self.load(port, requests, level, options['duration'], options['warmup'])))
+        finally:
+            user.delete() # Cascades to the benchmark rows and token
+
+        self.stdout.write(f"{'server':<6} {'clients':>7} {'requests':>9} {'req/s':>9} "
+                          f"{'p50 ms':>8} {'p99 ms':>8} {'errors':>7}")
+        for server, level, (count, rate, p50, p99, errors) in results:
+            self.stdout.write(f"{server:<6} {level:>7} {count:>9} {rate:>9.0f} {p50:>8.1f} {p99:>8.1f} {errors:>7}")
+
+    def load(self, port, requests, clients, duration, warmup):
+        """
+        Run `clients` concurrent request loops for `warmup + duration` seconds. Throughput
+        and latencies count the requests that complete inside the measured window.
+        """
+        async def client(index, latencies, errors, window):
+            connection = HTTPConnection(port)
+            i = index
+            try:
+                while True:
+                    started = time.monotonic()
+                    try:
+                        status = await connection.send(requests[i % len(requests)])
+                    except (OSError, ConnectionError, asyncio.IncompleteReadError):
+                        connection.close()
+                        status = None
+                    finished = time.monotonic()
+                    if window[0] <= finished <= window[1]:
+                        if status == 200:
+                            latencies.append(finished - started)
+                        else:
+                            errors.append(status)
+                    i += 1
+            finally:
+                connection.close()
+
+        async def run():
+            latencies, errors = [], []
+            window = (time.monotonic() + warmup, time.monotonic() + warmup + duration)
+            tasks = [asyncio.create_task(client(i, latencies, errors, window)) for i in range(clients)]
+            await asyncio.sleep(warmup + duration)
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            return latencies, errors
+
+        latencies, errors = asyncio.run(run())
+        if not latencies:
+            return 0, 0.0, 0.0, 0.0, len(errors)
+        latencies.sort()
+        return (len(latencies), len(latencies) / duration,
+                percentile(latencies, 0.5) * 1000, percentile(latencies, 0.99) * 1000, len(errors))
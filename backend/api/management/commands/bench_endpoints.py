@@ -0,0 +1,243 @@
+import datetime
+import io
+import json
+import logging
+import platform
+import subprocess
+import time
+
+import django
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from ._bench import QueryCounter, percentile
+
+PREFIX = 'bench-endpoints'
+PASSWORD = 'bench-endpoints-password'
+# Loggers silenced during the run: one line per request would dominate the timings
+QUIET_LOGGERS = ('api', 'django.request')
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark every API route (auth, user, dashboard, CRUD on metrics/meals/goals, batch, summary, "
+        "export, import) in-process against the configured database. Seeds a throwaway data set with "
+        "seed_load_data, then reports latency percentiles, queries per request and throughput per route. "
+        "--output writes the results as JSON; --compare diffs them against an earlier run."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10)
+        parser.add_argument('--metrics-per-user', type=int, default=2000)
+        parser.add_argument('--meals-per-user', type=int, default=300)
+        parser.add_argument('--goals-per-user', type=int, default=10)
+        parser.add_argument('--days', type=int, default=90)
+        parser.add_argument('--requests', type=int, default=100, help="Requests per route.")
+        parser.add_argument('--auth-requests', type=int, default=5,
+                            help="Requests for register/login/import, which hash passwords or write files.")
+        parser.add_argument('--response-cache', action='store_true',
+                            help="Keep the response cache on (off by default, so every request runs the view).")
+        parser.add_argument('--output', help="Write the results to this JSON file.")
+        parser.add_argument('--compare', help="JSON results of an earlier run to diff against.")
+        parser.add_argument('--max-regression', type=float, default=None,
+                            help="With --compare: fail if a route's p99 grows by more than this percentage "
+                                 "or it runs more queries per request.")
+        parser.add_argument('--keep-data', action='store_true', help="Keep the seeded users afterwards.")
+
+    def handle(self, *args, **options):
+        if options['max_regression'] is not None and not options['compare']:
+            raise CommandError("--max-regression needs --compare.")
+
+        call_command('seed_load_data', users=options['users'], metrics_per_user=options['metrics_per_user'],
+                     meals_per_user=options['meals_per_user'], goals_per_user=options['goals_per_user'],
+                     days=options['days'], prefix=PREFIX, password=PASSWORD, clear=True, stdout=io.StringIO())
+        levels = {name: logging.getLogger(name).level for name in QUIET_LOGGERS}
+        try:
+            for name in QUIET_LOGGERS:
+                logging.getLogger(name).setLevel(logging.ERROR)
+            no_throttles = {**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': {}} # Every request comes from one IP
+            with override_settings(RESPONSE_CACHE_ENABLED=options['response_cache'], REST_FRAMEWORK=no_throttles):
+                routes = self.run(options)
+        finally:
+            for name, level in levels.items():
+                logging.getLogger(name).setLevel(level)
+            if not options['keep_data']:
+                User.objects.filter(username__startswith=f'{PREFIX}-').delete()
+
+        report = {'meta': self.meta(options), 'routes': routes}
+        self.print_table(routes)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2, sort_keys=True)
+                f.write('\n')
+            self.stdout.write(f"Results written to {options['output']}")
+        if options['compare']:
+            self.compare(report, options['compare'], options['max_regression'])
+
+    # --- Scenario ---
+
+    def run(self, options):
+        users = list(User.objects.filter(username__startswith=f'{PREFIX}-')
+                     .order_by('id').values_list('username', 'auth_token__key'))
+        if not users:
+            raise CommandError("Seeding created no users; pass --users 1 or more.")
+        self.client = APIClient(SERVER_NAME='localhost') # An ALLOWED_HOSTS default
+        self.samples = {}
+        n, auth_n = max(1, options['requests']), max(1, options['auth_requests'])
+        token = lambda i: users[i % len(users)][1]
+        now = timezone.now()
+
+        for i in range(auth_n):
+            self.measure('auth.register', 'post', '/api/register/', data={
+                'username': f'{PREFIX}-reg-{i}', 'email': f'{PREFIX}-reg-{i}@example.com',
+                'password': PASSWORD, 'password2': PASSWORD,
+            })
+            self.measure('auth.login', 'post', '/api/login/',
+                         data={'username': users[i % len(users)][0], 'password': PASSWORD})
+        for i in range(n):
+            self.measure('user', 'get', '/api/user/', token(i))
+            self.measure('dashboard', 'get', '/api/dashboard/', token(i))
+
+        week_ago = (now - datetime.timedelta(days=7)).date().isoformat()
+        resources = {
+            'metrics': lambda i: {'steps': 100 + i, 'heart_rate': 70, 'timestamp': (now - datetime.timedelta(seconds=i)).isoformat()},
+            'meals': lambda i: {'name': 'Bench meal', 'calories': 400 + i, 'timestamp': (now - datetime.timedelta(seconds=i)).isoformat()},
+            'goals': lambda i: {'goal_text': f'Bench goal {i}'},
+        }
+        updates = {'metrics': {'steps': 1}, 'meals': {'calories': 1}, 'goals': {'completed': True}}
+        for resource, item in resources.items():
+            ids = {}
+            for i in range(n):
+                self.measure(f'{resource}.list', 'get', f'/api/{resource}/', token(i))
+                if resource != 'goals':
+                    self.measure(f'{resource}.list_last_week', 'get', f'/api/{resource}/?from={week_ago}', token(i))
+            for i in range(n):
+                response = self.measure(f'{resource}.create', 'post', f'/api/{resource}/', token(i), item(i))
+                ids[i] = response.data.get('id') if response.status_code == 201 else None
+            for i in range(n):
+                self.measure(f'{resource}.retrieve', 'get', f'/api/{resource}/{ids[i]}/', token(i))
+            for i in range(n):
+                self.measure(f'{resource}.update', 'patch', f'/api/{resource}/{ids[i]}/', token(i), updates[resource])
+            for i in range(n):
+                self.measure(f'{resource}.delete', 'delete', f'/api/{resource}/{ids[i]}/', token(i))
+
+        for i in range(n):
+            self.measure('metrics.summary', 'get', '/api/metrics/summary/?bucket=week', token(i))
+        for i in range(max(1, n // 10)):
+            start = now - datetime.timedelta(days=400 + i)
+            batch = [{'steps': j, 'timestamp': (start + datetime.timedelta(seconds=j)).isoformat()} for j in range(100)]
+            self.measure('metrics.batch', 'post', '/api/metrics/batch/', token(i), batch)
+            self.measure('export.ndjson', 'get', '/api/export/?resource=metrics&format=ndjson', token(i))
+        for i in range(auth_n):
+            start = now - datetime.timedelta(days=800 + i)
+            upload = io.BytesIO(('timestamp,name,calories\n' + ''.join(
+                f'{(start + datetime.timedelta(minutes=j)).isoformat()},Imported meal,{300 + j}\n' for j in range(200)
+            )).encode())
+            upload.name = f'bench-{i}.csv'
+            self.measure('import.csv', 'post', '/api/import/?resource=meals', token(i), {'file': upload},
+                         format='multipart')
+
+        return {name: self.summarize(samples) for name, samples in self.samples.items()}
+
+    def measure(self, name, method, path, token=None, data=None, format='json'):
+        if token:
+            self.client.credentials(HTTP_AUTHORIZATION=f'Token {token}')
+        else:
+            self.client.credentials()
+        counter = QueryCounter()
+        with connection.execute_wrapper(counter):
+            started = time.perf_counter()
+            response = getattr(self.client, method)(path, data, format=format)
+            if response.streaming:
+                for _ in response.streaming_content:
+                    pass
+            elapsed = time.perf_counter() - started
+        samples = self.samples.setdefault(name, {'method': method.upper(), 'path': path.split('?')[0],
+                                                 'latencies': [], 'queries': [], 'errors': 0})
+        samples['latencies'].append(elapsed)
+        samples['queries'].append(counter.count)
+        if response.status_code >= 400:
+            samples['errors'] += 1
+        return response
+
+    def summarize(self, samples):
+        latencies = sorted(samples['latencies'])
+        queries = samples['queries']
+        return {
+            'method': samples['method'],
+            'path': samples['path'],
+            'requests': len(latencies),
+            'errors': samples['errors'],
+            'mean_ms': round(sum(latencies) / len(latencies) * 1000, 3),
+            'p50_ms': round(percentile(latencies, 0.50) * 1000, 3),
+            'p90_ms': round(percentile(latencies, 0.90) * 1000, 3),
+            'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+            'max_ms': round(latencies[-1] * 1000, 3),
+            'throughput_rps': round(len(latencies) / sum(latencies), 1),
+            'queries_mean': round(sum(queries) / len(queries), 2),
+            'queries_max': max(queries),
+        }
+
+    # --- Reporting ---
+
+    def meta(self, options):
+        try:
+            commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=settings.BASE_DIR, capture_output=True,
+                                    text=True, timeout=10).stdout.strip() or None
+        except (OSError, subprocess.SubprocessError):
+            commit = None
+        return {
+            'commit': commit,
+            'created_at': timezone.now().isoformat(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'data': {name: options[name] for name in
+                     ('users', 'metrics_per_user', 'meals_per_user', 'goals_per_user', 'days')},
+            'requests': options['requests'],
+            'auth_requests': options['auth_requests'],
+            'response_cache': options['response_cache'],
+        }
+
+    def print_table(self, routes):
+        self.stdout.write(f"{'route':<24} {'reqs':>5} {'err':>4} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} "
+                          f"{'req/s':>8} {'queries':>8}")
+        for name, r in routes.items():
+            self.stdout.write(f"{name:<24} {r['requests']:>5} {r['errors']:>4} {r['p50_ms']:>8.2f} {r['p90_ms']:>8.2f} "
+                              f"{r['p99_ms']:>8.2f} {r['throughput_rps']:>8.0f} {r['queries_mean']:>8.2f}")
+
+    def compare(self, report, path, max_regression):
+        try:
+            with open(path) as f:
+                baseline = json.load(f)
+        except (OSError, ValueError) as e:
+            raise CommandError(f"Can't read baseline results from {path}: {e}")
+        if baseline.get('meta', {}).get('data') != report['meta']['data']:
+            self.stderr.write("Warning: the baseline was measured on a different data set size.")
+
+        self.stdout.write(f"\nAgainst {path} (commit {baseline.get('meta', {}).get('commit')}):")
+        self.stdout.write(f"{'route':<24} {'p50':>9} {'p99':>9} {'queries':>9}")
+        regressions = []
+        for name, current in report['routes'].items():
+            before = baseline.get('routes', {}).get(name)
+            if before is None:
+                self.stdout.write(f"{name:<24} {'new':>9}")
+                continue
+            p50 = _change(before['p50_ms'], current['p50_ms'])
+            p99 = _change(before['p99_ms'], current['p99_ms'])
+            queries = current['queries_mean'] - before['queries_mean']
+            self.stdout.write(f"{name:<24} {p50:>+8.1f}% {p99:>+8.1f}% {queries:>+9.2f}")
+            if max_regression is not None and (p99 > max_regression or queries > 0.5):
+                regressions.append(name)
+        if regressions:
+            raise CommandError(f"Regressions beyond the allowed margin: {', '.join(regressions)}")
+
+
+def _change(before, after):
+    return (after - before) / before * 100 if before else 0.0
@@ -0,0 +1,69 @@
+import datetime
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark HealthMetric ingest: one POST per sample vs POST /api/metrics/batch/. "
+        "Runs against the configured database with a throwaway user that is deleted afterwards, "
+        "so every single POST commits on its own exactly as it does in production."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--single', type=int, default=300, help="Samples sent as individual POSTs.")
+        parser.add_argument('--batched', type=int, default=20000, help="Samples sent through the batch endpoint.")
+        parser.add_argument('--batch-size', type=int, default=5000, help="Items per batch request.")
+        parser.add_argument('--min-speedup', type=float, default=None,
+                            help="Exit with an error if batch throughput is below this multiple of single POSTs.")
+
+    def handle(self, *args, **options):
+        user = User.objects.create_user('bench-ingest', 'bench-ingest@example.com', 'unused-password')
+        try:
+            single_rate, batch_rate = self.run(user, options)
+        finally:
+            user.delete()  # Cascades to the benchmark rows and token
+
+        speedup = batch_rate / single_rate
+        self.stdout.write(f"single POST : {single_rate:10.0f} rows/s")
+        self.stdout.write(f"batch POST  : {batch_rate:10.0f} rows/s")
+        self.stdout.write(f"speedup     : {speedup:10.1f}x")
+        if options['min_speedup'] and speedup < options['min_speedup']:
+            raise CommandError(f"Batch ingest is only {speedup:.1f}x faster (expected >= {options['min_speedup']}x)")
+
+    def run(self, user, options):
+        token = Token.objects.create(user=user)
+        client = APIClient(SERVER_NAME='localhost')  # An ALLOWED_HOSTS default
+        client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        start_ts = timezone.now() - datetime.timedelta(days=30)
+
+        def sample(i):
+            return {
+                'steps': 10 + i % 100,
+                'heart_rate': 60 + i % 40,
+                'timestamp': (start_ts + datetime.timedelta(seconds=i)).isoformat(),
+            }
+
+        started = time.perf_counter()
+        for i in range(options['single']):
+            response = client.post('/api/metrics/', sample(i), format='json')
+            if response.status_code != 201:
+                raise CommandError(f"POST /api/metrics/ answered {response.status_code}: {response.content!r}")
+        single_rate = options['single'] / (time.perf_counter() - started)
+
+        offset = options['single']
+        total, size = options['batched'], options['batch_size']
+        started = time.perf_counter()
+        for chunk_start in range(0, total, size):
+            items = [sample(offset + i) for i in range(chunk_start, min(chunk_start + size, total))]
+            response = client.post('/api/metrics/batch/', items, format='json')
+            if response.status_code != 201 or response.data['errors']:
+                raise CommandError(f"POST /api/metrics/batch/ answered {response.status_code}: {response.content!r}")
+        batch_rate = total / (time.perf_counter() - started)
+
+        return single_rate, batch_rate
@@ -0,0 +1,78 @@
+import asyncio
+import threading
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+
+from api.live import event_stream, hub
+
+from ._bench import percentile
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure the cost of the live event streams (api/live.py) in one process, without a server: "
+        "memory per open stream, CPU used by idle streams (heartbeats only), and the delay from "
+        "publishing an event on another thread (as a write request does) to it being ready on each "
+        "stream of the user. Uses the in-process hub; no database access."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--streams', type=int, default=5000, help="Open streams, spread over the users.")
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--events', type=int, default=2000, help="Events published, to random users.")
+        parser.add_argument('--idle', type=float, default=5.0, help="Seconds of idle time to measure.")
+        parser.add_argument('--heartbeat', type=float, default=1.0, help="Heartbeat interval in seconds.")
+
+    def handle(self, *args, **options):
+        with override_settings(LIVE_EVENTS_HEARTBEAT=options['heartbeat'], LIVE_EVENTS_QUEUE_SIZE=1000,
+                               LIVE_EVENTS_MAX_SECONDS=3600):
+            asyncio.run(self.run(options))
+
+    async def run(self, options):
+        count, users = options['streams'], options['users']
+        latencies = []
+
+        async def client(user_id):
+            async for chunk in event_stream(user_id):
+                if chunk.startswith('event: change'):
+                    # The event carries its publish time in `ids`
+                    latencies.append(time.perf_counter() - float(chunk.split('"ids":[')[1].split(']')[0]))
+
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        tasks = [asyncio.create_task(client(i % users)) for i in range(count)]
+        while hub.stream_count() < count:
+            await asyncio.sleep(0.01)
+        per_stream = (tracemalloc.get_traced_memory()[0] - before) / count
+        tracemalloc.stop()
+
+        started, cpu = time.perf_counter(), time.process_time()
+        await asyncio.sleep(options['idle'])
+        idle_cpu = (time.process_time() - cpu) / (time.perf_counter() - started)
+
+        def publish():
+            for i in range(options['events']):
+                hub.deliver(i * 7919 % users, {'resource': 'metrics', 'action': 'created',
+                                              'ids': [time.perf_counter()]})
+                time.sleep(0.0005)
+
+        writer = threading.Thread(target=publish)
+        writer.start()
+        while writer.is_alive():
+            await asyncio.sleep(0.05)
+        await asyncio.sleep(0.2)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+        latencies.sort()
+        self.stdout.write(f"{count} streams for {users} users, heartbeat every {options['heartbeat']} s")
+        self.stdout.write(f"memory per stream   {per_stream / 1024:8.1f} KiB")
+        self.stdout.write(f"idle CPU            {idle_cpu * 100:8.1f} % of one core")
+        self.stdout.write(f"deliveries          {len(latencies):8d} (from {options['events']} events)")
+        if latencies:
+            self.stdout.write(f"delivery p50 / p99  {percentile(latencies, 0.5) * 1000:8.2f} / "
+                              f"{percentile(latencies, 0.99) * 1000:.2f} ms")
@@ -0,0 +1,115 @@
+import contextlib
+import datetime
+import logging
+import tempfile
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from api.models import HealthMetric
+from api.structured_logging import JsonFormatter, QueuedStreamHandler, SamplingFilter
+
+from ._bench import percentile
+
+# Loggers whose handlers are swapped for each mode
+LOGGERS = ('api', 'django')
+SIMPLE_FORMAT = '{levelname} {asctime} {module} {message}' # The 'simple' formatter in settings.LOGGING
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure what logging costs the request thread: the CPU time per log call with each handler setup, "
+        "and the latency and request-thread CPU time of a read endpoint. Modes: 'off' (api logger "
+        "above CRITICAL), 'info' (production level), 'text' (DEBUG, synchronous StreamHandler), "
+        "'json' (DEBUG, QueuedStreamHandler) and 'json-sampled' (as json, keeping 10% of api DEBUG/INFO "
+        "records). Log output goes to a temporary file."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=1000, help="Requests per mode and round.")
+        parser.add_argument('--rounds', type=int, default=3, help="Rounds; modes alternate within each round.")
+        parser.add_argument('--records', type=int, default=5000, help="Log calls per mode for the per-call timing.")
+        parser.add_argument('--path', default='/api/metrics/?page_size=50')
+        parser.add_argument('--rows', type=int, default=500, help="HealthMetric rows for the benchmark user.")
+
+    def handle(self, *args, **options):
+        modes = ['off', 'info', 'text', 'json', 'json-sampled']
+        self.stdout.write("Per log call, on the calling thread:")
+        for mode in modes[2:]:
+            with tempfile.TemporaryFile('w+') as stream, self.logging_mode(mode, stream):
+                logger = logging.getLogger('api.bench')
+                started = time.thread_time() # This thread only: not the queue listener's formatting and I/O
+                for i in range(options['records']):
+                    logger.debug("Filtering %s queryset for user: %s", 'HealthMetric', i)
+                elapsed = time.thread_time() - started
+                dropped = getattr(logging.getLogger('api').handlers[0], 'dropped', 0)
+            self.stdout.write(f"  {mode:<13} {elapsed / options['records'] * 1e6:>7.2f} us"
+                              f"{f' ({dropped} dropped: queue full)' if dropped else ''}")
+
+        user = User.objects.create_user('bench-logging', 'bench-logging@example.com', 'unused-password')
+        try:
+            token = Token.objects.create(user=user)
+            start = timezone.now() - datetime.timedelta(minutes=options['rows'])
+            HealthMetric.objects.bulk_create([
+                HealthMetric(user=user, steps=i, timestamp=start + datetime.timedelta(minutes=i))
+                for i in range(options['rows'])
+            ], batch_size=1000)
+            client = APIClient(SERVER_NAME='localhost')
+            client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+            latencies = {mode: [] for mode in modes}
+            cpu = dict.fromkeys(modes, 0.0)
+            with override_settings(RESPONSE_CACHE_ENABLED=False, REQUEST_TIMING_SAMPLE_RATE=0.0):
+                for _ in range(max(1, options['rounds'])):
+                    for mode in modes:
+                        with tempfile.TemporaryFile('w+') as stream, self.logging_mode(mode, stream):
+                            for _ in range(20): # Warm up
+                                client.get(options['path'])
+                            cpu_started = time.thread_time()
+                            for _ in range(options['requests']):
+                                started = time.perf_counter()
+                                client.get(options['path'])
+                                latencies[mode].append(time.perf_counter() - started)
+                            cpu[mode] += time.thread_time() - cpu_started
+        finally:
+            user.delete()
+
+        baseline = cpu['off'] / len(latencies['off'])
+        self.stdout.write(f"\nGET {options['path']}:")
+        self.stdout.write(f"  {'mode':<13} {'mean ms':>8} {'p50 ms':>8} {'p99 ms':>8} {'cpu ms':>8} {'cpu vs off us':>14}")
+        for mode, values in latencies.items():
+            values.sort()
+            request_cpu = cpu[mode] / len(values)
+            self.stdout.write(f"  {mode:<13} {sum(values) / len(values) * 1000:>8.3f} "
+                              f"{percentile(values, 0.5) * 1000:>8.3f} {percentile(values, 0.99) * 1000:>8.3f} "
+                              f"{request_cpu * 1000:>8.3f} {(request_cpu - baseline) * 1e6:>+14.1f}")
+
+    @contextlib.contextmanager
+    def logging_mode(self, mode, stream):
+        """Temporarily replace the handlers and levels of LOGGERS for one mode."""
+        if mode in ('json', 'json-sampled'):
+            handler = QueuedStreamHandler(stream)
+            handler.setFormatter(JsonFormatter())
+        else:
+            handler = logging.StreamHandler(stream)
+            handler.setFormatter(logging.Formatter(SIMPLE_FORMAT, style='{'))
+        if mode == 'json-sampled':
+            handler.addFilter(SamplingFilter({'api': 0.1}))
+        level = {'off': logging.CRITICAL + 1, 'info': logging.INFO}.get(mode, logging.DEBUG)
+
+        loggers = [logging.getLogger(name) for name in LOGGERS]
+        saved = [(logger.handlers[:], logger.level) for logger in loggers]
+        try:
+            for logger in loggers:
+                logger.handlers = [handler]
+                logger.setLevel(level if logger.name == 'api' else logging.WARNING)
+            yield
+        finally:
+            for logger, (handlers, level) in zip(loggers, saved):
+                logger.handlers = handlers
+                logger.setLevel(level)
+            handler.close()
@@ -0,0 +1,57 @@
+import datetime
+import gzip
+import json
+import time
+
+import msgpack
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from api.renderers import ColumnarJSONRenderer, MessagePackRenderer
+from api.serializers import HealthMetricSerializer, serialize_rows
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the list response formats on a page of HealthMetric rows: JSON, ?format=columnar and "
+        "MessagePack (Accept: application/msgpack). Reports bytes on the wire (plain and gzipped), "
+        "server render time and client decode time. Rows are generated in memory; no database access."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=100000)
+        parser.add_argument('--repeat', type=int, default=5, help="Timed runs per format; the best is reported.")
+
+    def handle(self, *args, **options):
+        count = options['rows']
+        start = timezone.now() - datetime.timedelta(minutes=count)
+        rows = [
+            {'id': i + 1, 'weight': '72.40' if i % 50 == 0 else None, 'steps': i % 2000,
+             'heart_rate': 55 + i % 60, 'timestamp': start + datetime.timedelta(minutes=i)}
+            for i in range(count)
+        ]
+        # The payload of a list page, as the list endpoints build it
+        data = {'next': None, 'previous': None,
+                'results': serialize_rows(HealthMetricSerializer(), rows, 'bench-renderers')}
+
+        formats = [
+            ('json', JSONRenderer(), json.loads),
+            ('columnar', ColumnarJSONRenderer(), json.loads),
+            ('msgpack', MessagePackRenderer(), msgpack.unpackb),
+        ]
+        self.stdout.write(f"{count} rows")
+        self.stdout.write(f"{'format':<10} {'bytes':>11} {'gzip bytes':>11} {'render ms':>10} {'decode ms':>10} "
+                          f"{'B/row':>7}")
+        for name, renderer, decode in formats:
+            render_time = decode_time = float('inf')
+            for _ in range(max(1, options['repeat'])):
+                started = time.perf_counter()
+                content = renderer.render(data, renderer.media_type, {})
+                render_time = min(render_time, time.perf_counter() - started)
+                started = time.perf_counter()
+                decode(content)
+                decode_time = min(decode_time, time.perf_counter() - started)
+            compressed = len(gzip.compress(content, compresslevel=6))
+            self.stdout.write(f"{name:<10} {len(content):>11} {compressed:>11} {render_time * 1000:>10.1f} "
+                              f"{decode_time * 1000:>10.1f} {len(content) / count:>7.1f}")
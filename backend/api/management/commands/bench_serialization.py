@@ -0,0 +1,71 @@
+import datetime
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from api.models import HealthMetric
+from api.serializers import HealthMetricSerializer, row_fields, serialize_rows
+
+from ._bench import QueryCounter
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark list serialization of HealthMetric rows: model instances through "
+        "HealthMetricSerializer(many=True) vs the values()-based fast path used by the "
+        "list endpoints. Checks both produce byte-identical JSON. Test rows are rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=100000, help="Number of metrics to serialize.")
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.run(options['rows'])
+                raise _Rollback()
+        except _Rollback:
+            pass
+
+    def run(self, count):
+        user = User.objects.create_user('bench-serialization', 'bench-serialization@example.com', 'unused')
+        start = timezone.now() - datetime.timedelta(minutes=count)
+        HealthMetric.objects.bulk_create([
+            HealthMetric(user=user, steps=i % 2000, heart_rate=55 + i % 60,
+                         weight='72.40' if i % 50 == 0 else None,
+                         timestamp=start + datetime.timedelta(minutes=i))
+            for i in range(count)
+        ], batch_size=2000)
+        queryset = HealthMetric.objects.filter(user=user).order_by('-timestamp', '-id')
+        renderer = JSONRenderer()
+
+        before_queries = QueryCounter()
+        with connection.execute_wrapper(before_queries):
+            started = time.perf_counter()
+            before = renderer.render(HealthMetricSerializer(queryset, many=True).data)
+            before_time = time.perf_counter() - started
+
+        serializer = HealthMetricSerializer()
+        after_queries = QueryCounter()
+        with connection.execute_wrapper(after_queries):
+            started = time.perf_counter()
+            after = renderer.render(serialize_rows(serializer, queryset.values(*row_fields(serializer)),
+                                                   user.username))
+            after_time = time.perf_counter() - started
+
+        if before != after:
+            raise CommandError("Fast path output differs from HealthMetricSerializer output.")
+
+        self.stdout.write(f"rows               : {count}")
+        self.stdout.write(f"serializer (before): {count / before_time:12.0f} rows/s, {before_queries.count} queries")
+        self.stdout.write(f"values() (after)   : {count / after_time:12.0f} rows/s, {after_queries.count} queries")
+        self.stdout.write(f"speedup            : {before_time / after_time:12.1f}x  (JSON byte-identical, "
+                          f"{len(after)} bytes)")
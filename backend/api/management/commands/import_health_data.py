@@ -0,0 +1,42 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from api.importers import DEFAULT_BATCH_SIZE, IMPORT_RESOURCES, HealthDataImporter, ImportFormatError
+
+
+class Command(BaseCommand):
+    help = (
+        "Import a CSV export from another tracker as HealthMetric or Meal rows for one user. "
+        "Rows are inserted in batches, one transaction per batch; re-running the command on "
+        "the same file resumes an interrupted import and skips rows already present."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="CSV file to import (UTF-8, header row required).")
+        parser.add_argument('--user', required=True, help="Username that will own the imported rows.")
+        parser.add_argument('--resource', choices=list(IMPORT_RESOURCES), default='metrics')
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                            help="Rows validated and inserted per transaction.")
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f"No user named '{options['user']}'.")
+
+        def progress(job):
+            self.stdout.write(f"{job.rows_processed} rows processed ({job.rows_imported} imported)")
+
+        importer = HealthDataImporter(user, options['resource'], options['batch_size'], progress=progress)
+        try:
+            with open(options['path'], 'rb') as fileobj:
+                job = importer.run(fileobj, filename=options['path'])
+        except (OSError, ImportFormatError) as e:
+            raise CommandError(str(e))
+
+        for error in job.errors[:10]:
+            self.stderr.write(f"line {error['line']}: {error['errors']}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Import #{job.id} {job.status}: {job.rows_imported} imported, "
+            f"{job.rows_duplicate} duplicates, {job.rows_invalid} invalid of {job.rows_processed} rows."
+        ))
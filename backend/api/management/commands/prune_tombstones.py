@@ -0,0 +1,36 @@
+import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from api.models import Tombstone
+
+_IN_CHUNK = 1000
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete sync tombstones (records of deleted metrics, meals and goals) older than the retention "
+        "period. Sync cursors issued before it get 410 and start a full sync, so they never miss a deletion."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than', type=int, metavar='DAYS',
+                            help="Defaults to settings.SYNC_TOMBSTONE_RETENTION_DAYS.")
+
+    def handle(self, *args, **options):
+        days = options['older_than']
+        if days is None:
+            days = settings.SYNC_TOMBSTONE_RETENTION_DAYS
+        if days < 0:
+            raise CommandError("--older-than must be zero or more days.")
+        cutoff = timezone.now() - datetime.timedelta(days=days)
+
+        deleted = 0
+        while True:
+            ids = list(Tombstone.objects.filter(deleted_at__lt=cutoff).values_list('id', flat=True)[:_IN_CHUNK])
+            if not ids:
+                break
+            deleted += Tombstone.objects.filter(id__in=ids).delete()[0]
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} tombstones older than {days} days."))
@@ -0,0 +1,56 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from api.rollups import rebuild_user_rollups
+from api.tasks import enqueue_for_users
+
+
+class Command(BaseCommand):
+    help = (
+        "Backfill or repair the DailyRollup table from raw HealthMetric and Meal rows "
+        "(archived metric months included). "
+        "Works user by user in chunks of days, one transaction per chunk."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', action='append', dest='users', default=[],
+                            help="Username to rebuild (repeatable). Defaults to all users.")
+        parser.add_argument('--since', help="Only rebuild days on or after this date (YYYY-MM-DD).")
+        parser.add_argument('--until', help="Only rebuild days on or before this date (YYYY-MM-DD).")
+        parser.add_argument('--chunk-days', type=int, default=90, help="Days aggregated per transaction.")
+        parser.add_argument('--enqueue', action='store_true',
+                            help="Queue one background task per user for `run_worker` instead of working here.")
+
+    def handle(self, *args, **options):
+        since = self._parse_day(options['since'], '--since')
+        until = self._parse_day(options['until'], '--until')
+
+        if options['enqueue']:
+            tasks = enqueue_for_users('rebuild_rollups', options['users'], args={
+                'since': since.isoformat() if since else None,
+                'until': until.isoformat() if until else None,
+                'chunk_days': options['chunk_days'],
+            })
+            self.stdout.write(self.style.SUCCESS(f"Queued {len(tasks)} rollup rebuild tasks."))
+            return
+
+        users = User.objects.order_by('id')
+        if options['users']:
+            users = users.filter(username__in=options['users'])
+
+        total_days = 0
+        for user_id, username in users.values_list('id', 'username').iterator(chunk_size=500):
+            written = rebuild_user_rollups(user_id, since, until, options['chunk_days'])
+            total_days += written
+            self.stdout.write(f"{username}: {written} days")
+
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {total_days} daily rollups."))
+
+    def _parse_day(self, value, option):
+        if not value:
+            return None
+        day = parse_date(value)
+        if day is None:
+            raise CommandError(f"{option} expects a date in YYYY-MM-DD format.")
+        return day
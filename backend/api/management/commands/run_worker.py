@@ -0,0 +1,96 @@
+import os
+import signal
+import socket
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connection
+
+from api.tasks import claim, prune_finished, renew_leases, requeue_expired, run_task
+
+UPKEEP_INTERVAL = 60 # Seconds between re-queueing tasks of stopped workers and pruning old ones
+
+
+class Command(BaseCommand):
+    help = (
+        "Run background tasks (api/tasks.py): exports, large imports, rollup rebuilds and archive runs. "
+        "Claims due tasks from the database on --concurrency threads, renews their leases while they "
+        "run, and requeues the tasks of workers that stopped. Any number of workers may run at once. "
+        "SIGTERM/SIGINT stop claiming and let running tasks finish."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=settings.TASK_WORKER_CONCURRENCY,
+                            help="Tasks run at once (threads).")
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help="Seconds a thread waits before looking again when no task is due.")
+        parser.add_argument('--burst', action='store_true', help="Exit once no task is due.")
+
+    def handle(self, *args, **options):
+        if options['concurrency'] < 1:
+            raise CommandError("--concurrency must be at least 1.")
+        self.name = f'{socket.gethostname()}:{os.getpid()}'
+        self.stopping = threading.Event()
+        self.running = {} # Thread name -> pk of the task it runs
+        self.lock = threading.Lock()
+        handlers = {sig: signal.signal(sig, self.stop) for sig in (signal.SIGTERM, signal.SIGINT)}
+
+        requeue_expired()
+        threads = [threading.Thread(target=self.work, args=(f'{self.name}/{i}', options), name=f'worker-{i}')
+                   for i in range(options['concurrency'])]
+        for thread in threads:
+            thread.start()
+        self.stdout.write(f"Worker {self.name} running {len(threads)} threads")
+
+        # This thread keeps the leases of running tasks alive and does the periodic upkeep
+        renew_every = max(settings.TASK_LEASE_SECONDS / 3, 1)
+        last_renewal = last_upkeep = time.monotonic()
+        try:
+            while any(thread.is_alive() for thread in threads):
+                for thread in threads:
+                    thread.join(timeout=1 / len(threads))
+                now = time.monotonic()
+                if now - last_renewal >= renew_every:
+                    with self.lock:
+                        pks = list(self.running.values())
+                    renew_leases(pks)
+                    last_renewal = now
+                if now - last_upkeep >= UPKEEP_INTERVAL:
+                    requeue_expired()
+                    pruned = prune_finished()
+                    if pruned:
+                        self.stdout.write(f"Deleted {pruned} old tasks")
+                    last_upkeep = now
+                close_old_connections()
+        finally:
+            for sig, handler in handlers.items():
+                signal.signal(sig, handler)
+        self.stdout.write(f"Worker {self.name} stopped")
+
+    def stop(self, signum, frame):
+        if not self.stopping.is_set():
+            self.stdout.write("Stopping: running tasks will finish")
+        self.stopping.set()
+
+    def work(self, worker, options):
+        try:
+            while not self.stopping.is_set():
+                task = claim(worker)
+                if task is None:
+                    if options['burst']:
+                        break
+                    self.stopping.wait(options['poll_interval'])
+                    continue
+                with self.lock:
+                    self.running[worker] = task.pk
+                try:
+                    status = run_task(task, worker)
+                finally:
+                    with self.lock:
+                        del self.running[worker]
+                self.stdout.write(f"{task.kind} #{task.pk}: {status}")
+                close_old_connections()
+        finally:
+            connection.close() # This thread's connection
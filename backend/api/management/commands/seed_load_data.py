@@ -0,0 +1,144 @@
+import datetime
+import random
+import time
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from api.models import FitnessGoal, HealthMetric, Meal
+from api.rollups import rebuild_rollups, rollup_date
+
+MEALS = {
+    # hour of day -> (names, calorie range)
+    8: (['Oatmeal with berries', 'Scrambled eggs', 'Greek yogurt', 'Avocado toast', 'Smoothie bowl'], (250, 550)),
+    13: (['Chicken salad', 'Turkey sandwich', 'Lentil soup', 'Sushi', 'Burrito bowl', 'Pasta'], (450, 900)),
+    16: (['Apple', 'Protein bar', 'Handful of almonds', 'Banana', 'Hummus and carrots'], (80, 300)),
+    19: (['Salmon and rice', 'Steak and potatoes', 'Vegetable curry', 'Pizza', 'Stir fry', 'Tacos'], (500, 1100)),
+}
+GOALS = [
+    'Walk 10,000 steps a day', 'Run a 5k under 30 minutes', 'Lose 3 kg', 'Drink 2 litres of water daily',
+    'Keep resting heart rate under 65', 'Cook at home five nights a week', 'Stretch every morning',
+    'Sleep 8 hours a night', 'Cycle to work twice a week', 'Cut down on sugar',
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate realistic load-test data: users (with tokens and a shared password), "
+        "health metrics, meals and goals spread over the last --days days, inserted with "
+        "bulk_create, followed by a DailyRollup rebuild. Users are named '<prefix>-000001', ..."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10)
+        parser.add_argument('--metrics-per-user', type=int, default=1000)
+        parser.add_argument('--meals-per-user', type=int, default=200)
+        parser.add_argument('--goals-per-user', type=int, default=5)
+        parser.add_argument('--days', type=int, default=90, help="How far back the generated history goes.")
+        parser.add_argument('--prefix', default='load', help="Username prefix of the generated users.")
+        parser.add_argument('--password', default='load-test-password', help="Password of every generated user.")
+        parser.add_argument('--batch-size', type=int, default=5000, help="Rows per bulk_create call.")
+        parser.add_argument('--seed', type=int, default=0, help="Random seed, for reproducible data sets.")
+        parser.add_argument('--clear', action='store_true',
+                            help="Delete existing users with this prefix (and their data) first.")
+
+    def handle(self, *args, **options):
+        prefix = options['prefix']
+        existing = User.objects.filter(username__startswith=f'{prefix}-')
+        if existing.exists():
+            if not options['clear']:
+                raise CommandError(f"Users named '{prefix}-*' already exist. Pass --clear to replace them.")
+            existing.delete()
+
+        self.random = random.Random(options['seed'])
+        self.batch_size = max(1, options['batch_size'])
+        self.end = timezone.now()
+        self.start = self.end - datetime.timedelta(days=max(1, options['days']))
+        started = time.perf_counter()
+
+        password = make_password(options['password']) # Hashed once, shared by every user
+        User.objects.bulk_create([
+            User(username=f'{prefix}-{i:06d}', email=f'{prefix}-{i:06d}@example.com', password=password)
+            for i in range(1, options['users'] + 1)
+        ], batch_size=self.batch_size)
+        user_ids = list(User.objects.filter(username__startswith=f'{prefix}-')
+                        .order_by('id').values_list('id', flat=True))
+        Token.objects.bulk_create([Token(user_id=user_id, key=Token.generate_key()) for user_id in user_ids],
+                                  batch_size=self.batch_size)
+
+        totals = {'metrics': 0, 'meals': 0, 'goals': 0}
+        for user_id in user_ids:
+            with transaction.atomic():
+                totals['metrics'] += self.insert(HealthMetric, self.metrics(user_id, options['metrics_per_user']))
+                totals['meals'] += self.insert(Meal, self.meals(user_id, options['meals_per_user']))
+                totals['goals'] += self.insert(FitnessGoal, self.goals(user_id, options['goals_per_user']))
+                rebuild_rollups(user_id, rollup_date(self.start), rollup_date(self.end))
+
+        elapsed = time.perf_counter() - started
+        rows = sum(totals.values())
+        self.stdout.write(self.style.SUCCESS(
+            f"Seeded {len(user_ids)} users, {totals['metrics']} metrics, {totals['meals']} meals and "
+            f"{totals['goals']} goals in {elapsed:.1f}s ({rows / elapsed if elapsed else rows:.0f} rows/s)."
+        ))
+
+    def insert(self, model, objects):
+        count, batch = 0, []
+        for obj in objects:
+            batch.append(obj)
+            if len(batch) >= self.batch_size:
+                model.objects.bulk_create(batch)
+                count += len(batch)
+                batch = []
+        if batch:
+            model.objects.bulk_create(batch)
+            count += len(batch)
+        return count
+
+    def spread(self, count):
+        """`count` timestamps spread evenly over the history window, with jitter."""
+        if count <= 0:
+            return
+        step = (self.end - self.start) / count
+        for i in range(count):
+            yield self.start + step * i + step * self.random.random()
+
+    def metrics(self, user_id, count):
+        rnd = self.random
+        per_day = max(1, count // max(1, (self.end - self.start).days))
+        weight = rnd.uniform(55, 100)
+        for i, timestamp in enumerate(self.spread(count)):
+            hour = timezone.localtime(timestamp).hour
+            awake = 7 <= hour < 23
+            weight_sample = None
+            if i % per_day == 0: # About one weigh-in a day, drifting slowly
+                weight += rnd.uniform(-0.3, 0.25)
+                weight_sample = round(weight, 2)
+            yield HealthMetric(
+                user_id=user_id,
+                steps=rnd.randint(200, 1500) if awake and rnd.random() < 0.85 else None,
+                heart_rate=rnd.randint(62, 110) if awake else rnd.randint(48, 62),
+                weight=weight_sample,
+                timestamp=timestamp,
+            )
+
+    def meals(self, user_id, count):
+        rnd = self.random
+        hours = list(MEALS)
+        for timestamp in self.spread(count):
+            hour = rnd.choice(hours)
+            names, (low, high) = MEALS[hour]
+            # Keep the day, move the time to the meal's usual hour
+            timestamp = timezone.localtime(timestamp).replace(hour=hour, minute=rnd.randint(0, 59))
+            yield Meal(user_id=user_id, name=rnd.choice(names), calories=rnd.randint(low, high),
+                       timestamp=min(timestamp, self.end))
+
+    def goals(self, user_id, count):
+        rnd = self.random
+        for _ in range(count):
+            completed = rnd.random() < 0.4
+            yield FitnessGoal(user_id=user_id, goal_text=rnd.choice(GOALS), completed=completed,
+                              completed_at=self.end - datetime.timedelta(days=rnd.randint(0, 30)) if completed else None)
@@ -0,0 +1,315 @@
+# backend/api/middleware.py
+
+"""
+Per-request instrumentation, and static files for an all-async middleware stack.
+
+RequestIdMiddleware gives every request an ID (the client's X-Request-ID, or a
+new one), echoes it in the response and makes it available to log records.
+
+RequestMetricsMiddleware counts every request by route and status code and
+records its latency (api/request_metrics.py, served at /api/_metrics).
+
+RequestTimingMiddleware measures query count, DB time, auth and serialization
+time. It samples a fraction of requests
+(settings.REQUEST_TIMING_SAMPLE_RATE). For a sampled request it collects:
+
+- every SQL statement, through an execute wrapper that each database connection
+  gets once when it is opened;
+- the `timed()` sections marked in the code (token auth, row serialization,
+  response rendering).
+
+The numbers go out in a `Server-Timing` header. Requests slower than
+REQUEST_TIMING_SLOW_MS are logged, and so are requests that run the same SQL
+more than REQUEST_TIMING_REPEATED_QUERY_THRESHOLD times (an N+1 pattern).
+INSERTs and executemany() calls are left out of that count: a chunked
+bulk_create repeats one INSERT by design.
+
+The collector lives in a context variable, so it follows the request into
+sync_to_async threads on the ASGI read path. Unsampled requests pay one context
+variable lookup per query.
+
+StaticFilesMiddleware is WhiteNoiseMiddleware made async-capable. Under ASGI,
+one sync-only middleware makes Django run the whole chain in a worker thread,
+so every request would hold a thread again. Every middleware in
+settings.MIDDLEWARE has to be async-capable.
+"""
+
+import contextlib
+import contextvars
+import logging
+import random
+import re
+import time
+import uuid
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+from .request_metrics import request_metrics
+from .structured_logging import reset_request_id, set_request_id
+
+logger = logging.getLogger(__name__)
+
+_current = contextvars.ContextVar('request_timing', default=None)
+
+
+class RequestTiming:
+    """What one sampled request spent its time on."""
+    __slots__ = ('started', 'queries', 'db_time', 'sections', 'statements')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.sections = {}    # name -> seconds
+        self.statements = {}  # SQL -> times executed
+
+    def add(self, name, seconds):
+        self.sections[name] = self.sections.get(name, 0.0) + seconds
+
+
+@contextlib.contextmanager
+def timed(name):
+    """Add the time spent in the block to section `name` of the current request, if it is sampled."""
+    timing = _current.get()
+    if timing is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timing.add(name, time.perf_counter() - started)
+
+
+def _record_query(execute, sql, params, many, context):
+    timing = _current.get()
+    if timing is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timing.db_time += time.perf_counter() - started
+        timing.queries += 1
+        if not many and sql.lstrip()[:6].upper() != 'INSERT': # Batched writes, not N+1 reads
+            timing.statements[sql] = timing.statements.get(sql, 0) + 1
+
+
+def _install(connection):
+    # At the front of the list: execute_wrapper() blocks pop from the end
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, _record_query)
+
+
+@receiver(connection_created)
+def install_query_recorder(sender, connection, **kwargs):
+    _install(connection)
+
+
+class RequestTimingMiddleware:
+    """
+    Adds a Server-Timing header (total, db, auth, serialize) to sampled requests
+    and logs slow requests and repeated SQL. Works for sync and async requests.
+    Listed right after RequestIdMiddleware and RequestMetricsMiddleware, so
+    `total` covers every other middleware and the view.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sample_rate = getattr(settings, 'REQUEST_TIMING_SAMPLE_RATE', 1.0)
+        self.slow_seconds = getattr(settings, 'REQUEST_TIMING_SLOW_MS', 500) / 1000
+        self.repeat_threshold = getattr(settings, 'REQUEST_TIMING_REPEATED_QUERY_THRESHOLD', 10)
+        for connection in connections.all(initialized_only=True): # Opened before this module was loaded
+            _install(connection)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def _sampled(self):
+        return self.sample_rate >= 1 or random.random() < self.sample_rate
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self._sampled():
+            return self.get_response(request)
+        timing = RequestTiming()
+        token = _current.set(timing)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, timing)
+
+    async def __acall__(self, request):
+        if not self._sampled():
+            return await self.get_response(request)
+        timing = RequestTiming()
+        token = _current.set(timing)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, timing)
+
+    def process_template_response(self, request, response):
+        # DRF responses are rendered after the view returns: count that as serialization
+        timing = _current.get()
+        if timing is not None:
+            started = time.perf_counter()
+            response.add_post_render_callback(
+                lambda rendered: timing.add('serialize', time.perf_counter() - started))
+        return response
+
+    def finish(self, request, response, timing):
+        total = time.perf_counter() - timing.started
+        metrics = [f'total;dur={total * 1000:.1f}',
+                   f'db;dur={timing.db_time * 1000:.1f};desc="{timing.queries} queries"']
+        metrics.extend(f'{name};dur={seconds * 1000:.1f}' for name, seconds in timing.sections.items())
+        response['Server-Timing'] = ', '.join(metrics)
+
+        if total >= self.slow_seconds:
+            sections = ', '.join(f'{name} {seconds * 1000:.0f} ms' for name, seconds in timing.sections.items())
+            logger.warning("Slow request %s %s: %.0f ms, %d queries in %.0f ms%s (status %s)",
+                           request.method, request.path, total * 1000, timing.queries, timing.db_time * 1000,
+                           ', ' + sections if sections else '', response.status_code)
+        for sql, count in timing.statements.items():
+            if count > self.repeat_threshold:
+                logger.warning("Possible N+1 in %s %s: same query ran %d times: %s",
+                               request.method, request.path, count, sql[:300])
+        return response
+
+
+# Client-supplied IDs are kept only if they look like an ID
+_REQUEST_ID = re.compile(r'^[A-Za-z0-9._:-]{1,64}$')
+
+
+class RequestIdMiddleware:
+    """
+    Tags the request with an ID for the logs: the client's X-Request-ID header
+    when it is a plausible ID, otherwise a new random one. The ID is sent back
+    in the X-Request-ID response header. Listed first in MIDDLEWARE.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def request_id(self, request):
+        supplied = request.headers.get('X-Request-ID', '')
+        return supplied if _REQUEST_ID.match(supplied) else uuid.uuid4().hex
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        request.request_id = self.request_id(request)
+        token = set_request_id(request.request_id)
+        try:
+            response = self.get_response(request)
+        finally:
+            reset_request_id(token)
+        response['X-Request-ID'] = request.request_id
+        return response
+
+    async def __acall__(self, request):
+        request.request_id = self.request_id(request)
+        token = set_request_id(request.request_id)
+        try:
+            response = await self.get_response(request)
+        finally:
+            reset_request_id(token)
+        response['X-Request-ID'] = request.request_id
+        return response
+
+
+# Anything else is counted as OTHER, so odd clients can't add label values
+_METHODS = frozenset({'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'})
+
+
+def route_name(request):
+    """
+    Metrics label for the view that handled `request`: 'HealthMetricViewSet.list',
+    'RegisterView', a URL name for non-DRF views, or 'unmatched' (404s, static files).
+    """
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unmatched'
+    cls = getattr(match.func, 'cls', None)
+    if cls is None:
+        return match.view_name
+    actions = getattr(match.func, 'actions', None)
+    action = actions.get(request.method.lower()) if actions else None
+    return f'{cls.__name__}.{action}' if action else cls.__name__
+
+
+class RequestMetricsMiddleware:
+    """
+    Counts every request by route, method and status code and records its
+    latency in the shared histograms. Listed right after RequestIdMiddleware.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        started = time.perf_counter()
+        response = self.get_response(request)
+        self.observe(request, response, time.perf_counter() - started)
+        return response
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        response = await self.get_response(request)
+        self.observe(request, response, time.perf_counter() - started)
+        return response
+
+    def observe(self, request, response, seconds):
+        method = request.method if request.method in _METHODS else 'OTHER'
+        try:
+            request_metrics.observe(route_name(request), method, response.status_code, seconds)
+        except OSError as e: # Metrics must never fail the request itself
+            logger.error("Could not record request metrics: %s", e)
+
+
+class StaticFilesMiddleware(WhiteNoiseMiddleware):
+    """
+    WhiteNoiseMiddleware that also runs in an async chain. Static files are
+    served by WhiteNoise as before, in a worker thread under ASGI; every other
+    request passes straight through on the event loop.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response, settings=settings):
+        super().__init__(get_response, settings)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        if self.autorefresh:
+            static_file = await sync_to_async(self.find_file)(request.path_info) # Looks at the disk
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            return await sync_to_async(self.serve)(static_file, request)
+        return await self.get_response(request)
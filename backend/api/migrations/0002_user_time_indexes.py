@@ -0,0 +1,27 @@
+# Generated by Django 5.2 on 2026-10-17 04:15
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='fitnessgoal',
+            index=models.Index(fields=['user', 'completed', '-created_at', '-id'], name='goal_user_done_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='healthmetric',
+            index=models.Index(fields=['user', '-timestamp', '-id'], name='metric_user_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='meal',
+            index=models.Index(fields=['user', '-timestamp', '-id'], name='meal_user_ts_idx'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2 on 2026-10-17 04:14
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_user_time_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('steps_sum', models.BigIntegerField(blank=True, null=True)),
+                ('hr_sum', models.BigIntegerField(default=0)),
+                ('hr_count', models.PositiveIntegerField(default=0)),
+                ('hr_min', models.PositiveIntegerField(blank=True, null=True)),
+                ('hr_max', models.PositiveIntegerField(blank=True, null=True)),
+                ('weight_last', models.DecimalField(blank=True, decimal_places=2, max_digits=5, null=True)),
+                ('calories_sum', models.BigIntegerField(blank=True, null=True)),
+                ('meal_count', models.PositiveIntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_rollups', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-date'],
+                'constraints': [models.UniqueConstraint(fields=('user', 'date'), name='rollup_user_date_uniq')],
+            },
+        ),
+    ]
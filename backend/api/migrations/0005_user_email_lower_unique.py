@@ -0,0 +1,42 @@
+from django.conf import settings
+from django.db import migrations
+
+INDEX_NAME = 'user_email_lower_uniq'
+
+
+def create_index(apps, schema_editor):
+    if schema_editor.connection.vendor not in ('postgresql', 'sqlite'):
+        return # Needs expression + partial index support
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+    table = schema_editor.quote_name(User._meta.db_table)
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(f"SELECT LOWER(email) FROM {table} WHERE email > '' "
+                       f"GROUP BY LOWER(email) HAVING COUNT(*) > 1 ORDER BY 1 LIMIT 20")
+        duplicates = [row[0] for row in cursor.fetchall()]
+    if duplicates:
+        raise RuntimeError(
+            "Can't add the case-insensitive unique email index: these emails belong to more than one "
+            f"user (first 20): {', '.join(duplicates)}. Merge or change those accounts, then migrate again.")
+    # Blank emails (allowed by the auth User model) are left out of the uniqueness rule
+    schema_editor.execute(
+        f"CREATE UNIQUE INDEX {schema_editor.quote_name(INDEX_NAME)} ON {table} (LOWER(email)) WHERE email > ''")
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor not in ('postgresql', 'sqlite'):
+        return
+    schema_editor.execute(f"DROP INDEX IF EXISTS {schema_editor.quote_name(INDEX_NAME)}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_import_job'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        # After the last auth migration: on SQLite, altering auth_user rebuilds the table without this index
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
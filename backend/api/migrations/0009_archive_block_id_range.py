@@ -0,0 +1,60 @@
+# Generated by Django 5.2 on 2026-10-17 14:02
+
+import struct
+import zlib
+
+import numpy as np
+from django.db import migrations, models
+
+# Block format version 1, as written by api.archive.pack_columns() when this migration was made
+_HEADER = struct.Struct('<4sHI') # Magic, format version, row count; the compressed columns follow
+
+
+def block_ids(data):
+    """The ids column of a block: the first column, byte-shuffled and delta-encoded."""
+    data = bytes(data) # PostgreSQL returns a memoryview
+    magic, version, count = _HEADER.unpack_from(data)
+    if magic != b'HMAB' or version != 1:
+        raise ValueError(f"Unsupported archive block format: {magic!r} version {version}.")
+    raw = np.frombuffer(zlib.decompress(data[_HEADER.size:]), dtype=np.uint8)
+    deltas = raw[:count * 8].reshape(8, count).T.copy().view('<i8').ravel()
+    return np.cumsum(deltas)
+
+
+def fill_id_ranges(apps, schema_editor):
+    MetricArchiveBlock = apps.get_model('api', 'MetricArchiveBlock')
+    for block in MetricArchiveBlock.objects.iterator(chunk_size=100):
+        ids = block_ids(block.data)
+        block.min_id, block.max_id = int(ids.min()), int(ids.max())
+        block.save(update_fields=['min_id', 'max_id'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_task_queue'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='metricarchiveblock',
+            name='min_id',
+            field=models.BigIntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name='metricarchiveblock',
+            name='max_id',
+            field=models.BigIntegerField(null=True),
+        ),
+        migrations.RunPython(fill_id_ranges, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='metricarchiveblock',
+            name='min_id',
+            field=models.BigIntegerField(),
+        ),
+        migrations.AlterField(
+            model_name='metricarchiveblock',
+            name='max_id',
+            field=models.BigIntegerField(),
+        ),
+    ]
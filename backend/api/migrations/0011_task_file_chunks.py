@@ -0,0 +1,43 @@
+# Generated by Django 5.2 on 2026-10-17 06:01
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+CHUNK_SIZE = 256 * 1024 # api.tasks.FILE_CHUNK_SIZE
+
+
+def split_files(apps, schema_editor):
+    TaskFile = apps.get_model('api', 'TaskFile')
+    TaskFileChunk = apps.get_model('api', 'TaskFileChunk')
+    for pk in TaskFile.objects.values_list('pk', flat=True):
+        data = bytes(TaskFile.objects.filter(pk=pk).values_list('data', flat=True).get())
+        TaskFileChunk.objects.bulk_create(
+            TaskFileChunk(file_id=pk, index=index, data=data[start:start + CHUNK_SIZE])
+            for index, start in enumerate(range(0, len(data), CHUNK_SIZE)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_stream_ticket'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TaskFileChunk',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('index', models.PositiveIntegerField()),
+                ('data', models.BinaryField()),
+                ('file', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chunks', to='api.taskfile')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('file', 'index'), name='task_file_chunk_index_uniq')],
+            },
+        ),
+        migrations.RunPython(split_files, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='taskfile',
+            name='data',
+        ),
+    ]
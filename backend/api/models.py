@@ -8,24 +8,36 @@ class HealthMetric(models.Model):
     steps = models.PositiveIntegerField(null=True, blank=True)
     heart_rate = models.PositiveIntegerField(null=True, blank=True) # Beats per minute
     timestamp = models.DateTimeField(default=timezone.now)
+    updated_at = models.DateTimeField(auto_now=True) # Delta sync position (api/sync.py)
 
     def __str__(self):
         return f"{self.user.username} - {self.timestamp.strftime('%Y-%m-%d %H:%M')}"
 
     class Meta:
         ordering = ['-timestamp'] # Show newest first
+        indexes = [
+            # Per-user, newest-first: serves time-range filters and keyset pages
+            models.Index(fields=['user', '-timestamp', '-id'], name='metric_user_ts_idx'),
+            # Per-user changes in sync order
+            models.Index(fields=['user', 'updated_at', 'id'], name='metric_user_updated_idx'),
+        ]
 
 class Meal(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='meals')
     name = models.CharField(max_length=200)
     calories = models.PositiveIntegerField()
     timestamp = models.DateTimeField(default=timezone.now)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return f"{self.user.username} - {self.name} ({self.calories} kcal) at {self.timestamp.strftime('%Y-%m-%d %H:%M')}"
 
     class Meta:
         ordering = ['-timestamp']
+        indexes = [
+            models.Index(fields=['user', '-timestamp', '-id'], name='meal_user_ts_idx'),
+            models.Index(fields=['user', 'updated_at', 'id'], name='meal_user_updated_idx'),
+        ]
 
 class FitnessGoal(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='fitness_goals')
@@ -33,6 +45,7 @@ class FitnessGoal(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     completed = models.BooleanField(default=False)
     completed_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         status = "Completed" if self.completed else "Pending"
@@ -47,4 +60,232 @@ class FitnessGoal(models.Model):
         super().save(*args, **kwargs)
 
     class Meta:
-        ordering = ['-created_at']
\ No newline at end of file
+        ordering = ['-created_at']
+        indexes = [
+            # Open/completed goal lists per user, newest first
+            models.Index(fields=['user', 'completed', '-created_at', '-id'], name='goal_user_done_created_idx'),
+            models.Index(fields=['user', 'updated_at', 'id'], name='goal_user_updated_idx'),
+        ]
+
+
+class DailyRollup(models.Model):
+    """
+    Per-user, per-day aggregates of HealthMetric and Meal rows, maintained by the
+    metric/meal viewsets on every write (see api/rollups.py) and rebuilt with
+    `manage.py rebuild_rollups`. Days are calendar days in settings.TIME_ZONE.
+    Summary reads use these rows, so their cost is O(days) rather than O(samples).
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='daily_rollups')
+    date = models.DateField()
+    steps_sum = models.BigIntegerField(null=True, blank=True) # NULL when no steps were logged that day
+    hr_sum = models.BigIntegerField(default=0)
+    hr_count = models.PositiveIntegerField(default=0)
+    hr_min = models.PositiveIntegerField(null=True, blank=True)
+    hr_max = models.PositiveIntegerField(null=True, blank=True)
+    weight_last = models.DecimalField(max_digits=5, decimal_places=2, null=True, blank=True)
+    calories_sum = models.BigIntegerField(null=True, blank=True) # NULL when no meals were logged that day
+    meal_count = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.user.username} - {self.date.isoformat()}"
+
+    class Meta:
+        ordering = ['-date']
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'date'], name='rollup_user_date_uniq'),
+        ]
+
+
+class ImportJob(models.Model):
+    """
+    Progress of one CSV import (api/importers.py). A job is identified by the user,
+    resource and SHA-256 of the file, so re-running an interrupted import of the same
+    file resumes after the last committed batch instead of starting over.
+    """
+    STATUS_RUNNING = 'running'
+    STATUS_COMPLETED = 'completed'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_COMPLETED, 'Completed'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='import_jobs')
+    resource = models.CharField(max_length=20) # 'metrics' or 'meals'
+    filename = models.CharField(max_length=255, blank=True)
+    source_sha256 = models.CharField(max_length=64)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_RUNNING)
+    rows_processed = models.PositiveIntegerField(default=0) # Data rows consumed (committed batches only)
+    rows_imported = models.PositiveIntegerField(default=0)
+    rows_duplicate = models.PositiveIntegerField(default=0) # Skipped: (user, timestamp) already present
+    rows_invalid = models.PositiveIntegerField(default=0)
+    errors = models.JSONField(default=list, blank=True) # First few invalid rows: [{line, errors}]
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.user.username} - {self.resource} import of {self.filename or self.source_sha256[:12]} ({self.status})"
+
+    class Meta:
+        ordering = ['-created_at']
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'resource', 'source_sha256'], name='import_job_source_uniq'),
+        ]
+
+
+class MetricArchiveBlock(models.Model):
+    """
+    One user's HealthMetric rows for one calendar month (UTC), packed by
+    `manage.py archive_metrics` into compressed column arrays (see api/archive.py)
+    after the raw rows are deleted. The metric list, detail, export, summary, series
+    and sync reads merge these blocks back in, so archiving doesn't change what they return.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='metric_archive_blocks')
+    month = models.DateField() # First day of the month (UTC)
+    row_count = models.PositiveIntegerField()
+    first_timestamp = models.DateTimeField()
+    last_timestamp = models.DateTimeField()
+    min_id = models.BigIntegerField() # Smallest and largest HealthMetric id held, for lookups by id
+    max_id = models.BigIntegerField()
+    data = models.BinaryField() # api.archive.pack_columns() output
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.user.username} - {self.month.strftime('%Y-%m')} ({self.row_count} metrics)"
+
+    class Meta:
+        ordering = ['-month']
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'month'], name='archive_user_month_uniq'),
+        ]
+
+
+class Tombstone(models.Model):
+    """
+    Record of a HealthMetric, Meal or FitnessGoal deleted through the API, so
+    /api/sync/ can tell clients to drop their copy (api/sync.py). Written in the
+    delete's transaction; pruned with `manage.py prune_tombstones` after
+    settings.SYNC_TOMBSTONE_RETENTION_DAYS.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='tombstones')
+    resource = models.CharField(max_length=20) # Model name: 'healthmetric', 'meal' or 'fitnessgoal'
+    object_id = models.BigIntegerField()
+    deleted_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"{self.user.username} - {self.resource} {self.object_id} deleted {self.deleted_at.strftime('%Y-%m-%d %H:%M')}"
+
+    class Meta:
+        ordering = ['-deleted_at']
+        indexes = [
+            models.Index(fields=['user', 'deleted_at', 'id'], name='tombstone_user_deleted_idx'),
+        ]
+
+
+class StreamTicket(models.Model):
+    """
+    A short-lived, single-use credential for opening the live event stream
+    (api/live.py). EventSource can't send an Authorization header, and an API
+    token in a URL would end up in server logs and browser history, so clients
+    trade their token for a ticket first. Redeeming a ticket deletes it.
+    """
+    key = models.CharField(max_length=64, primary_key=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='stream_tickets')
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"{self.user.username} - stream ticket until {self.expires_at.strftime('%Y-%m-%d %H:%M:%S')}"
+
+
+class Task(models.Model):
+    """
+    A unit of background work (api/tasks.py): an export, a large import, a rollup
+    rebuild or an archive run. Queued by the API or a management command, run by
+    `manage.py run_worker`, and polled by clients at /api/tasks/<id>/.
+    """
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_SUCCEEDED = 'succeeded'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, 'Queued'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_SUCCEEDED, 'Succeeded'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True, related_name='tasks')
+    kind = models.CharField(max_length=50) # Key of api.tasks.TASK_HANDLERS
+    args = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+    attempts = models.PositiveSmallIntegerField(default=0) # Runs started, the current one included
+    max_attempts = models.PositiveSmallIntegerField(default=3)
+    run_at = models.DateTimeField(default=timezone.now) # Not claimed before this (retry backoff)
+    worker = models.CharField(max_length=100, blank=True) # Worker thread holding the lease
+    lease_expires_at = models.DateTimeField(null=True, blank=True)
+    progress = models.JSONField(default=dict, blank=True)
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True) # Last failure
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.kind} #{self.pk} ({self.status})"
+
+    @property
+    def finished(self):
+        return self.status in (self.STATUS_SUCCEEDED, self.STATUS_FAILED)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'run_at', 'id'], name='task_status_run_at_idx'), # Claiming
+            models.Index(fields=['user', 'created_at', 'id'], name='task_user_created_idx'),
+        ]
+
+
+class TaskFile(models.Model):
+    """
+    The uploaded input or produced output of a Task, gzipped in the database so
+    web and worker processes need no shared disk. The gzip stream is kept in
+    TaskFileChunk rows, so neither writing nor reading a file holds all of it
+    in memory (api/tasks.py).
+    """
+    ROLE_INPUT = 'input'
+    ROLE_OUTPUT = 'output'
+    ROLE_CHOICES = [
+        (ROLE_INPUT, 'Input'),
+        (ROLE_OUTPUT, 'Output'),
+    ]
+
+    task = models.ForeignKey(Task, on_delete=models.CASCADE, related_name='files')
+    role = models.CharField(max_length=10, choices=ROLE_CHOICES)
+    name = models.CharField(max_length=255)
+    content_type = models.CharField(max_length=100)
+    size = models.PositiveBigIntegerField() # Uncompressed bytes
+
+    def __str__(self):
+        return f"{self.task} {self.role}: {self.name}"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['task', 'role'], name='task_file_role_uniq'),
+        ]
+
+
+class TaskFileChunk(models.Model):
+    """One consecutive piece of a TaskFile's gzip stream."""
+    file = models.ForeignKey(TaskFile, on_delete=models.CASCADE, related_name='chunks')
+    index = models.PositiveIntegerField() # Position in the stream, from 0
+    data = models.BinaryField()
+
+    def __str__(self):
+        return f"{self.file} #{self.index}"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['file', 'index'], name='task_file_chunk_index_uniq'),
+        ]
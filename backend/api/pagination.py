@@ -0,0 +1,145 @@
+# backend/api/pagination.py
+
+import heapq
+import itertools
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination, Cursor
+
+
+class KeysetCursorPagination(CursorPagination):
+    """
+    Cursor pagination keyed on a (sort field, id) pair.
+
+    DRF's CursorPagination positions on the first ordering field only and
+    skips ties with an OFFSET, so pages full of identical timestamps get
+    slower (and eventually fail at `offset_cutoff`). Here the cursor stores
+    both the sort value and the primary key, so every page is a single
+    index range scan of `page_size + 1` rows, however deep the client pages.
+
+    Subclasses set `ordering` to a descending (field, id) pair.
+    """
+    ordering = ('-timestamp', '-id')
+    page_size_query_param = 'page_size'
+    max_page_size = 500  # Server-enforced upper bound for ?page_size=
+
+    def paginate_queryset(self, queryset, request, view=None):
+        queryset = self.page_queryset(queryset, request)
+        if queryset is None:
+            return None
+        return self.set_page(list(queryset))
+
+    def page_queryset(self, queryset, request):
+        """
+        The lazy, sliced queryset for the requested page (`page_size + 1` rows, so
+        the extra row tells whether there's a next page). Evaluate it, sync or async,
+        and pass the rows to set_page(). Returns None when pagination is disabled.
+        """
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.cursor = self.decode_cursor(request)
+        reverse = self.cursor.reverse if self.cursor else False
+        self.position = None # The cursor's (value, pk), once parsed
+
+        field = self.ordering[0].lstrip('-')
+        # Walking "backwards" (previous page) flips both the comparison and the sort
+        ordering = [name.lstrip('-') for name in self.ordering] if reverse else list(self.ordering)
+
+        if self.cursor is not None and self.cursor.position is not None:
+            value, pk = self.position = self._parse_position(queryset, self.cursor.position)
+            op = 'gt' if reverse else 'lt'
+            bound = 'gte' if reverse else 'lte'
+            # (field, id) < (value, pk), written so the planner gets a range bound on `field`
+            queryset = queryset.filter(
+                Q(**{f'{field}__{bound}': value}),
+                Q(**{f'{field}__{op}': value}) | Q(**{f'pk__{op}': pk}),
+            )
+
+        return queryset.order_by(*ordering)[:self.page_size + 1]
+
+    def merge_rows(self, results, extra):
+        """
+        Merge `extra` rows (dicts from outside the queryset, already past the cursor
+        and in page order) into the rows of page_queryset(); keeps `page_size + 1`.
+        """
+        field = self.ordering[0].lstrip('-')
+        reverse = self.cursor.reverse if self.cursor else False
+        merged = heapq.merge(results, extra, key=lambda row: (row[field], row['id']), reverse=not reverse)
+        return list(itertools.islice(merged, self.page_size + 1))
+
+    def set_page(self, results):
+        """Record the rows fetched with page_queryset() as the current page and return it."""
+        reverse = self.cursor.reverse if self.cursor else False
+        has_more = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        if reverse:
+            self.page.reverse()
+
+        has_cursor = self.cursor is not None and self.cursor.position is not None
+        if reverse:
+            self.has_previous = has_more
+            self.has_next = has_cursor
+        else:
+            self.has_next = has_more
+            self.has_previous = has_cursor
+
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        if self.page:
+            position = self._get_position_from_instance(self.page[-1], self.ordering)
+        else:
+            position = self.cursor.position
+        return self.encode_cursor(Cursor(offset=0, reverse=False, position=position))
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if self.page:
+            position = self._get_position_from_instance(self.page[0], self.ordering)
+        else:
+            position = self.cursor.position
+        return self.encode_cursor(Cursor(offset=0, reverse=True, position=position))
+
+    def _get_position_from_instance(self, instance, ordering):
+        field_name = ordering[0].lstrip('-')
+        if isinstance(instance, dict):
+            value, pk = instance[field_name], instance['id']
+        else:
+            value, pk = getattr(instance, field_name), instance.pk
+        if hasattr(value, 'isoformat'):
+            value = value.isoformat()
+        return f'{value}|{pk}'
+
+    def _parse_position(self, queryset, position):
+        """
+        Split an encoded 'value|pk' position and coerce both halves to python values.
+        """
+        field_name = self.ordering[0].lstrip('-')
+        try:
+            value, pk = position.rsplit('|', 1)
+            value = queryset.model._meta.get_field(field_name).to_python(value)
+            pk = int(pk)
+        except (ValueError, TypeError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+        if value is None:
+            raise NotFound(self.invalid_cursor_message)
+        return value, pk
+
+
+class TimestampCursorPagination(KeysetCursorPagination):
+    """Newest-first keyset pagination for timestamped rows (metrics, meals)."""
+    ordering = ('-timestamp', '-id')
+
+
+class CreatedAtCursorPagination(KeysetCursorPagination):
+    """Newest-first keyset pagination for rows ordered by creation time (goals)."""
+    ordering = ('-created_at', '-id')
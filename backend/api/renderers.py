@@ -0,0 +1,76 @@
+# backend/api/renderers.py
+
+"""
+Compact alternatives to the JSON list output, registered next to DRF's
+JSONRenderer in REST_FRAMEWORK['DEFAULT_RENDERER_CLASSES'].
+
+- `ColumnarJSONRenderer` (?format=columnar): every list of row objects in the
+  payload becomes one array per field, so keys are written once rather than
+  once per row. A field with the same value on every row (the owner's
+  `user`) is stated once next to the columns:
+
+      {"next": ..., "previous": ...,
+       "results": {"user": "alice", "columns": {"id": [3, 2], "steps": [120, null], ...}}}
+
+  Single objects (detail responses, errors) are rendered as plain JSON.
+- `MessagePackRenderer` (Accept: application/msgpack): the same payload as
+  JSON, in MessagePack.
+"""
+
+import msgpack
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+# Fields lifted out of the columns when every row has the same value
+SHARED_FIELDS = ('user',)
+
+
+def to_columns(rows):
+    """[{field: value}, ...] -> {'columns': {field: [value, ...]}}, plus any shared field stated once."""
+    table = {}
+    names = list(rows[0]) if rows else []
+    for name in SHARED_FIELDS:
+        if name in names:
+            first = rows[0][name]
+            if all(row[name] == first for row in rows):
+                table[name] = first
+                names.remove(name)
+    table['columns'] = {name: [row[name] for row in rows] for name in names}
+    return table
+
+
+def _is_rows(value):
+    return isinstance(value, list) and all(isinstance(item, dict) for item in value)
+
+
+def columnar(data):
+    """`data` with itself (if a list of rows) or each top-level list of rows in columnar form."""
+    if _is_rows(data):
+        return to_columns(data)
+    if isinstance(data, dict):
+        return {key: to_columns(value) if _is_rows(value) else value for key, value in data.items()}
+    return data
+
+
+class ColumnarJSONRenderer(JSONRenderer):
+    media_type = 'application/vnd.health-tracker.columnar+json'
+    format = 'columnar'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        response = (renderer_context or {}).get('response')
+        if response is not None and response.exception:
+            return super().render(data, accepted_media_type, renderer_context) # Errors keep their shape
+        return super().render(columnar(data), accepted_media_type, renderer_context)
+
+
+class MessagePackRenderer(BaseRenderer):
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+    encoder_class = JSONEncoder # Dates, decimals, UUIDs and lazy strings, as in JSON
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(data, default=self.encoder_class().default)
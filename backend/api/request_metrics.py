@@ -0,0 +1,179 @@
+# backend/api/request_metrics.py
+
+"""
+Request counters and latency histograms, shared by all worker processes.
+
+Each process owns one memory-mapped file in settings.REQUEST_METRICS_DIR
+(a tmpfs directory under /dev/shm by default). The file is an append-only
+table of key -> float64 entries, and counting a request updates it in place,
+with no system call or lock shared with other processes. The metrics endpoint
+reads every process's file and adds them up. Files of exited workers are
+kept, so totals only ever grow, as Prometheus counters should.
+
+Per route (`HealthMetricViewSet.list`, `RegisterView`, ...) and method, the
+files hold request counts by status code and a fixed-bucket latency histogram.
+"""
+
+import glob
+import json
+import mmap
+import os
+import struct
+import tempfile
+import threading
+
+from django.conf import settings
+
+# Upper bounds of the latency histogram buckets, in seconds (+Inf is implied)
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+_BUCKET_LABELS = tuple(repr(bound) for bound in BUCKETS) + ('+Inf',)
+
+_INITIAL_SIZE = 64 * 1024
+_HEADER = struct.Struct('<i')  # Bytes in use, written after the entry they cover
+_KEY_LENGTH = struct.Struct('<i')
+_VALUE = struct.Struct('<d')
+
+
+def default_directory():
+    base = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+    return os.path.join(base, 'health-tracker-metrics')
+
+
+def _entries(data, used):
+    """(key, value, value offset) for each entry of a value file's contents."""
+    position = _HEADER.size
+    while position < used:
+        length = _KEY_LENGTH.unpack_from(data, position)[0]
+        key = tuple(json.loads(bytes(data[position + 4:position + 4 + length])))
+        offset = position + 4 + length + _padding(length)
+        yield key, _VALUE.unpack_from(data, offset)[0], offset
+        position = offset + _VALUE.size
+
+
+def _padding(key_length):
+    return (8 - (4 + key_length) % 8) % 8 # Keeps every value 8-byte aligned
+
+
+class _ValueFile:
+    """Append-only key -> float64 table in a memory-mapped file, written by a single process."""
+
+    def __init__(self, path):
+        self._file = open(path, 'a+b')
+        size = os.fstat(self._file.fileno()).st_size
+        if size == 0:
+            size = _INITIAL_SIZE
+            os.ftruncate(self._file.fileno(), size)
+        self._map = mmap.mmap(self._file.fileno(), size)
+        self._used = _HEADER.unpack_from(self._map, 0)[0] or _HEADER.size
+        # A file left by an earlier process with the same pid is continued, not reset
+        self._offsets = {key: offset for key, _, offset in _entries(self._map, self._used)}
+
+    def add(self, key, amount):
+        offset = self._offsets.get(key)
+        if offset is None:
+            offset = self._append(key)
+        _VALUE.pack_into(self._map, offset, _VALUE.unpack_from(self._map, offset)[0] + amount)
+
+    def _append(self, key):
+        encoded = json.dumps(key).encode()
+        offset = self._used + 4 + len(encoded) + _padding(len(encoded))
+        end = offset + _VALUE.size
+        if end > len(self._map):
+            self._grow(end)
+        _KEY_LENGTH.pack_into(self._map, self._used, len(encoded))
+        self._map[self._used + 4:self._used + 4 + len(encoded)] = encoded
+        _VALUE.pack_into(self._map, offset, 0.0)
+        _HEADER.pack_into(self._map, 0, end)
+        self._used = end
+        self._offsets[key] = offset
+        return offset
+
+    def _grow(self, needed):
+        size = len(self._map)
+        while size < needed:
+            size *= 2
+        self._map.close()
+        os.ftruncate(self._file.fileno(), size)
+        self._map = mmap.mmap(self._file.fileno(), size)
+
+
+def read_values(directory):
+    """Sum of every process's values in `directory`, as {key: value}."""
+    totals = {}
+    for path in glob.glob(os.path.join(directory, '*.db')):
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except OSError: # Removed while we were listing
+            continue
+        if len(data) < _HEADER.size:
+            continue
+        for key, value, _ in _entries(data, _HEADER.unpack_from(data, 0)[0]):
+            totals[key] = totals.get(key, 0.0) + value
+    return totals
+
+
+class RequestMetrics:
+    """Records requests into this process's value file and renders all processes' totals."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._owner = None # (pid, directory) the open file belongs to
+        self._values = None
+
+    @property
+    def directory(self):
+        return getattr(settings, 'REQUEST_METRICS_DIR', None) or default_directory()
+
+    def _file(self):
+        owner = (os.getpid(), self.directory)
+        if owner != self._owner: # First request, a forked worker, or a changed setting
+            os.makedirs(owner[1], exist_ok=True)
+            self._values = _ValueFile(os.path.join(owner[1], f'{owner[0]}.db'))
+            self._owner = owner
+        return self._values
+
+    def observe(self, route, method, status, seconds):
+        bucket = next((label for label, bound in zip(_BUCKET_LABELS, BUCKETS) if seconds <= bound), '+Inf')
+        with self._lock:
+            values = self._file()
+            values.add(('requests', route, method, str(status)), 1)
+            values.add(('bucket', route, method, bucket), 1)
+            values.add(('seconds', route, method), seconds)
+
+    def render(self):
+        """All processes' metrics in the Prometheus text exposition format."""
+        values = read_values(self.directory)
+        lines = [
+            '# HELP http_requests_total Requests handled, by route, method and status code.',
+            '# TYPE http_requests_total counter',
+        ]
+        for (kind, *labels), value in sorted(values.items()):
+            if kind == 'requests':
+                route, method, status = labels
+                lines.append(f'http_requests_total{_labels(route=route, method=method, status=status)} {value:.0f}')
+
+        lines += [
+            '# HELP http_request_duration_seconds Time from the first middleware until the response was returned.',
+            '# TYPE http_request_duration_seconds histogram',
+        ]
+        series = sorted({(route, method) for (kind, route, method, *_) in values if kind == 'seconds'})
+        for route, method in series:
+            cumulative = 0.0
+            for bucket in _BUCKET_LABELS:
+                cumulative += values.get(('bucket', route, method, bucket), 0.0)
+                lines.append(f'http_request_duration_seconds_bucket'
+                             f'{_labels(route=route, method=method, le=bucket)} {cumulative:.0f}')
+            lines.append(f'http_request_duration_seconds_sum{_labels(route=route, method=method)} '
+                         f'{values[("seconds", route, method)]!r}')
+            lines.append(f'http_request_duration_seconds_count{_labels(route=route, method=method)} {cumulative:.0f}')
+        return '\n'.join(lines) + '\n'
+
+
+def _labels(**labels):
+    escaped = (value.replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n') for value in labels.values())
+    return '{' + ','.join(f'{name}="{value}"' for name, value in zip(labels, escaped)) + '}'
+
+
+# The instance used by the middleware and the metrics endpoint
+request_metrics = RequestMetrics()
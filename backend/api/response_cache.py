@@ -0,0 +1,185 @@
+# backend/api/response_cache.py
+
+"""
+Per-user cache of rendered read responses.
+
+Entries are keyed on (user, data versions of the resources the response is built
+from, host, path, normalized query string, negotiated media type). Any write to
+one of those resources bumps its version (api/versions.py), so stale entries are
+never found again and simply age out of the cache: invalidation is exact without
+having to enumerate keys.
+
+Bytes are stored in a dedicated cache alias (settings.RESPONSE_CACHE_ALIAS),
+which is expected to evict least-recently-used entries within a bounded size
+(locmem with MAX_ENTRIES, or Redis with maxmemory-policy allkeys-lru). Responses
+larger than RESPONSE_CACHE_MAX_ENTRY_BYTES are not stored. The versions must be
+shared by all workers for that to hold, so the cache is skipped while they are
+not (versions_shared()).
+"""
+
+import hashlib
+import threading
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+
+from .async_cache import cache_call
+from .middleware import timed
+from .versions import aget_data_versions, get_data_versions, versions_shared
+
+# Response headers replayed on a hit
+_STORED_HEADERS = ('ETag', 'Cache-Control')
+
+
+class ResponseCache:
+    """Response store plus in-process hit/miss counters for monitoring."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'stores': 0, 'oversized': 0}
+
+    @property
+    def enabled(self):
+        # A write in another worker must reach this one's versions, or a hit could be stale
+        return getattr(settings, 'RESPONSE_CACHE_ENABLED', True) and versions_shared()
+
+    @property
+    def cache(self):
+        return caches[getattr(settings, 'RESPONSE_CACHE_ALIAS', 'default')]
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
+
+    def make_key(self, request, versions, extra=()):
+        query = urlencode(sorted((k, v) for k, values in request.query_params.lists() for v in values))
+        parts = [
+            *(f'{name}={version}' for name, version in sorted(versions.items())),
+            request.get_host(), request.path, query, request.accepted_media_type, *extra,
+        ]
+        digest = hashlib.sha1('\n'.join(str(p) for p in parts).encode()).hexdigest()
+        return f'resp:{request.user.id}:{digest}'
+
+    def _response(self, entry):
+        content, content_type, headers = entry
+        response = HttpResponse(content, content_type=content_type)
+        for name, value in headers.items():
+            response[name] = value
+        response['X-Cache'] = 'HIT'
+        return response
+
+    def _entry(self, rendered):
+        """The cache entry for a rendered response, or None if it is too large to store."""
+        content = rendered.content
+        if len(content) > getattr(settings, 'RESPONSE_CACHE_MAX_ENTRY_BYTES', 1024 * 1024):
+            self._count('oversized')
+            return None
+        headers = {name: rendered[name] for name in _STORED_HEADERS if rendered.has_header(name)}
+        return (content, rendered['Content-Type'], headers)
+
+    @property
+    def ttl(self):
+        return getattr(settings, 'RESPONSE_CACHE_TTL', 3600)
+
+    def get(self, key):
+        entry = self.cache.get(key)
+        if entry is None:
+            self._count('misses')
+            return None
+        self._count('hits')
+        return self._response(entry)
+
+    def store_on_render(self, key, response):
+        """Store `response` once Django has rendered it, if it is a cacheable 200."""
+        if response.status_code != 200:
+            return response
+        response['X-Cache'] = 'MISS'
+
+        def store(rendered):
+            entry = self._entry(rendered)
+            if entry is not None:
+                self.cache.set(key, entry, self.ttl)
+                self._count('stores')
+
+        response.add_post_render_callback(store)
+        return response
+
+    async def aget(self, key):
+        entry = await cache_call(self.cache, 'get', key)
+        if entry is None:
+            self._count('misses')
+            return None
+        self._count('hits')
+        return self._response(entry)
+
+    async def astore(self, key, response):
+        """Store an already rendered `response`, if it is a cacheable 200."""
+        if response.status_code != 200:
+            return response
+        response['X-Cache'] = 'MISS'
+        entry = self._entry(response)
+        if entry is not None:
+            await cache_call(self.cache, 'set', key, entry, self.ttl)
+            self._count('stores')
+        return response
+
+
+response_cache = ResponseCache()
+
+
+class ResponseCacheMixin:
+    """
+    Opt-in response caching for DRF views. Set `cache_responses = True` and
+    `cache_resources` (model names whose data the response is built from), then
+    route read handlers through `self.cached(request, build)`.
+    """
+    cache_responses = False
+    cache_resources = ()
+
+    def get_cache_resources(self):
+        return self.cache_resources
+
+    def cached(self, request, build, resources=None, extra=()):
+        """
+        Return the cached response for this request, or call `build()` and cache its
+        rendered output. `extra` adds key parts for inputs that aren't in the URL or
+        the data versions (e.g. "today").
+        """
+        if not self._caching(request):
+            return build()
+
+        resources = self.get_cache_resources() if resources is None else resources
+        key = response_cache.make_key(request, get_data_versions(request.user.id, resources), extra)
+        response = response_cache.get(key)
+        if response is not None:
+            return response
+        return response_cache.store_on_render(key, build())
+
+    async def acached(self, request, build, resources=None, extra=()):
+        """
+        cached() for async handlers, where `build` is a coroutine function. A miss is
+        finalized and rendered here, so it is stored without a post-render callback.
+        """
+        if not self._caching(request):
+            return await build()
+
+        resources = self.get_cache_resources() if resources is None else resources
+        key = response_cache.make_key(request, await aget_data_versions(request.user.id, resources), extra)
+        response = await response_cache.aget(key)
+        if response is not None:
+            return response
+        response = self.finalize_response(request, await build())
+        with timed('serialize'):
+            response.render()
+        return await response_cache.astore(key, response)
+
+    def _caching(self, request):
+        renderer = getattr(request, 'accepted_renderer', None)
+        return (self.cache_responses and response_cache.enabled
+                and getattr(renderer, 'format', None) != 'api') # Browsable API pages embed forms/CSRF tokens
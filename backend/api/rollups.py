@@ -0,0 +1,238 @@
+# backend/api/rollups.py
+
+"""
+Maintenance of the per-user DailyRollup table.
+
+Writes through the metric and meal viewsets call `refresh_rollups()` for the days
+they touched; each refresh re-aggregates just those days from the raw rows (an
+index range scan per user) and upserts the result, so min/max/last values stay
+exact through updates and deletes. Refreshes of one user run one at a time (see
+lock_user()), so a refresh never writes totals read before another write
+committed. `manage.py rebuild_rollups` (or its
+background task, api/tasks.py) uses the same functions over wider date ranges to
+backfill or repair the table.
+"""
+
+import datetime
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Count, Max, Min, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .archive import aggregate_archive, merge_aggregates
+from .models import DailyRollup, HealthMetric, Meal, MetricArchiveBlock
+
+ROLLUP_FIELDS = [
+    'steps_sum', 'hr_sum', 'hr_count', 'hr_min', 'hr_max',
+    'weight_last', 'calories_sum', 'meal_count',
+]
+
+# Keep IN (...) lists well under SQLite's bound-parameter limit
+_IN_CHUNK = 500
+# Touched days at most this far apart are aggregated as one date range
+_RUN_GAP_DAYS = 7
+
+
+def rollup_date(timestamp):
+    """The DailyRollup date a timestamp falls on (calendar day in settings.TIME_ZONE)."""
+    return timezone.localtime(timestamp, timezone.get_default_timezone()).date()
+
+
+def day_start(day):
+    """Aware datetime for midnight at the start of `day` in settings.TIME_ZONE."""
+    return timezone.make_aware(datetime.datetime.combine(day, datetime.time.min),
+                               timezone.get_default_timezone())
+
+
+def _empty_rollup():
+    return {
+        'steps_sum': None, 'hr_sum': 0, 'hr_count': 0, 'hr_min': None, 'hr_max': None,
+        'weight_last': None, 'calories_sum': None, 'meal_count': 0,
+    }
+
+
+def compute_rollups(user_id, first_day, last_day):
+    """
+    Aggregate the raw metric and meal rows of one user, archived metrics included,
+    for the days first_day..last_day (inclusive). Returns {date: {field: value}} with an entry
+    only for days that have data.
+    """
+    tz = timezone.get_default_timezone()
+    start, end = day_start(first_day), day_start(last_day + datetime.timedelta(days=1))
+    computed = {}
+
+    metrics = (
+        HealthMetric.objects.filter(user_id=user_id, timestamp__gte=start, timestamp__lt=end)
+        .annotate(day=TruncDate('timestamp', tzinfo=tz))
+        .values('day')
+        .annotate(
+            steps_sum=Sum('steps'),
+            hr_sum=Sum('heart_rate'),
+            hr_count=Count('heart_rate'),
+            hr_min=Min('heart_rate'),
+            hr_max=Max('heart_rate'),
+            weight_at=Max('timestamp', filter=Q(weight__isnull=False)),
+        )
+        .order_by()
+    )
+    weight_at = {} # Day -> timestamp of its last weight in the table
+    for entry in metrics:
+        row = computed.setdefault(entry['day'], _empty_rollup())
+        row.update(
+            steps_sum=entry['steps_sum'],
+            hr_sum=entry['hr_sum'] or 0,
+            hr_count=entry['hr_count'],
+            hr_min=entry['hr_min'],
+            hr_max=entry['hr_max'],
+        )
+        if entry['weight_at'] is not None:
+            weight_at[entry['day']] = entry['weight_at']
+
+    # Archived months (api/archive.py); an archived weight logged later than the table's replaces it
+    for day, archived in aggregate_archive(user_id, 'day', tz, start, end).items():
+        row = computed.setdefault(day, _empty_rollup())
+        merged = merge_aggregates({**row, 'weight_at': weight_at.get(day)}, archived)
+        row.update({name: merged[name] for name in ('steps_sum', 'hr_sum', 'hr_count', 'hr_min', 'hr_max')})
+        if merged['weight_at'] != weight_at.get(day):
+            weight_at.pop(day, None)
+            row['weight_last'] = merged['weight_last']
+
+    weight_times = {timestamp: day for day, timestamp in weight_at.items()}
+    # Last weight of each day: the weight logged at that day's latest weighed timestamp
+    times = list(weight_times)
+    for i in range(0, len(times), _IN_CHUNK):
+        weights = (
+            HealthMetric.objects.filter(user_id=user_id, timestamp__in=times[i:i + _IN_CHUNK],
+                                        weight__isnull=False)
+            .order_by('timestamp', 'id')
+            .values_list('timestamp', 'weight')
+        )
+        for timestamp, weight in weights:
+            computed[weight_times[timestamp]]['weight_last'] = weight
+
+    meals = (
+        Meal.objects.filter(user_id=user_id, timestamp__gte=start, timestamp__lt=end)
+        .annotate(day=TruncDate('timestamp', tzinfo=tz))
+        .values('day')
+        .annotate(calories_sum=Sum('calories'), meal_count=Count('id'))
+        .order_by()
+    )
+    for entry in meals:
+        row = computed.setdefault(entry['day'], _empty_rollup())
+        row.update(calories_sum=entry['calories_sum'], meal_count=entry['meal_count'])
+
+    return computed
+
+
+def _upsert(user_id, computed):
+    if not computed:
+        return
+    DailyRollup.objects.bulk_create(
+        [DailyRollup(user_id=user_id, date=day, **values) for day, values in computed.items()],
+        update_conflicts=True,
+        unique_fields=['user', 'date'],
+        update_fields=ROLLUP_FIELDS,
+        batch_size=_IN_CHUNK,
+    )
+
+
+def lock_user(user_id):
+    """
+    Hold the user's row until the current transaction ends, so rollup refreshes
+    of one user run one at a time. Each then aggregates after the previous one
+    committed, and its upsert cannot overwrite newer totals with a stale read.
+    FOR NO KEY UPDATE: inserts of the user's rows (FK checks take KEY SHARE)
+    are not blocked. SQLite has no row locks but serializes writers anyway.
+    """
+    list(User.objects.select_for_update(no_key=True).filter(pk=user_id).values_list('pk', flat=True))
+
+
+def _day_runs(days):
+    """Sorted `days` as (first, last) ranges, split wherever more than _RUN_GAP_DAYS days go untouched."""
+    runs = []
+    for day in sorted(days):
+        if runs and (day - runs[-1][1]).days <= _RUN_GAP_DAYS:
+            runs[-1][1] = day
+        else:
+            runs.append([day, day])
+    return runs
+
+
+def refresh_rollups(user_id, timestamps):
+    """
+    Recompute the rollups of every day touched by `timestamps` (created, updated
+    or deleted rows, including an updated row's previous timestamp). Days left
+    without any data lose their rollup row. Call it in the transaction of the write.
+    """
+    days = {rollup_date(ts) for ts in timestamps if ts is not None}
+    if not days:
+        return
+    with transaction.atomic():
+        lock_user(user_id)
+        # Only near the touched days: scattered timestamps (an unsorted import batch)
+        # would otherwise span, and aggregate, most of the user's history
+        computed = {}
+        for first, last in _day_runs(days):
+            computed.update(compute_rollups(user_id, first, last))
+        computed = {day: values for day, values in computed.items() if day in days}
+        _upsert(user_id, computed)
+        empty = sorted(days - computed.keys())
+        for i in range(0, len(empty), _IN_CHUNK):
+            DailyRollup.objects.filter(user_id=user_id, date__in=empty[i:i + _IN_CHUNK]).delete()
+
+
+def rebuild_rollups(user_id, first_day, last_day):
+    """
+    Replace all rollups of one user between first_day and last_day (inclusive) with
+    a fresh aggregation of the raw rows. Returns the number of days written.
+    """
+    with transaction.atomic():
+        lock_user(user_id)
+        computed = compute_rollups(user_id, first_day, last_day)
+        DailyRollup.objects.filter(user_id=user_id, date__gte=first_day, date__lte=last_day).delete()
+        _upsert(user_id, computed)
+    return len(computed)
+
+
+def data_span(user_id):
+    """First and last rollup day with any metric (live or archived) or meal for the user; (None, None) if none."""
+    bounds = [
+        HealthMetric.objects.filter(user_id=user_id).aggregate(first=Min('timestamp'), last=Max('timestamp')),
+        MetricArchiveBlock.objects.filter(user_id=user_id).aggregate(first=Min('first_timestamp'),
+                                                                     last=Max('last_timestamp')),
+        Meal.objects.filter(user_id=user_id).aggregate(first=Min('timestamp'), last=Max('timestamp')),
+    ]
+    firsts = [b['first'] for b in bounds if b['first'] is not None]
+    lasts = [b['last'] for b in bounds if b['last'] is not None]
+    if not firsts:
+        return None, None
+    return rollup_date(min(firsts)), rollup_date(max(lasts))
+
+
+def rebuild_user_rollups(user_id, since=None, until=None, chunk_days=90):
+    """
+    Rebuild one user's rollups over the span of their data (narrowed to
+    since..until when given), `chunk_days` days per transaction. A full rebuild
+    also drops rollups outside the span. Returns the number of days written.
+    """
+    first, last = data_span(user_id)
+    if first is None:
+        # No raw rows left: any rollups for this user are stale
+        DailyRollup.objects.filter(user_id=user_id).delete()
+        return 0
+    first = max(first, since) if since else first
+    last = min(last, until) if until else last
+
+    chunk = datetime.timedelta(days=max(chunk_days, 1))
+    written = 0
+    day = first
+    while day <= last:
+        chunk_end = min(day + chunk - datetime.timedelta(days=1), last)
+        written += rebuild_rollups(user_id, day, chunk_end)
+        day = chunk_end + datetime.timedelta(days=1)
+
+    if not since and not until:
+        DailyRollup.objects.filter(user_id=user_id).exclude(date__range=(first, last)).delete()
+    return written
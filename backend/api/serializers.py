@@ -1,8 +1,13 @@
 from django.contrib.auth.models import User
 from rest_framework import serializers
-from .models import HealthMetric, Meal, FitnessGoal
+from .models import HealthMetric, Meal, FitnessGoal, Task
+from .backends import users_by_email
+from .hashing import hash_password
+from .middleware import timed
 from django.contrib.auth.password_validation import validate_password
 from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import IntegrityError, transaction
+from django.urls import reverse
 
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
@@ -37,8 +42,8 @@ class RegisterSerializer(serializers.ModelSerializer):
         if password != password2:
             raise serializers.ValidationError({"password": "Password fields didn't match."})
 
-        # Basic email uniqueness check
-        if User.objects.filter(email=attrs['email']).exists():
+        # Case-insensitive email uniqueness check, served by the LOWER(email) unique index
+        if users_by_email(attrs['email']).exists():
             raise serializers.ValidationError({"email": "Email already exists."})
         return attrs
 
@@ -46,13 +51,14 @@ class RegisterSerializer(serializers.ModelSerializer):
         # Remove password2 before creating the user if it somehow exists in validated_data (it shouldn't due to write_only)
         validated_data.pop('password2', None)
 
-        user = User.objects.create(
+        # Hashed in the bounded pool first: if it is busy (429), nothing has been saved
+        user = User(
             username=validated_data['username'],
             email=validated_data['email'],
             first_name=validated_data.get('first_name', ''),
-            last_name=validated_data.get('last_name', '')
+            last_name=validated_data.get('last_name', ''),
+            password=hash_password(validated_data['password']),
         )
-        user.set_password(validated_data['password'])
 
         # Password validation can still happen here if desired, though validators=[] handles it too
         # try:
@@ -61,7 +67,14 @@ class RegisterSerializer(serializers.ModelSerializer):
         #     user.delete()
         #     raise serializers.ValidationError({'password': list(e.messages)})
 
-        user.save()
+        try:
+            with transaction.atomic():
+                user.save()
+        except IntegrityError:
+            # Lost a race with a concurrent registration: the unique indexes caught it
+            if users_by_email(user.email).exists():
+                raise serializers.ValidationError({"email": "Email already exists."})
+            raise serializers.ValidationError({"username": "A user with that username already exists."})
         return user
 
 # --- Rest of the serializers remain the same ---
@@ -83,4 +96,60 @@ class FitnessGoalSerializer(serializers.ModelSerializer):
     class Meta:
         model = FitnessGoal
         fields = ['id', 'user', 'goal_text', 'created_at', 'completed', 'completed_at']
-        read_only_fields = ['created_at', 'completed_at']
\ No newline at end of file
+        read_only_fields = ['created_at', 'completed_at']
+
+class TaskSerializer(serializers.ModelSerializer):
+    download = serializers.SerializerMethodField() # URL of the output file, once there is one
+    class Meta:
+        model = Task
+        fields = ['id', 'kind', 'status', 'attempts', 'max_attempts', 'progress', 'result', 'error', 'download',
+                  'created_at', 'run_at', 'started_at', 'finished_at']
+        read_only_fields = fields
+
+    def get_download(self, task):
+        if task.status != Task.STATUS_SUCCEEDED or not isinstance(task.result, dict) or 'file' not in task.result:
+            return None
+        url = reverse('task-download', args=[task.pk])
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request else url
+
+# --- Fast read path for user-owned lists ---
+
+def row_fields(serializer):
+    """
+    The model columns a values() query must fetch to render `serializer` with
+    serialize_rows(). Fields sourced through a relation (user.username) are skipped.
+    """
+    return [field.source for field in serializer.fields.values()
+            if not field.write_only and '.' not in field.source]
+
+
+def serialize_rows(serializer, rows, username):
+    """
+    Render plain dict rows (from queryset.values(*row_fields(serializer))) exactly
+    as `serializer` renders model instances, field by field, without building model
+    objects. Every row belongs to the requesting user, so the `user` field is filled
+    in from `username` instead of following the foreign key.
+    """
+    fields = []
+    for name, field in serializer.fields.items():
+        if field.write_only:
+            continue
+        if field.source == 'user.username':
+            fields.append((name, None, None))
+        else:
+            fields.append((name, field.source, field.to_representation))
+
+    rows = list(rows) # Run the query (if any) before timing serialization
+    with timed('serialize'):
+        data = []
+        for row in rows:
+            item = {}
+            for name, source, to_representation in fields:
+                if source is None:
+                    item[name] = username
+                else:
+                    value = row[source]
+                    item[name] = None if value is None else to_representation(value)
+            data.append(item)
+    return data
@@ -0,0 +1,182 @@
+# backend/api/series.py
+
+"""
+Downsampled metric time series for charts (GET /api/metrics/series/).
+
+A chart is a few hundred pixels wide, but a wearable logs a heart-rate sample
+every minute. The series endpoint fetches one column as a stream of
+(timestamp, value) tuples into NumPy arrays, then reduces it to at most
+`points` samples with a shape-preserving algorithm:
+
+- lttb: Largest-Triangle-Three-Buckets. Keeps the sample in each bucket that
+  forms the largest triangle with its neighbours, so peaks and troughs
+  survive. Each bucket's choice depends on the previous one, so there is one
+  loop step per output point, vectorized within the bucket.
+- minmax: the lowest and highest sample of each bucket, in time order. Fully
+  vectorized. Never drops an extreme value.
+
+The response size depends only on `points`, not on how many samples the
+range holds.
+"""
+
+import datetime
+from array import array
+
+import numpy as np
+from django.db import connection
+from django.db.models import BigIntegerField, Func
+from rest_framework import serializers
+
+from .archive import archived_series
+from .filters import parse_time_bound
+from .models import HealthMetric
+
+SERIES_FIELDS = ('heart_rate', 'steps', 'weight')
+SERIES_METHODS = ('lttb', 'minmax')
+DEFAULT_POINTS = 500
+MAX_POINTS = 5000
+FETCH_CHUNK_SIZE = 5000
+
+_EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+_MICROSECOND = datetime.timedelta(microseconds=1)
+
+
+def parse_series_params(query_params):
+    """Validate ?field=, ?points=, ?method=, ?from= and ?to=; raises ValidationError (400)."""
+    field = query_params.get('field')
+    if field not in SERIES_FIELDS:
+        raise serializers.ValidationError({"field": f"Expected one of: {', '.join(SERIES_FIELDS)}."})
+    method = query_params.get('method', 'lttb')
+    if method not in SERIES_METHODS:
+        raise serializers.ValidationError({"method": f"Expected one of: {', '.join(SERIES_METHODS)}."})
+    try:
+        points = int(query_params.get('points', DEFAULT_POINTS))
+    except ValueError:
+        points = 0
+    if not 3 <= points <= MAX_POINTS:
+        raise serializers.ValidationError({"points": f"Expected an integer from 3 to {MAX_POINTS}."})
+    start = parse_time_bound(query_params.get('from'), 'from')
+    end = parse_time_bound(query_params.get('to'), 'to', end=True)
+    return field, method, points, start, end
+
+
+class EpochMicroseconds(Func):
+    """
+    Microseconds since the epoch of a datetime column, computed in SQL. Reading
+    integers skips the per-row datetime parsing, which dominates a long fetch.
+    SQLite and PostgreSQL only.
+    """
+    output_field = BigIntegerField()
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        # Stored as 'YYYY-MM-DD HH:MM:SS[.ffffff]' in UTC; '%%%%s' reaches SQLite as '%s'
+        template = ("(CAST(strftime('%%%%s', %(expressions)s) AS INTEGER) * 1000000"
+                    " + CAST(substr(%(expressions)s || '.000000', 21, 6) AS INTEGER))")
+        return self.as_sql(compiler, connection, template=template, **extra_context)
+
+    def as_postgresql(self, compiler, connection, **extra_context):
+        template = 'CAST(EXTRACT(EPOCH FROM %(expressions)s) * 1000000 AS BIGINT)'
+        return self.as_sql(compiler, connection, template=template, **extra_context)
+
+
+def fetch_series(user, field, start=None, end=None):
+    """
+    The user's non-null `field` samples in time order, as two NumPy arrays:
+    timestamps in microseconds since the epoch (int64) and values (float64).
+    Rows are streamed in chunks, without building model instances; archived
+    months (api/archive.py) are merged in.
+    """
+    queryset = HealthMetric.objects.filter(user=user, **{f'{field}__isnull': False})
+    if start is not None:
+        queryset = queryset.filter(timestamp__gte=start)
+    if end is not None:
+        queryset = queryset.filter(timestamp__lt=end)
+    queryset = queryset.order_by('timestamp', 'id')
+    times, values = array('q'), array('d')
+    if connection.vendor in ('sqlite', 'postgresql'):
+        # Plain integers and numbers: read the cursor directly, a chunk at a time
+        sql, params = queryset.values_list(EpochMicroseconds('timestamp'), field).query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            while rows := cursor.fetchmany(FETCH_CHUNK_SIZE):
+                chunk_times, chunk_values = zip(*rows)
+                times.extend(chunk_times)
+                values.extend(map(float, chunk_values)) # Decimal weights
+    else:
+        for timestamp, value in queryset.values_list('timestamp', field).iterator(chunk_size=FETCH_CHUNK_SIZE):
+            times.append((timestamp - _EPOCH) // _MICROSECOND)
+            values.append(value)
+    times, values = np.frombuffer(times, dtype=np.int64), np.frombuffer(values, dtype=np.float64)
+    archived_times, archived_values = archived_series(user.id, field, start, end)
+    if len(archived_times):
+        times, values = np.concatenate((archived_times, times)), np.concatenate((archived_values, values))
+        order = np.argsort(times, kind='stable') # Hot rows may have been written into archived months
+        times, values = times[order], values[order]
+    return times, values
+
+
+def _bucket_edges(start, stop, buckets):
+    """`buckets + 1` increasing indices splitting [start, stop) into buckets of near-equal size."""
+    return np.linspace(start, stop, buckets + 1).astype(np.intp)
+
+
+def lttb(x, y, points):
+    """Indices of the `points` samples Largest-Triangle-Three-Buckets keeps (all of them if there are fewer)."""
+    n = len(x)
+    if n <= points:
+        return np.arange(n)
+    x = x.astype(np.float64)
+    # The first and last samples are always kept; the rest fill points - 2 buckets
+    buckets = points - 2
+    edges = _bucket_edges(1, n - 1, buckets)
+    counts = np.diff(edges)
+    avg_x = np.add.reduceat(x[:n - 1], edges[:-1]) / counts
+    avg_y = np.add.reduceat(y[:n - 1], edges[:-1]) / counts
+    # The third triangle corner for bucket b: the average of bucket b + 1, or the last sample
+    next_x = np.append(avg_x[1:], x[-1])
+    next_y = np.append(avg_y[1:], y[-1])
+
+    selected = np.empty(points, dtype=np.intp)
+    selected[0], selected[-1] = 0, n - 1
+    previous = 0
+    for b in range(buckets):
+        lo, hi = edges[b], edges[b + 1]
+        ax, ay = x[previous], y[previous]
+        areas = np.abs((ax - next_x[b]) * (y[lo:hi] - ay) - (ax - x[lo:hi]) * (next_y[b] - ay))
+        previous = lo + int(np.argmax(areas))
+        selected[b + 1] = previous
+    return selected
+
+
+def minmax(x, y, points):
+    """Indices of the lowest and highest sample in each of points // 2 buckets, in time order."""
+    n = len(x)
+    if n <= points:
+        return np.arange(n)
+    buckets = points // 2
+    edges = _bucket_edges(0, n, buckets)
+    bucket_of = np.repeat(np.arange(buckets), np.diff(edges))
+    firsts = edges[:-1]
+    lowest = np.lexsort((y, bucket_of))[firsts]   # Sorted by bucket, then value: first of each bucket is its min
+    highest = np.lexsort((-y, bucket_of))[firsts]
+    return np.unique(np.concatenate((lowest, highest))) # Sorted indices; one per bucket if min == max
+
+
+DOWNSAMPLERS = {'lttb': lttb, 'minmax': minmax}
+
+
+def build_series(user, field, method='lttb', points=DEFAULT_POINTS, start=None, end=None):
+    """
+    Downsampled samples of `field` as [{'timestamp': ..., 'value': ...}], with
+    timestamps formatted as in the list endpoint, plus the raw sample count.
+    """
+    times, values = fetch_series(user, field, start, end)
+    indices = DOWNSAMPLERS[method](times, values, points)
+    as_number = (lambda value: round(float(value), 2)) if field == 'weight' else int
+    timestamp_field = serializers.DateTimeField()
+    results = [
+        {'timestamp': timestamp_field.to_representation(_EPOCH + datetime.timedelta(microseconds=int(times[i]))),
+         'value': as_number(values[i])}
+        for i in indices
+    ]
+    return results, len(times)
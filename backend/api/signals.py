@@ -0,0 +1,21 @@
+# backend/api/signals.py
+
+from django.contrib.auth.models import User
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from .authentication import invalidate_token, invalidate_user_tokens
+
+
+@receiver(post_delete, sender=Token)
+def drop_deleted_token(sender, instance, **kwargs):
+    # Also runs for tokens removed by a cascading user delete
+    invalidate_token(instance.key)
+
+
+@receiver(post_save, sender=User)
+def drop_tokens_of_changed_user(sender, instance, created, **kwargs):
+    # Any saved change (is_active=False, new username, ...) must not be served stale
+    if not created:
+        invalidate_user_tokens(instance.pk)
@@ -0,0 +1,199 @@
+# backend/api/structured_logging.py
+
+"""
+Logging pieces for LOG_FORMAT=json (see LOGGING in config/settings.py).
+
+- `QueuedStreamHandler` puts records on a bounded in-memory queue. A
+  background thread takes them off, formats them as JSON and writes them to
+  the stream, so request threads never wait on log I/O.
+- `JsonFormatter` writes one JSON object per line, with the request ID.
+- `RequestIdFilter` stamps each record with the ID of the request that
+  logged it (set by api.middleware.RequestIdMiddleware).
+- `SamplingFilter` keeps only a fraction of the DEBUG/INFO records of chosen
+  loggers, for high-volume messages. Warnings and errors are always kept.
+
+Nothing here imports models, so the logging configuration can load it
+before the app registry is ready.
+"""
+
+import atexit
+import contextvars
+import copy
+import datetime
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import time
+from logging.handlers import QueueHandler, QueueListener
+
+_request_id = contextvars.ContextVar('request_id', default=None)
+
+
+def get_request_id():
+    return _request_id.get()
+
+
+def set_request_id(value):
+    """Set the current request's ID; returns a token for reset_request_id()."""
+    return _request_id.set(value)
+
+
+def reset_request_id(token):
+    _request_id.reset(token)
+
+
+def parse_sample_rates(value):
+    """'api.views=0.1,django.db.backends=0.01' -> {'api.views': 0.1, 'django.db.backends': 0.01}"""
+    rates = {}
+    for item in filter(None, (part.strip() for part in value.split(','))):
+        name, _, rate = item.partition('=')
+        rates[name.strip()] = float(rate)
+    return rates
+
+
+class RequestIdFilter(logging.Filter):
+    """Adds `request_id` (None outside a request) to every record."""
+
+    def filter(self, record):
+        record.request_id = _request_id.get()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Passes `rate` of the records below WARNING from each configured logger
+    (and its children); the most specific logger name wins. `rates` is a dict
+    or a string as parsed by parse_sample_rates().
+    """
+
+    def __init__(self, rates=None):
+        super().__init__()
+        self.rates = parse_sample_rates(rates) if isinstance(rates, str) else dict(rates or {})
+        self._resolved = {} # Logger name -> rate, including inherited ones
+
+    def _rate(self, name):
+        rate = self._resolved.get(name)
+        if rate is None:
+            rate, prefix = 1.0, name
+            while prefix:
+                if prefix in self.rates:
+                    rate = self.rates[prefix]
+                    break
+                prefix = prefix.rpartition('.')[0]
+            self._resolved[name] = rate
+        return rate
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING or not self.rates:
+            return True
+        rate = self._rate(record.name)
+        return rate >= 1 or random.random() < rate
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record: time, level, logger, message, request ID, process and any exception."""
+
+    def format(self, record):
+        entry = {
+            'time': datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc)
+                    .isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'request_id': getattr(record, 'request_id', None),
+            'process': record.process,
+        }
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text: # Already formatted if the record was queued
+            entry['exception'] = record.exc_text
+        if record.stack_info:
+            entry['stack'] = self.formatStack(record.stack_info)
+        return json.dumps(entry, default=str)
+
+
+_exception_formatter = logging.Formatter()
+
+
+class QueuedStreamHandler(QueueHandler):
+    """
+    QueueHandler with its own QueueListener writing to a StreamHandler.
+
+    Filters (request ID, sampling) run on the logging thread. Only records
+    that pass them are prepared for the queue: the message is merged with its
+    args and any exception is rendered to text there, so the listener never
+    touches objects the request may still be changing. The JSON line itself
+    is formatted in the listener thread.
+
+    When the queue is full, records are dropped and counted instead of
+    blocking the request. `dropped` is the running total; at most every
+    `report_interval` seconds, a WARNING record from this module says how
+    many were dropped since the last report. A forked worker (gunicorn
+    --preload) restarts the listener thread, which fork doesn't copy.
+    """
+
+    def __init__(self, stream=None, queue_size=10000, report_interval=10):
+        self.queue_size = queue_size
+        self.report_interval = report_interval
+        self.target = logging.StreamHandler(stream or sys.stderr)
+        self.dropped = 0
+        self._reported = 0 # `dropped` as of the last report
+        self._last_report = 0.0
+        super().__init__(queue.SimpleQueue()) # Lock-free put; the size limit is checked in enqueue()
+        self.addFilter(RequestIdFilter())
+        self._start()
+        atexit.register(self.close)
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._restart)
+
+    def _start(self):
+        self.listener = QueueListener(self.queue, self.target)
+        self.listener.start()
+
+    def _restart(self):
+        self.queue = queue.SimpleQueue() # The parent's queue may hold its records
+        self._start()
+
+    def setFormatter(self, fmt):
+        self.target.setFormatter(fmt) # Formatting happens in the listener thread
+
+    def prepare(self, record):
+        """A copy of the record with the message merged and the exception rendered, like QueueHandler's."""
+        message = record.getMessage()
+        if record.exc_info and not record.exc_text:
+            record.exc_text = (self.target.formatter or _exception_formatter).formatException(record.exc_info)
+        record = copy.copy(record) # Other handlers still see the original
+        record.msg = message
+        record.args = None
+        record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        # Called under the handler's lock, so the counters need no lock of their own
+        if self.queue.qsize() < self.queue_size:
+            self._report_dropped()
+            self.queue.put_nowait(record)
+        else:
+            self.dropped += 1
+
+    def _report_dropped(self, force=False):
+        now = time.monotonic()
+        if self.dropped == self._reported or (not force and now - self._last_report < self.report_interval):
+            return
+        record = logging.LogRecord(__name__, logging.WARNING, __file__, 0,
+                                   f"Dropped {self.dropped - self._reported} log records: the log queue was full",
+                                   None, None)
+        record.request_id = None
+        self.queue.put_nowait(record)
+        self._reported, self._last_report = self.dropped, now
+
+    def close(self):
+        with self.lock:
+            self._report_dropped(force=True)
+        if self.listener is not None and self.listener._thread is not None:
+            self.listener.stop() # Drains the queue first
+        self.target.close()
+        super().close()
@@ -0,0 +1,233 @@
+# backend/api/summaries.py
+
+"""
+Per-period aggregation of a user's health metrics and meals.
+
+Everything is grouped and reduced in the database, so the cost of a summary
+(and its payload) grows with the number of buckets, not the number of samples.
+Whenever the request lines up with whole days in settings.TIME_ZONE the
+summary is read from DailyRollup (O(days)); otherwise it falls back to
+aggregating the raw rows.
+"""
+
+import datetime
+import zoneinfo
+
+from django.db.models import Count, Max, Min, Q, Sum
+from django.db.models.functions import TruncDay, TruncMonth, TruncWeek
+from django.utils import timezone
+from rest_framework import serializers
+
+from .archive import aggregate_archive, merge_aggregates
+from .filters import parse_time_bound
+from .models import DailyRollup, HealthMetric, Meal
+
+BUCKETS = {
+    'day': TruncDay,
+    'week': TruncWeek,   # Weeks start on Monday (ISO)
+    'month': TruncMonth,
+}
+
+
+def resolve_time_zone(name):
+    """
+    Return the ZoneInfo for a ?tz= value, or the project default (TIME_ZONE) when empty.
+    """
+    if not name:
+        return timezone.get_default_timezone()
+    try:
+        return zoneinfo.ZoneInfo(name)
+    except (zoneinfo.ZoneInfoNotFoundError, ValueError):
+        raise serializers.ValidationError({"tz": f"Unknown time zone '{name}'."})
+
+
+def parse_summary_params(query_params):
+    """
+    Validate the ?bucket=, ?tz=, ?from= and ?to= parameters of a summary request.
+    Plain dates in from/to are read in the requested time zone.
+    """
+    bucket = query_params.get('bucket', 'day')
+    if bucket not in BUCKETS:
+        raise serializers.ValidationError({"bucket": f"Expected one of: {', '.join(BUCKETS)}."})
+
+    tz = resolve_time_zone(query_params.get('tz'))
+    with timezone.override(tz):
+        start = parse_time_bound(query_params.get('from'), 'from')
+        end = parse_time_bound(query_params.get('to'), 'to', end=True)
+    return bucket, tz, start, end
+
+
+def _in_range(queryset, start, end):
+    if start is not None:
+        queryset = queryset.filter(timestamp__gte=start)
+    if end is not None:
+        queryset = queryset.filter(timestamp__lt=end)
+    return queryset
+
+
+def _empty_row(period):
+    return {
+        'period': period,
+        'steps_total': None,
+        'heart_rate_avg': None,
+        'heart_rate_min': None,
+        'heart_rate_max': None,
+        'weight_last': None,
+        'calories_total': None,
+        'meal_count': 0,
+    }
+
+
+def rollups_cover(tz, start, end):
+    """
+    True when DailyRollup can answer the request exactly: same time zone as the
+    rollups and bounds (if any) on midnight in that zone.
+    """
+    if str(tz) != str(timezone.get_default_timezone()):
+        return False
+    return all(bound is None or timezone.localtime(bound, tz).time() == datetime.time.min
+               for bound in (start, end))
+
+
+def build_summary(user, bucket='day', tz=None, start=None, end=None, use_rollups=None):
+    """
+    Aggregate `user`'s metrics and meals into `bucket`-sized periods in time zone `tz`.
+
+    Returns a list of per-period dicts ordered oldest first; periods with no data
+    are omitted. `use_rollups` forces (True) or skips (False) the DailyRollup path;
+    by default it is used whenever `rollups_cover()` allows.
+    """
+    tz = tz or timezone.get_default_timezone()
+    if use_rollups is None:
+        use_rollups = rollups_cover(tz, start, end)
+    if use_rollups:
+        return _summary_from_rollups(user, bucket, tz, start, end)
+    return _summary_from_samples(user, bucket, tz, start, end)
+
+
+def _summary_from_rollups(user, bucket, tz, start, end):
+    """
+    Two grouped queries over DailyRollup: totals per period, then each period's last weight.
+    """
+    rollups = DailyRollup.objects.filter(user=user)
+    if start is not None:
+        rollups = rollups.filter(date__gte=timezone.localtime(start, tz).date())
+    if end is not None:
+        rollups = rollups.filter(date__lt=timezone.localtime(end, tz).date())
+
+    periods = (
+        rollups.annotate(period=BUCKETS[bucket]('date'))
+        .values('period')
+        .annotate(
+            steps_total=Sum('steps_sum'),
+            hr_sum=Sum('hr_sum'),
+            hr_count=Sum('hr_count'),
+            heart_rate_min=Min('hr_min'),
+            heart_rate_max=Max('hr_max'),
+            weight_day=Max('date', filter=Q(weight_last__isnull=False)),
+            calories_total=Sum('calories_sum'),
+            meal_count=Sum('meal_count'),
+        )
+        .order_by('period')
+    )
+
+    results = []
+    weight_days = {}
+    for entry in periods:
+        row = _empty_row(entry['period'].isoformat())
+        row.update(
+            steps_total=entry['steps_total'],
+            heart_rate_min=entry['heart_rate_min'],
+            heart_rate_max=entry['heart_rate_max'],
+            calories_total=entry['calories_total'],
+            meal_count=entry['meal_count'],
+        )
+        if entry['hr_count']:
+            row['heart_rate_avg'] = round(entry['hr_sum'] / entry['hr_count'], 1)
+        if entry['weight_day'] is not None:
+            weight_days[entry['weight_day']] = row
+        results.append(row)
+
+    if weight_days:
+        weights = rollups.filter(date__in=list(weight_days)).values_list('date', 'weight_last')
+        for day, weight in weights:
+            weight_days[day]['weight_last'] = str(weight)
+    return results
+
+
+def _summary_from_samples(user, bucket, tz, start, end):
+    """
+    Three grouped queries over the raw rows: metrics, latest weights, meals. Archived
+    metric months (api/archive.py) are aggregated from their blocks and combined.
+    """
+    trunc = BUCKETS[bucket]
+
+    metrics = (
+        _in_range(HealthMetric.objects.filter(user=user), start, end)
+        .annotate(period=trunc('timestamp', tzinfo=tz))
+        .values('period')
+        .annotate(
+            steps_sum=Sum('steps'),
+            hr_sum=Sum('heart_rate'),
+            hr_count=Count('heart_rate'),
+            hr_min=Min('heart_rate'),
+            hr_max=Max('heart_rate'),
+            weight_at=Max('timestamp', filter=Q(weight__isnull=False)),
+        )
+        .order_by('period')
+    )
+    meals = (
+        _in_range(Meal.objects.filter(user=user), start, end)
+        .annotate(period=trunc('timestamp', tzinfo=tz))
+        .values('period')
+        .annotate(calories_total=Sum('calories'), meal_count=Count('id'))
+        .order_by('period')
+    )
+
+    # Per-period metric totals, keyed by the period's first day, in the shape api/archive.py uses
+    totals = {}
+    for entry in metrics:
+        totals[timezone.localtime(entry['period'], tz).date()] = {
+            'steps_sum': entry['steps_sum'], 'hr_sum': entry['hr_sum'] or 0, 'hr_count': entry['hr_count'],
+            'hr_min': entry['hr_min'], 'hr_max': entry['hr_max'],
+            'weight_at': entry['weight_at'], 'weight_last': None, # Looked up below
+        }
+    for period, archived in aggregate_archive(user.id, bucket, tz, start, end).items():
+        totals[period] = merge_aggregates(totals.get(period), archived)
+
+    rows = {}
+    weight_times = {}
+    for period, values in totals.items():
+        row = rows[period] = _empty_row(period)
+        row['steps_total'] = values['steps_sum']
+        row['heart_rate_min'] = values['hr_min']
+        row['heart_rate_max'] = values['hr_max']
+        if values['hr_count']:
+            row['heart_rate_avg'] = round(values['hr_sum'] / values['hr_count'], 1)
+        if values['weight_last'] is not None:
+            row['weight_last'] = str(values['weight_last']) # An archived weight
+        elif values['weight_at'] is not None:
+            weight_times[values['weight_at']] = period
+
+    if weight_times:
+        # "Last weight" per period: the weight logged at that period's latest weighed timestamp
+        weights = (
+            HealthMetric.objects.filter(user=user, timestamp__in=list(weight_times), weight__isnull=False)
+            .order_by('timestamp', 'id')
+            .values_list('timestamp', 'weight')
+        )
+        for timestamp, weight in weights:
+            rows[weight_times[timestamp]]['weight_last'] = str(weight)
+
+    for entry in meals:
+        period = timezone.localtime(entry['period'], tz).date()
+        row = rows.setdefault(period, _empty_row(period))
+        row['calories_total'] = entry['calories_total']
+        row['meal_count'] = entry['meal_count']
+
+    results = []
+    for period in sorted(rows):
+        row = rows[period]
+        row['period'] = period.isoformat()
+        results.append(row)
+    return results
@@ -0,0 +1,205 @@
+# backend/api/sync.py
+
+"""
+Delta sync for clients that keep a local copy of their rows (GET /api/sync/).
+
+Every HealthMetric, Meal and FitnessGoal row carries an indexed `updated_at`,
+and deletes through the API leave a Tombstone. A sync returns, per resource,
+the rows changed and the ids deleted after the client's cursor, oldest change
+first. Each list is read as a keyset range on (updated_at, id) or
+(deleted_at, id), so the cost follows the number of changes, not the history.
+
+The cursor is opaque to clients. It holds one position per list and the time
+it was issued. A sync only reads changes stamped before "now - SETTLE_TIME"
+and a position never moves past that point, so a write that commits a little
+after its timestamp is still ahead of the cursor; changes younger than that
+go out with a later sync. Deliveries are at-least-once. Clients apply rows as
+upserts and deletions as deletes-if-present. Pages hold at most `limit`
+changes per list; `has_more` asks the client to sync again right away.
+
+A first sync (no cursor) sends every row and no deletions. That includes
+the metrics moved to the archive (api/archive.py): once the table rows have
+caught up, the first pass goes on through the archived rows in (timestamp,
+id) order, with its own position in the cursor until it is done. Archiving
+happens in the background and deletes table rows without tombstones, so
+clients keep their copies; a row archived before the first pass reached it
+in the table is sent from the archive instead. Cursors older than the
+tombstone retention (settings.SYNC_TOMBSTONE_RETENTION_DAYS) get 410 and
+must start over.
+"""
+
+import base64
+import binascii
+import datetime
+import json
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from rest_framework import serializers, status
+from rest_framework.exceptions import APIException
+
+from .archive import archived_page
+from .models import FitnessGoal, HealthMetric, Meal, Tombstone
+from .serializers import FitnessGoalSerializer, HealthMetricSerializer, MealSerializer, row_fields, serialize_rows
+
+# Response key -> (model, serializer class)
+SYNC_RESOURCES = {
+    'metrics': (HealthMetric, HealthMetricSerializer),
+    'meals': (Meal, MealSerializer),
+    'goals': (FitnessGoal, FitnessGoalSerializer),
+}
+DELETED = 'deleted' # Cursor position of the tombstone list
+ARCHIVED = 'archived' # Cursor position of the first pass through archived metrics, while it lasts
+
+DEFAULT_LIMIT = 500
+MAX_LIMIT = 5000
+SETTLE_TIME = datetime.timedelta(seconds=5) # Longer than any write transaction
+CURSOR_VERSION = 1
+
+_EPOCH = datetime.datetime(1970, 1, 1, tzinfo=datetime.timezone.utc)
+_MICROSECOND = datetime.timedelta(microseconds=1)
+
+
+class SyncCursorExpired(APIException):
+    status_code = status.HTTP_410_GONE
+    default_detail = 'The sync cursor has expired. Start a full sync without ?since=.'
+    default_code = 'sync_cursor_expired'
+
+
+def _micros(value):
+    return (value - _EPOCH) // _MICROSECOND
+
+
+def _datetime(micros):
+    return _EPOCH + datetime.timedelta(microseconds=micros)
+
+
+def encode_cursor(issued, positions):
+    payload = {
+        'v': CURSOR_VERSION,
+        'at': _micros(issued),
+        'pos': {name: [_micros(position[0]), position[1]] for name, position in positions.items() if position},
+    }
+    return base64.urlsafe_b64encode(json.dumps(payload, separators=(',', ':')).encode()).decode().rstrip('=')
+
+
+def decode_cursor(value):
+    """(issued, {list name: (datetime, pk)}) from a ?since= value; raises ValidationError (400)."""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(value + '=' * (-len(value) % 4)))
+        if payload['v'] != CURSOR_VERSION:
+            raise ValueError(payload['v'])
+        issued = _datetime(int(payload['at']))
+        positions = {name: (_datetime(int(micros)), int(pk)) for name, (micros, pk) in payload['pos'].items()
+                     if name in SYNC_RESOURCES or name in (DELETED, ARCHIVED)}
+    except (ValueError, TypeError, KeyError, AttributeError, OverflowError, binascii.Error):
+        raise serializers.ValidationError({"since": "Invalid sync cursor."})
+    return issued, positions
+
+
+def parse_sync_params(query_params):
+    """Validate ?since= and ?limit=. Returns (issued, positions, limit); issued is None for a first sync."""
+    since = query_params.get('since')
+    issued, positions = decode_cursor(since) if since else (None, {})
+    try:
+        limit = int(query_params.get('limit', DEFAULT_LIMIT))
+    except ValueError:
+        limit = 0
+    if not 1 <= limit <= MAX_LIMIT:
+        raise serializers.ValidationError({"limit": f"Expected an integer from 1 to {MAX_LIMIT}."})
+    return issued, positions, limit
+
+
+def _after(queryset, field, position):
+    """Rows strictly after `position` in (field, id) order."""
+    if position is None:
+        return queryset
+    value, pk = position
+    # (field, id) > (value, pk), written so the planner gets a range bound on `field`
+    return queryset.filter(Q(**{f'{field}__gte': value}), Q(**{f'{field}__gt': value}) | Q(pk__gt=pk))
+
+
+def _advance(position, last, more, settled):
+    """
+    The next position of a list after delivering rows up to `last` ((value, pk) or
+    None); None while the list is still empty. Never past `settled`, so a row
+    stamped just before a commit that lands later is still ahead of the cursor.
+    """
+    if more:
+        furthest = last
+    else:
+        furthest = max(last, position) if last and position else last or position
+    return None if furthest is None else min(furthest, (settled, 0))
+
+
+def _archived_pass(user, position, rows, more, limit):
+    """
+    Add the next archived metrics of a first pass to a page of table `rows`
+    (`more` if the table has more). Archived rows only go out once the table
+    rows have caught up, and only fill what is left of `limit`. Returns the rows
+    and the next position of the pass, None once it is done.
+    """
+    position = position or (_EPOCH, 0) # Before every archived row
+    room = 0 if more else limit - len(rows)
+    if not room:
+        return rows, position
+    archived = archived_page(user.id, room + 1, after=position, reverse=True) # Oldest first
+    if len(archived) <= room:
+        return rows + archived, None
+    archived = archived[:room]
+    return rows + archived, (archived[-1]['timestamp'], archived[-1]['id'])
+
+
+def build_sync(user, issued=None, positions=None, limit=DEFAULT_LIMIT, now=None):
+    """
+    The changes of `user`'s rows after `positions` (from decode_cursor(); a first
+    sync when `issued` is None), at most `limit` per list, with the next cursor.
+    """
+    positions = positions or {}
+    now = now or timezone.now()
+    retention = datetime.timedelta(days=getattr(settings, 'SYNC_TOMBSTONE_RETENTION_DAYS', 90))
+    if issued is not None and issued - SETTLE_TIME < now - retention:
+        raise SyncCursorExpired() # Tombstones it still needs may have been pruned
+    settled = now - SETTLE_TIME
+    data, following, has_more = {}, {}, False
+
+    # Lists are read up to `settled` only: a full page of them then can't move a position past it
+    for name, (model, serializer_class) in SYNC_RESOURCES.items():
+        serializer = serializer_class()
+        rows = list(
+            _after(model.objects.filter(user=user, updated_at__lt=settled), 'updated_at', positions.get(name))
+            .order_by('updated_at', 'id')
+            .values(*row_fields(serializer), 'updated_at')[:limit + 1]
+        )
+        more = len(rows) > limit
+        rows = rows[:limit]
+        last = (rows[-1]['updated_at'], rows[-1]['id']) if rows else None
+        following[name] = _advance(positions.get(name), last, more, settled)
+        if model is HealthMetric and (issued is None or ARCHIVED in positions):
+            rows, archive_position = _archived_pass(user, positions.get(ARCHIVED), rows, more, limit)
+            following[ARCHIVED] = archive_position
+            more = more or archive_position is not None
+        data[name] = {'changed': serialize_rows(serializer, rows, user.username), 'deleted': []}
+        has_more = has_more or more
+
+    if issued is None:
+        # Nothing to delete on a fresh copy: start the tombstone list from here
+        following[DELETED] = (settled, 0)
+    else:
+        keys = {model._meta.model_name: name for name, (model, _) in SYNC_RESOURCES.items()}
+        tombstones = list(
+            _after(Tombstone.objects.filter(user=user, deleted_at__lt=settled), 'deleted_at', positions.get(DELETED))
+            .order_by('deleted_at', 'id')
+            .values_list('deleted_at', 'id', 'resource', 'object_id')[:limit + 1]
+        )
+        more = len(tombstones) > limit
+        tombstones = tombstones[:limit]
+        for _, _, resource, object_id in tombstones:
+            if resource in keys:
+                data[keys[resource]]['deleted'].append(object_id)
+        last = tombstones[-1][:2] if tombstones else None
+        following[DELETED] = _advance(positions.get(DELETED), last, more, settled)
+        has_more = has_more or more
+
+    return {**data, 'cursor': encode_cursor(now, following), 'has_more': has_more}
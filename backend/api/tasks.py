@@ -0,0 +1,332 @@
+# backend/api/tasks.py
+
+"""
+Background tasks kept in the application database, with no broker.
+
+enqueue() inserts a Task row. `manage.py run_worker` claims due tasks and runs
+each one on a worker thread, with the handler registered for its kind through
+@task_handler. Clients poll GET /api/tasks/<id>/ for status, progress and
+result. Exports write their file into a TaskFile, served from
+/api/tasks/<id>/download/.
+
+Claiming: a worker takes the oldest due task. Where the database supports it
+(PostgreSQL) this is SELECT ... FOR UPDATE SKIP LOCKED, so concurrent workers
+neither wait on nor share a row. SQLite has no row locks; there the claim is a
+conditional UPDATE (... WHERE status = 'queued'), and a worker that loses the
+race moves on to the next candidate.
+
+A claimed task holds a lease of settings.TASK_LEASE_SECONDS, which its worker
+renews while the task runs. If the lease runs out, the worker is gone and the
+task is queued again. When a handler raises, the task is retried with
+exponential backoff up to `max_attempts`. TaskFailed fails it at once, for
+input that will not improve. Handlers may therefore run more than once: the
+import resumes from its ImportJob, and the others recompute their result.
+"""
+
+import datetime
+import logging
+import random
+import tempfile
+import zlib
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .archive import DELETE_BATCH_SIZE, archive_user
+from .exports import EXPORT_FORMATS, iter_export
+from .importers import HealthDataImporter, ImportFormatError, import_result
+from .models import Task, TaskFile, TaskFileChunk
+from .rollups import rebuild_user_rollups
+
+logger = logging.getLogger(__name__)
+
+TASK_HANDLERS = {} # kind -> callable(task) returning a JSON-serializable result
+CLAIM_CANDIDATES = 10 # Due tasks tried per claim on databases without SKIP LOCKED
+FILE_CHUNK_SIZE = 256 * 1024 # Compressed bytes per TaskFileChunk row
+FILE_SPOOL_SIZE = 8 * 1024 * 1024 # read_file() moves to a temporary file beyond this many bytes
+EXPORT_PROGRESS_BYTES = 8 * 1024 * 1024 # An export reports progress after every this many bytes
+
+
+class TaskFailed(Exception):
+    """Raised by a handler to fail its task without retrying."""
+
+
+def task_handler(kind):
+    """Register the decorated function as the handler of tasks of `kind`."""
+    def register(func):
+        TASK_HANDLERS[kind] = func
+        return func
+    return register
+
+
+def _lease():
+    return datetime.timedelta(seconds=getattr(settings, 'TASK_LEASE_SECONDS', 300))
+
+
+# --- Queueing ---
+
+def enqueue(kind, user=None, args=None, input_file=None, max_attempts=None):
+    """
+    Queue a task of `kind`. `input_file` is an optional (name, content_type,
+    iterable of byte chunks) the handler reads with read_file(). Returns the Task.
+    """
+    if kind not in TASK_HANDLERS:
+        raise ValueError(f"Unknown task kind '{kind}'.")
+    with transaction.atomic():
+        task = Task.objects.create(
+            user=user, kind=kind, args=args or {},
+            max_attempts=max_attempts or getattr(settings, 'TASK_MAX_ATTEMPTS', 3),
+        )
+        if input_file is not None:
+            store_file(task, TaskFile.ROLE_INPUT, *input_file)
+    logger.info("Queued task %s", task)
+    return task
+
+
+def enqueue_for_users(kind, usernames=(), args=None):
+    """Queue one `kind` task per user (all users, or the named ones). Returns the tasks."""
+    users = User.objects.order_by('id')
+    if usernames:
+        users = users.filter(username__in=usernames)
+    return [enqueue(kind, user=user, args=args) for user in users.iterator(chunk_size=500)]
+
+
+def pending_count(user):
+    """Tasks of `user` not finished yet (queued or running)."""
+    return Task.objects.filter(user=user, status__in=[Task.STATUS_QUEUED, Task.STATUS_RUNNING]).count()
+
+
+def store_file(task, role, name, content_type, chunks):
+    """
+    Gzip byte chunks into the task's `role` file, replacing any earlier one.
+    The gzip stream is written as it is produced, in TaskFileChunk rows of
+    FILE_CHUNK_SIZE bytes. Returns the TaskFile.
+    """
+    TaskFile.objects.filter(task=task, role=role).delete()
+    stored = TaskFile.objects.create(task=task, role=role, name=name[:255], content_type=content_type, size=0)
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) # wbits=31: gzip container
+    pending = bytearray()
+    written = 0 # Chunk rows
+
+    def write(final=False):
+        nonlocal written
+        while len(pending) >= FILE_CHUNK_SIZE or (final and pending):
+            TaskFileChunk.objects.create(file=stored, index=written, data=bytes(pending[:FILE_CHUNK_SIZE]))
+            del pending[:FILE_CHUNK_SIZE]
+            written += 1
+
+    for chunk in chunks:
+        stored.size += len(chunk)
+        pending += compressor.compress(chunk)
+        write()
+    pending += compressor.flush()
+    write(final=True)
+    stored.save(update_fields=['size'])
+    return stored
+
+
+def iter_compressed(stored):
+    """The gzip stream of a TaskFile, one stored chunk in memory at a time."""
+    chunk_ids = list(stored.chunks.order_by('index').values_list('id', flat=True))
+    for chunk_id in chunk_ids:
+        data = TaskFileChunk.objects.filter(pk=chunk_id).values_list('data', flat=True).first()
+        if data is None:
+            return # Deleted with its task since the listing
+        yield bytes(data) # PostgreSQL returns a memoryview
+
+
+def iter_file(stored):
+    """The uncompressed content of a TaskFile, in chunks."""
+    decompressor = zlib.decompressobj(31)
+    for data in iter_compressed(stored):
+        chunk = decompressor.decompress(data)
+        if chunk:
+            yield chunk
+    yield decompressor.flush()
+
+
+def read_file(stored):
+    """
+    The uncompressed content of a TaskFile as a seekable binary file, kept in
+    memory up to FILE_SPOOL_SIZE and in a temporary file beyond. Close it after use.
+    """
+    fileobj = tempfile.SpooledTemporaryFile(max_size=FILE_SPOOL_SIZE)
+    for chunk in iter_file(stored):
+        fileobj.write(chunk)
+    fileobj.seek(0)
+    return fileobj
+
+
+def report_progress(task, **progress):
+    """Merge `progress` into the task's progress, renewing its lease; for handlers of long tasks."""
+    task.progress = {**task.progress, **progress}
+    Task.objects.filter(pk=task.pk, status=Task.STATUS_RUNNING).update(
+        progress=task.progress, lease_expires_at=timezone.now() + _lease(), updated_at=timezone.now())
+
+
+# --- Claiming and running ---
+
+def claim(worker):
+    """Take the oldest due task for `worker` (an id unique to the worker thread). Returns the Task or None."""
+    now = timezone.now()
+    due = Task.objects.filter(status=Task.STATUS_QUEUED, run_at__lte=now).order_by('run_at', 'id')
+    changes = {'status': Task.STATUS_RUNNING, 'worker': worker, 'attempts': F('attempts') + 1,
+               'lease_expires_at': now + _lease(), 'started_at': now, 'updated_at': now}
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            pk = due.select_for_update(skip_locked=True).values_list('pk', flat=True).first()
+            if pk is None:
+                return None
+            Task.objects.filter(pk=pk).update(**changes)
+    else:
+        for pk in due.values_list('pk', flat=True)[:CLAIM_CANDIDATES]:
+            if Task.objects.filter(pk=pk, status=Task.STATUS_QUEUED).update(**changes):
+                break # Ours; otherwise another worker got there first
+        else:
+            return None
+    return Task.objects.select_related('user').get(pk=pk)
+
+
+def retry_delay(attempts):
+    """Backoff before the next attempt after `attempts` failed ones: doubling, capped, with jitter."""
+    base = getattr(settings, 'TASK_RETRY_BACKOFF', 10)
+    delay = min(base * 2 ** (attempts - 1), getattr(settings, 'TASK_RETRY_BACKOFF_MAX', 600))
+    return datetime.timedelta(seconds=delay * random.uniform(0.75, 1.25))
+
+
+def _finish(task, worker, **fields):
+    # Only while this worker holds the task: after an expired lease it may be running elsewhere
+    now = timezone.now()
+    return Task.objects.filter(pk=task.pk, status=Task.STATUS_RUNNING, worker=worker).update(
+        worker='', lease_expires_at=None, updated_at=now, **fields)
+
+
+def run_task(task, worker):
+    """Run a task claimed by `worker` and record the outcome. Returns the new status."""
+    handler = TASK_HANDLERS.get(task.kind)
+    started = timezone.now()
+    try:
+        if handler is None:
+            raise TaskFailed(f"Unknown task kind '{task.kind}'.")
+        result = handler(task)
+    except TaskFailed as e:
+        logger.warning("Task %s failed: %s", task, e)
+        _finish(task, worker, status=Task.STATUS_FAILED, error=str(e), finished_at=timezone.now())
+        return Task.STATUS_FAILED
+    except Exception as e:
+        error = f'{type(e).__name__}: {e}'
+        if task.attempts < task.max_attempts:
+            delay = retry_delay(task.attempts)
+            logger.warning("Task %s attempt %d failed (%s); retrying in %.0f s",
+                           task, task.attempts, error, delay.total_seconds(), exc_info=True)
+            _finish(task, worker, status=Task.STATUS_QUEUED, error=error, run_at=timezone.now() + delay)
+            return Task.STATUS_QUEUED
+        logger.error("Task %s failed after %d attempts: %s", task, task.attempts, error, exc_info=True)
+        _finish(task, worker, status=Task.STATUS_FAILED, error=error, finished_at=timezone.now())
+        return Task.STATUS_FAILED
+    _finish(task, worker, status=Task.STATUS_SUCCEEDED, result=result, error='', finished_at=timezone.now())
+    logger.info("Task %s succeeded in %.1f s", task, (timezone.now() - started).total_seconds())
+    return Task.STATUS_SUCCEEDED
+
+
+def run_pending(worker='inline', limit=None):
+    """Claim and run due tasks in this thread until none is due (or `limit` ran). Returns how many ran."""
+    ran = 0
+    while limit is None or ran < limit:
+        task = claim(worker)
+        if task is None:
+            break
+        run_task(task, worker)
+        ran += 1
+    return ran
+
+
+# --- Upkeep (run periodically by the worker) ---
+
+def renew_leases(pks):
+    """Extend the leases of running tasks, e.g. the ones a worker process is running."""
+    if pks:
+        Task.objects.filter(pk__in=pks, status=Task.STATUS_RUNNING).update(
+            lease_expires_at=timezone.now() + _lease())
+
+
+def requeue_expired():
+    """
+    Queue again the running tasks whose lease ran out (their worker died),
+    or fail them if that was their last attempt. Returns (requeued, failed).
+    """
+    now = timezone.now()
+    expired = Task.objects.filter(status=Task.STATUS_RUNNING, lease_expires_at__lt=now)
+    failed = expired.filter(attempts__gte=F('max_attempts')).update(
+        status=Task.STATUS_FAILED, error='The worker running the task stopped.', worker='',
+        lease_expires_at=None, finished_at=now, updated_at=now)
+    requeued = expired.update(status=Task.STATUS_QUEUED, worker='', lease_expires_at=None, run_at=now,
+                              updated_at=now)
+    if requeued or failed:
+        logger.warning("Tasks of stopped workers: %d queued again, %d failed", requeued, failed)
+    return requeued, failed
+
+
+def prune_finished():
+    """Delete tasks (and their files) finished more than settings.TASK_RETENTION_DAYS ago. Returns the count."""
+    cutoff = timezone.now() - datetime.timedelta(days=getattr(settings, 'TASK_RETENTION_DAYS', 7))
+    deleted, _ = Task.objects.filter(status__in=[Task.STATUS_SUCCEEDED, Task.STATUS_FAILED],
+                                     finished_at__lt=cutoff).delete()
+    return deleted
+
+
+# --- Handlers ---
+
+@task_handler('import')
+def import_file(task):
+    """Import the task's input CSV (api/importers.py). args: resource."""
+    stored = task.files.get(role=TaskFile.ROLE_INPUT)
+
+    def progress(job):
+        report_progress(task, rows_processed=job.rows_processed, rows_imported=job.rows_imported)
+
+    try:
+        with read_file(stored) as fileobj:
+            job = HealthDataImporter(task.user, task.args['resource'], progress=progress).run(
+                fileobj, filename=stored.name)
+    except ImportFormatError as e:
+        raise TaskFailed(str(e))
+    return import_result(job)
+
+
+@task_handler('export')
+def export_file(task):
+    """Write the user's history into the task's output file (api/exports.py). args: resource, format."""
+    resource, fmt = task.args['resource'], task.args['format']
+
+    def chunks():
+        written, reported = 0, 0
+        for chunk in iter_export(task.user, resource, fmt):
+            written += len(chunk)
+            yield chunk
+            if written - reported >= EXPORT_PROGRESS_BYTES:
+                report_progress(task, bytes_written=written)
+                reported = written
+
+    name = f"{resource}-{timezone.localdate().isoformat()}.{fmt}"
+    stored = store_file(task, TaskFile.ROLE_OUTPUT, name, EXPORT_FORMATS[fmt], chunks())
+    return {'file': stored.name, 'size': stored.size}
+
+
+@task_handler('rebuild_rollups')
+def rebuild_rollups_task(task):
+    """Rebuild the task user's DailyRollups (api/rollups.py). args: since, until (ISO dates, optional)."""
+    since, until = (datetime.date.fromisoformat(task.args[key]) if task.args.get(key) else None
+                    for key in ('since', 'until'))
+    return {'days': rebuild_user_rollups(task.user_id, since, until, task.args.get('chunk_days', 90))}
+
+
+@task_handler('archive_metrics')
+def archive_metrics_task(task):
+    """Archive the task user's metric months (api/archive.py). args: before (ISO datetime, a month start), batch_size."""
+    before = datetime.datetime.fromisoformat(task.args['before'])
+    rows, months = archive_user(task.user_id, before, task.args.get('batch_size', DELETE_BATCH_SIZE))
+    return {'rows': rows, 'months': months}
@@ -1,3 +1,1825 @@
-from django.test import TestCase
+import asyncio
+import base64
+import csv
+import datetime
+import gzip
+import io
+import json
+import logging
+import os
+import random
+import shutil
+import tempfile
+import tracemalloc
+import unittest
 
-# Create your tests here.
+import msgpack
+import numpy as np
+from asgiref.sync import async_to_sync, iscoroutinefunction
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.asgi import ASGIHandler
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Value
+from django.http import HttpResponse
+from django.test import AsyncRequestFactory, Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.authentication import BasicAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient, APIRequestFactory, force_authenticate
+
+from .archive import archived_row, columns_from_rows, pack_columns, unpack_columns
+from .async_views import async_read_view
+from .authentication import token_cache_ttl
+from .backends import users_by_email
+from .exports import iter_export
+from .hashing import hashing_pool
+from .importers import HealthDataImporter, ImportFormatError
+from .live import RESYNC, event_stream, hub, live_stream
+from .middleware import StaticFilesMiddleware
+from .models import (
+    HealthMetric, Meal, FitnessGoal, DailyRollup, ImportJob, MetricArchiveBlock, StreamTicket, Task, TaskFile,
+    Tombstone,
+)
+from .request_metrics import _ValueFile
+from .response_cache import response_cache
+from .rollups import compute_rollups, rollup_date
+from .serializers import FitnessGoalSerializer, HealthMetricSerializer, MealSerializer, row_fields, serialize_rows
+from .series import lttb, minmax
+from .structured_logging import JsonFormatter, QueuedStreamHandler, SamplingFilter, reset_request_id, set_request_id
+from .summaries import build_summary
+from .sync import ARCHIVED, SETTLE_TIME, build_sync, decode_cursor, encode_cursor
+from .tasks import (
+    FILE_CHUNK_SIZE, TASK_HANDLERS, TaskFailed, _finish, claim, enqueue, iter_file, read_file, requeue_expired,
+    run_pending, store_file, task_handler,
+)
+from .views import DashboardView, HealthMetricViewSet, StreamTicketView
+
+
+class KeysetPaginationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('pager', 'pager@example.com', 'pw')
+        base = timezone.now().replace(microsecond=0)
+        # Runs of identical timestamps, so many pages start and end inside a tie
+        HealthMetric.objects.bulk_create([
+            HealthMetric(user=cls.user, steps=i, timestamp=base - datetime.timedelta(minutes=i // 7))
+            for i in range(1200)
+        ])
+        cls.expected = list(HealthMetric.objects.filter(user=cls.user)
+                            .order_by('-timestamp', '-id').values_list('id', flat=True))
+
+    def setUp(self):
+        cache.clear() # Data versions: a reused user id must not hit another test's cached responses
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def walk(self, url, link):
+        pages = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200, response.content)
+            pages.append([row['id'] for row in response.json()['results']])
+            url = response.json()[link]
+        return pages
+
+    def test_walks_every_page_without_duplicates_or_gaps(self):
+        pages = self.walk('/api/metrics/?page_size=37', 'next')
+        self.assertEqual(len(pages), -(-len(self.expected) // 37))
+        self.assertEqual([pk for page in pages for pk in page], self.expected)
+
+    def test_ties_are_broken_by_id(self):
+        rows = self.client.get('/api/metrics/?page_size=20').json()['results']
+        for newer, older in zip(rows, rows[1:]):
+            self.assertGreaterEqual(newer['timestamp'], older['timestamp'])
+            if newer['timestamp'] == older['timestamp']:
+                self.assertGreater(newer['id'], older['id'])
+
+    def test_previous_links_walk_back_to_the_first_page(self):
+        forward = self.walk('/api/metrics/?page_size=100', 'next')
+        response = self.client.get('/api/metrics/?page_size=100')
+        self.assertIsNone(response.json()['previous'])
+        for _ in range(len(forward) - 1):
+            response = self.client.get(response.json()['next'])
+        self.assertIsNone(response.json()['next'])
+        backward = self.walk(response.json()['previous'], 'previous')
+        self.assertEqual(backward, forward[-2::-1])
+
+    def test_page_size_is_clamped(self):
+        response = self.client.get('/api/metrics/?page_size=100000')
+        self.assertEqual(len(response.json()['results']), 500)
+        self.assertEqual(len(self.client.get('/api/metrics/').json()['results']), 50)
+
+    def test_malformed_or_tampered_cursor(self):
+        def cursor(position):
+            return base64.b64encode(f'p={position}'.encode()).decode()
+
+        for value in ['not-base64!', cursor('yesterday|1'), cursor('2024-01-01T00:00:00+00:00|x'),
+                      cursor('2024-01-01T00:00:00+00:00'), cursor('|')]:
+            response = self.client.get('/api/metrics/', {'cursor': value})
+            self.assertIn(response.status_code, (400, 404), value)
+
+
+class TimeRangeQueryPlanTests(TestCase):
+    """
+    "Last 7 days" style list queries must be served by the per-user composite
+    indexes: an index range scan in (timestamp, id) order, with no full scan of
+    the user's rows and no separate sort step.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('planner', 'planner@example.com', 'pw')
+        now = timezone.now()
+        HealthMetric.objects.bulk_create([
+            HealthMetric(user=cls.user, steps=i, timestamp=now - datetime.timedelta(hours=i))
+            for i in range(50)
+        ])
+        Meal.objects.bulk_create([
+            Meal(user=cls.user, name='Meal', calories=500, timestamp=now - datetime.timedelta(hours=i))
+            for i in range(50)
+        ])
+        FitnessGoal.objects.bulk_create([
+            FitnessGoal(user=cls.user, goal_text=f'Goal {i}', completed=i % 2 == 0)
+            for i in range(20)
+        ])
+
+    def window_query(self, model):
+        since = timezone.now() - datetime.timedelta(days=7)
+        return (model.objects.filter(user=self.user, timestamp__gte=since)
+                .order_by('-timestamp', '-id')[:51])
+
+    def goals_query(self):
+        return (FitnessGoal.objects.filter(user=self.user, completed=Value(False))
+                .order_by('-created_at', '-id')[:51])
+
+    @unittest.skipUnless(connection.vendor == 'sqlite', "SQLite query plan")
+    def test_sqlite_uses_composite_indexes(self):
+        for query, index in [
+            (self.window_query(HealthMetric), 'metric_user_ts_idx'),
+            (self.window_query(Meal), 'meal_user_ts_idx'),
+            (self.goals_query(), 'goal_user_done_created_idx'),
+        ]:
+            plan = query.explain()
+            self.assertIn(f'USING INDEX {index}', plan)
+            self.assertNotIn('TEMP B-TREE', plan)  # No in-memory sort
+
+    @unittest.skipUnless(connection.vendor == 'postgresql', "PostgreSQL query plan")
+    def test_postgres_uses_composite_indexes(self):
+        with connection.cursor() as cursor:
+            # The fixture is tiny; stop the planner from preferring a seq scan on cost alone
+            cursor.execute('SET enable_seqscan = off')
+        try:
+            for query, index in [
+                (self.window_query(HealthMetric), 'metric_user_ts_idx'),
+                (self.window_query(Meal), 'meal_user_ts_idx'),
+                (self.goals_query(), 'goal_user_done_created_idx'),
+            ]:
+                plan = query.explain()
+                self.assertRegex(plan, rf'Index (Only )?Scan using {index}')
+                self.assertNotIn('Sort', plan)
+        finally:
+            with connection.cursor() as cursor:
+                cursor.execute('RESET enable_seqscan')
+
+    def test_list_filters_by_time_window(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        since = (timezone.now() - datetime.timedelta(hours=9, minutes=30)).isoformat()
+        response = client.get('/api/metrics/', {'from': since, 'page_size': 100})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 10)
+
+        # A plain date as the upper bound covers that whole day
+        response = client.get('/api/metrics/', {'to': timezone.localdate().isoformat(), 'page_size': 100})
+        self.assertEqual(len(response.data['results']), 50)
+
+        response = client.get('/api/meals/', {'to': 'not-a-date'})
+        self.assertEqual(response.status_code, 400)
+
+
+class BatchIngestTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('batcher', 'batcher@example.com', 'pw')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_invalid_items_are_reported_by_index(self):
+        response = self.client.post('/api/meals/batch/', [
+            {'name': 'Breakfast', 'calories': 400},
+            {'name': 'Lunch'},
+            {'name': 'Dinner', 'calories': 700},
+            {'name': 'Snack', 'calories': -5, 'timestamp': 'soon'},
+        ], format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['created'], 2)
+        self.assertEqual(sorted(Meal.objects.filter(user=self.user).values_list('pk', flat=True)),
+                         sorted(response.data['ids']))
+        self.assertEqual([error['index'] for error in response.data['errors']], [1, 3])
+        self.assertIn('calories', response.data['errors'][0]['errors'])
+        self.assertEqual(set(response.data['errors'][1]['errors']), {'calories', 'timestamp'})
+
+    def test_all_invalid_is_rejected(self):
+        response = self.client.post('/api/metrics/batch/', [{'steps': -1}, {'heart_rate': 'fast'}], format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['created'], 0)
+        self.assertEqual(len(response.data['errors']), 2)
+        self.assertFalse(HealthMetric.objects.exists())
+
+    def test_body_must_be_a_list_within_the_cap(self):
+        response = self.client.post('/api/metrics/batch/', {'steps': 10}, format='json')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post('/api/metrics/batch/', [{'steps': 1}] * 5001, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(HealthMetric.objects.exists())
+        response = self.client.post('/api/metrics/batch/', [{'steps': 1}] * 5000, format='json')
+        self.assertEqual(response.data['created'], 5000)
+
+    def test_large_batches_are_inserted_in_chunks(self):
+        items = [{'steps': i, 'timestamp': (timezone.now() - datetime.timedelta(minutes=i)).isoformat()}
+                 for i in range(1234)]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post('/api/metrics/batch/', items, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['created'], 1234)
+        self.assertEqual(len(set(response.data['ids'])), 1234)
+        inserts = [query for query in queries if query['sql'].startswith('INSERT INTO "api_healthmetric"')]
+        # Chunks of 500 rows, or fewer where the backend caps the parameters per statement (SQLite)
+        fields = [field for field in HealthMetric._meta.concrete_fields if not field.primary_key]
+        chunk = min(500, connection.ops.bulk_batch_size(fields, items))
+        self.assertEqual(len(inserts), -(-1234 // chunk))
+        self.assertEqual(HealthMetric.objects.filter(user=self.user).count(), 1234)
+
+
+class MetricsSummaryTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('summer', 'summer@example.com', 'pw')
+        client = APIClient()
+        client.force_authenticate(cls.user)
+        # Through the batch endpoints, so the daily rollups are maintained too
+        client.post('/api/metrics/batch/', [
+            {'steps': 100, 'heart_rate': 60, 'weight': '70.00', 'timestamp': '2024-03-04T23:30:00Z'}, # Monday
+            {'steps': 200, 'heart_rate': 80, 'weight': '71.00', 'timestamp': '2024-03-05T10:00:00Z'},
+            {'steps': 50, 'timestamp': '2024-03-05T12:00:00Z'},
+            {'steps': 300, 'heart_rate': 100, 'timestamp': '2024-03-11T09:00:00Z'},
+            {'steps': 400, 'timestamp': '2024-04-02T09:00:00Z'},
+        ], format='json')
+        client.post('/api/meals/batch/', [
+            {'name': 'Lunch', 'calories': 500, 'timestamp': '2024-03-05T12:00:00Z'},
+            {'name': 'Dinner', 'calories': 300, 'timestamp': '2024-03-05T18:00:00Z'},
+            {'name': 'Breakfast', 'calories': 200, 'timestamp': '2024-04-02T07:00:00Z'},
+        ], format='json')
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def summary(self, **params):
+        response = self.client.get('/api/metrics/summary/', params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return [(row['period'], row['steps_total'], row['heart_rate_avg'], row['weight_last'],
+                 row['calories_total'], row['meal_count']) for row in response.json()['results']]
+
+    def test_buckets(self):
+        self.assertEqual(self.summary(bucket='day'), [
+            ('2024-03-04', 100, 60.0, '70.00', None, 0),
+            ('2024-03-05', 250, 80.0, '71.00', 800, 2),
+            ('2024-03-11', 300, 100.0, None, None, 0),
+            ('2024-04-02', 400, None, None, 200, 1),
+        ])
+        self.assertEqual(self.summary(bucket='week'), [
+            ('2024-03-04', 350, 70.0, '71.00', 800, 2),
+            ('2024-03-11', 300, 100.0, None, None, 0),
+            ('2024-04-01', 400, None, None, 200, 1),
+        ])
+        self.assertEqual(self.summary(bucket='month'), [
+            ('2024-03-01', 650, 80.0, '71.00', 800, 2),
+            ('2024-04-01', 400, None, None, 200, 1),
+        ])
+
+    def test_time_zone_moves_bucket_edges(self):
+        # UTC+9: the Monday 23:30 sample falls on Tuesday, the 18:00 dinner on Wednesday
+        self.assertEqual(self.summary(bucket='day', tz='Asia/Tokyo')[:2], [
+            ('2024-03-05', 350, 70.0, '71.00', 500, 1),
+            ('2024-03-06', None, None, None, 300, 1),
+        ])
+        # UTC-5: 2024-04-02 09:00 UTC is still the 2nd; the month edge holds
+        self.assertEqual(self.summary(bucket='month', tz='America/New_York')[-1],
+                         ('2024-04-01', 400, None, None, 200, 1))
+
+    def test_from_and_to_bounds(self):
+        self.assertEqual([row[0] for row in self.summary(bucket='day', **{'from': '2024-03-05', 'to': '2024-03-11'})],
+                         ['2024-03-05', '2024-03-11'])
+        # Plain dates are read in ?tz=: Tokyo's March 5th starts at 15:00 UTC on the 4th
+        self.assertEqual(self.summary(bucket='day', tz='Asia/Tokyo', **{'from': '2024-03-05', 'to': '2024-03-05'}),
+                         [('2024-03-05', 350, 70.0, '71.00', 500, 1)])
+        # Datetime bounds are half-open: [from, to)
+        self.assertEqual(self.summary(**{'from': '2024-03-05T10:00:00Z', 'to': '2024-03-05T12:00:00Z'}),
+                         [('2024-03-05', 200, 80.0, '71.00', None, 0)])
+
+    def test_invalid_parameters(self):
+        for params in ({'bucket': 'year'}, {'tz': 'Mars/Olympus'}, {'from': 'last week'}, {'to': '2024-13-01'}):
+            response = self.client.get('/api/metrics/summary/', params)
+            self.assertEqual(response.status_code, 400, params)
+            self.assertIn(next(iter(params)), response.json())
+
+
+class DailyRollupConsistencyTests(TestCase):
+    """
+    Rollups maintained incrementally by the viewsets must always equal a full
+    recomputation from the raw rows.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user('roller', 'roller@example.com', 'pw')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.base = timezone.now().replace(hour=12, minute=0, second=0, microsecond=0) - datetime.timedelta(days=10)
+
+    def at(self, hours):
+        return (self.base + datetime.timedelta(hours=hours)).isoformat()
+
+    def assertRollupsMatchRecomputation(self):
+        stored = {
+            rollup.date: {field: getattr(rollup, field) for field in (
+                'steps_sum', 'hr_sum', 'hr_count', 'hr_min', 'hr_max', 'weight_last', 'calories_sum', 'meal_count')}
+            for rollup in DailyRollup.objects.filter(user=self.user)
+        }
+        expected = compute_rollups(self.user.id, rollup_date(self.base) - datetime.timedelta(days=30),
+                                   rollup_date(self.base) + datetime.timedelta(days=30))
+        self.assertEqual(stored, expected)
+        for bucket in ('day', 'week', 'month'):
+            self.assertEqual(build_summary(self.user, bucket, use_rollups=True),
+                             build_summary(self.user, bucket, use_rollups=False))
+
+    def test_rollups_follow_every_write(self):
+        rng = random.Random(7)
+        ids = []
+        for i in range(40):
+            response = self.client.post('/api/metrics/', {
+                'steps': rng.randint(0, 5000),
+                'heart_rate': rng.choice([None, rng.randint(50, 150)]),
+                'weight': rng.choice([None, '70.25', '71.50']),
+                'timestamp': self.at(rng.randint(0, 24 * 5)),
+            }, format='json')
+            self.assertEqual(response.status_code, 201, response.content)
+            ids.append(response.data['id'])
+        self.client.post('/api/meals/batch/', [
+            {'name': 'Lunch', 'calories': rng.randint(100, 900), 'timestamp': self.at(rng.randint(0, 24 * 5))}
+            for _ in range(30)
+        ], format='json')
+        self.assertRollupsMatchRecomputation()
+
+        # Move a sample to another day, change values, delete a few
+        self.client.patch(f'/api/metrics/{ids[0]}/', {'timestamp': self.at(24 * 8), 'heart_rate': 190}, format='json')
+        self.client.patch(f'/api/metrics/{ids[1]}/', {'weight': '99.99'}, format='json')
+        for pk in ids[2:12]:
+            self.assertEqual(self.client.delete(f'/api/metrics/{pk}/').status_code, 204)
+        self.assertRollupsMatchRecomputation()
+
+    def test_rebuild_command_repairs_rollups(self):
+        self.client.post('/api/metrics/batch/', [
+            {'steps': 100 * i, 'heart_rate': 60 + i, 'timestamp': self.at(i * 7)} for i in range(30)
+        ], format='json')
+        DailyRollup.objects.filter(user=self.user).update(steps_sum=0, hr_count=99)
+        DailyRollup.objects.create(user=self.user, date=rollup_date(self.base) - datetime.timedelta(days=5))
+
+        call_command('rebuild_rollups', chunk_days=2, stdout=io.StringIO())
+        self.assertRollupsMatchRecomputation()
+
+
+class DashboardQueryCountTests(TestCase):
+    """
+    /api/dashboard/ must cost one round trip and a fixed number of queries,
+    however much data the user has.
+    """
+
+    # Metrics, today's meals, open goals, two summary queries (rollups).
+    # The token lookup is answered by the authentication cache.
+    EXPECTED_QUERIES = 5
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('dash', 'dash@example.com', 'pw')
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def add_data(self, count):
+        now = timezone.now()
+        with self.captureOnCommitCallbacks(execute=True):
+            self._add_data(now, count)
+
+    def _add_data(self, now, count):
+        self.client.post('/api/metrics/batch/', [
+            {'steps': i, 'heart_rate': 70, 'weight': '70.00',
+             'timestamp': (now - datetime.timedelta(hours=i)).isoformat()}
+            for i in range(count)
+        ], format='json')
+        self.client.post('/api/meals/batch/', [
+            {'name': 'Snack', 'calories': 100, 'timestamp': (now - datetime.timedelta(minutes=i)).isoformat()}
+            for i in range(count)
+        ], format='json')
+        for i in range(count):
+            FitnessGoal.objects.create(user=self.user, goal_text=f'Goal {i}')
+
+    def test_query_count_is_bounded(self):
+        for count in (1, 10, 60):
+            self.add_data(count)
+            with self.assertNumQueries(self.EXPECTED_QUERIES):
+                response = self.client.get('/api/dashboard/')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.data['metrics']), min(HealthMetric.objects.count(), 20))
+            self.assertTrue(response.data['summary']['results'])
+
+
+class FastListSerializationTests(TestCase):
+    """
+    The values() read path (serialize_rows) must render exactly what the
+    model serializers render, byte for byte.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('fastpath', 'fastpath@example.com', 'pw')
+        kolkata = datetime.timezone(datetime.timedelta(hours=5, minutes=30))
+        HealthMetric.objects.bulk_create([
+            HealthMetric(user=cls.user, steps=None, heart_rate=None, weight=None,
+                         timestamp=datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)),
+            HealthMetric(user=cls.user, steps=0, heart_rate=61, weight='70.5',
+                         timestamp=datetime.datetime(2024, 6, 30, 23, 59, 59, 999999, tzinfo=kolkata)),
+            HealthMetric(user=cls.user, steps=12345, heart_rate=None, weight='0.01',
+                         timestamp=datetime.datetime(2024, 3, 31, 1, 30, 0, 123, tzinfo=datetime.timezone.utc)),
+            HealthMetric(user=cls.user, steps=1, heart_rate=200, weight='999.99',
+                         timestamp=datetime.datetime(2023, 12, 31, 18, 0, tzinfo=kolkata)),
+        ])
+        Meal.objects.create(user=cls.user, name='Soupe à l’oignon "gratinée"', calories=0)
+        FitnessGoal.objects.create(user=cls.user, goal_text='Run', completed=True, completed_at=timezone.now())
+        FitnessGoal.objects.create(user=cls.user, goal_text='Swim')
+
+    def test_rows_render_like_the_serializers(self):
+        renderer = JSONRenderer()
+        for model, serializer_class in ((HealthMetric, HealthMetricSerializer), (Meal, MealSerializer),
+                                        (FitnessGoal, FitnessGoalSerializer)):
+            queryset = model.objects.filter(user=self.user).order_by('-id')
+            for tz in ('UTC', 'Asia/Kolkata', 'America/New_York'):
+                with self.subTest(model=model.__name__, tz=tz), timezone.override(tz):
+                    serializer = serializer_class()
+                    fast = serialize_rows(serializer, queryset.values(*row_fields(serializer)), self.user.username)
+                    self.assertEqual(renderer.render(fast),
+                                     renderer.render(serializer_class(queryset, many=True).data))
+
+    def test_list_endpoints_match_the_serializers(self):
+        cache.clear()
+        client = APIClient()
+        client.force_authenticate(self.user)
+        for url, model, serializer_class, ordering in (
+            ('/api/metrics/', HealthMetric, HealthMetricSerializer, '-timestamp'),
+            ('/api/meals/', Meal, MealSerializer, '-timestamp'),
+            ('/api/goals/', FitnessGoal, FitnessGoalSerializer, '-created_at'),
+        ):
+            queryset = model.objects.filter(user=self.user).order_by(ordering, '-id')
+            expected = JSONRenderer().render(serializer_class(queryset, many=True).data)
+            response = client.get(url, HTTP_ACCEPT='application/json')
+            self.assertEqual(response.json()['results'], json.loads(expected))
+
+
+class CachedTokenAuthenticationTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('cached', 'cached@example.com', 'secret-pass-123')
+        self.client = APIClient()
+
+    def login(self):
+        response = self.client.post('/api/login/', {'username': 'cached', 'password': 'secret-pass-123'})
+        self.assertEqual(response.status_code, 200)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Token {response.data['token']}")
+
+    def test_login_prewarms_cache(self):
+        self.login()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get('/api/user/').status_code, 200)
+
+    def test_deleted_token_is_rejected_immediately(self):
+        self.login()
+        self.client.get('/api/user/')
+        Token.objects.filter(user=self.user).delete()
+        self.assertEqual(self.client.get('/api/user/').status_code, 401)
+
+    def test_deactivated_user_is_rejected_immediately(self):
+        self.login()
+        self.client.get('/api/user/')
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get('/api/user/').status_code, 401)
+
+    def test_per_process_cache_keeps_tokens_briefly(self):
+        # Another worker's invalidation can't reach a per-process cache; its entries must expire soon
+        with override_settings(SINGLE_WORKER_PROCESS=False, AUTH_TOKEN_CACHE_TTL=300, AUTH_TOKEN_LOCAL_CACHE_TTL=5):
+            self.assertEqual(token_cache_ttl(), 5)
+        with override_settings(SINGLE_WORKER_PROCESS=True, AUTH_TOKEN_CACHE_TTL=300):
+            self.assertEqual(token_cache_ttl(), 300)
+
+
+class ConditionalGetTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('etag', 'etag@example.com', 'pw')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.metric = HealthMetric.objects.create(user=self.user, steps=10)
+
+    def test_unchanged_poll_is_not_modified_without_queries(self):
+        for url in ('/api/metrics/', f'/api/metrics/{self.metric.pk}/'):
+            etag = self.client.get(url)['ETag']
+            with self.assertNumQueries(0):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response['ETag'], etag)
+
+    def test_write_changes_etag(self):
+        etag = self.client.get('/api/metrics/')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/api/metrics/', {'steps': 20}, format='json')
+        response = self.client.get('/api/metrics/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        # Other resources keep their versions
+        meals_etag = self.client.get('/api/meals/')['ETag']
+        self.assertEqual(self.client.get('/api/meals/', HTTP_IF_NONE_MATCH=meals_etag).status_code, 304)
+
+    @override_settings(SINGLE_WORKER_PROCESS=False)
+    def test_per_process_versions_never_answer_not_modified(self):
+        # Another worker's write can't bump this process's counters: a 304 could be stale
+        etag = self.client.get('/api/metrics/')['ETag']
+        self.assertEqual(self.client.get('/api/metrics/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class ResponseCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('cacher', 'cacher@example.com', 'pw')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        HealthMetric.objects.create(user=self.user, steps=10)
+
+    def test_repeat_request_is_served_from_cache(self):
+        first = self.client.get('/api/metrics/?page_size=5&from=2020-01-01')
+        self.assertEqual(first['X-Cache'], 'MISS')
+        before = response_cache.stats()
+        with self.assertNumQueries(0):
+            # Same query parameters in another order hit the same entry
+            second = self.client.get('/api/metrics/?from=2020-01-01&page_size=5')
+        self.assertEqual(second['X-Cache'], 'HIT')
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(second['ETag'], first['ETag'])
+        self.assertEqual(response_cache.stats()['hits'], before['hits'] + 1)
+
+    def test_write_invalidates_only_affected_entries(self):
+        self.client.get('/api/metrics/')
+        self.client.get('/api/goals/')
+        self.client.get('/api/metrics/summary/')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/api/meals/', {'name': 'Soup', 'calories': 200}, format='json')
+        self.assertEqual(self.client.get('/api/metrics/')['X-Cache'], 'HIT')
+        self.assertEqual(self.client.get('/api/goals/')['X-Cache'], 'HIT')
+        summary = self.client.get('/api/metrics/summary/')
+        self.assertEqual(summary['X-Cache'], 'MISS')
+        self.assertEqual(summary.json()['results'][0]['calories_total'], 200)
+
+    @override_settings(SINGLE_WORKER_PROCESS=False)
+    def test_skipped_while_versions_are_per_process(self):
+        self.client.get('/api/metrics/')
+        response = self.client.get('/api/metrics/')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header('X-Cache'))
+
+
+class StreamingExportTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('exporter', 'exporter@example.com', 'pw')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def add_metrics(self, count):
+        start = timezone.now() - datetime.timedelta(days=400)
+        HealthMetric.objects.bulk_create([
+            HealthMetric(user=self.user, steps=i, heart_rate=60 + i % 50, weight='70.10' if i % 9 == 0 else None,
+                         timestamp=start + datetime.timedelta(minutes=i))
+            for i in range(count)
+        ], batch_size=2000)
+
+    def peak_export_memory(self):
+        tracemalloc.start()
+        try:
+            for _ in iter_export(self.user, 'metrics', 'ndjson', chunk_size=500):
+                pass
+            return tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    def test_peak_memory_does_not_grow_with_history(self):
+        # Scaled down from 10k -> 1M rows to keep the suite fast; the ratio is what matters
+        self.add_metrics(1000)
+        small = self.peak_export_memory()
+        self.add_metrics(19000)
+        large = self.peak_export_memory()
+        self.assertLess(large, small * 1.5)
+
+    def test_csv_and_ndjson_match_list_output(self):
+        self.add_metrics(30)
+        listed = self.client.get('/api/metrics/', {'page_size': 100}).json()['results'][::-1]
+
+        response = self.client.get('/api/export/', {'resource': 'metrics', 'format': 'ndjson'})
+        self.assertEqual(response.status_code, 200)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual([json.loads(line) for line in lines], listed)
+
+        response = self.client.get('/api/export/?resource=metrics&format=csv', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        rows = gzip.decompress(b''.join(response.streaming_content)).decode().splitlines()
+        self.assertEqual(rows[0], 'id,user,weight,steps,heart_rate,timestamp')
+        self.assertEqual(len(rows), 31)
+
+        self.assertEqual(self.client.get('/api/export/', {'format': 'xml'}).status_code, 400)
+
+
+class HealthDataImportTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('importer', 'importer@example.com', 'pw')
+        start = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+        lines = ['Date,Step Count,BPM,Weight (kg),Source']
+        for i in range(25):
+            lines.append(f"{(start + datetime.timedelta(hours=i)).isoformat()},{1000 + i},{60 + i},,watch")
+        lines.append(lines[3]) # Repeated row
+        lines.append('not-a-date,10,60,,watch')
+        self.csv = ('\n'.join(lines) + '\n').encode()
+
+    def test_resume_and_duplicates(self):
+        class Interrupt(Exception):
+            pass
+
+        def stop_after_two_batches(job):
+            if job.rows_processed >= 20:
+                raise Interrupt
+
+        with self.assertRaises(Interrupt):
+            HealthDataImporter(self.user, 'metrics', batch_size=10, progress=stop_after_two_batches).run(io.BytesIO(self.csv))
+        self.assertEqual(HealthMetric.objects.filter(user=self.user).count(), 20)
+
+        job = HealthDataImporter(self.user, 'metrics', batch_size=10).run(io.BytesIO(self.csv))
+        self.assertEqual(job.status, ImportJob.STATUS_COMPLETED)
+        self.assertEqual((job.rows_processed, job.rows_imported, job.rows_duplicate, job.rows_invalid), (27, 25, 1, 1))
+        self.assertEqual(job.errors[-1]['line'], 27)
+        self.assertEqual(HealthMetric.objects.filter(user=self.user).count(), 25)
+        self.assertEqual(DailyRollup.objects.get(user=self.user, date=datetime.date(2024, 1, 1)).steps_sum,
+                         sum(1000 + i for i in range(24)))
+
+    def test_upload_endpoint(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        upload = io.BytesIO(self.csv)
+        upload.name = 'steps.csv'
+        response = client.post('/api/import/?resource=metrics', {'file': upload}, format='multipart')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['rows_imported'], 25)
+
+        upload.seek(0)
+        again = client.post('/api/import/?resource=metrics', {'file': upload}, format='multipart')
+        self.assertEqual(again.json()['id'], response.json()['id']) # Same file: finished job returned as-is
+        self.assertEqual(HealthMetric.objects.filter(user=self.user).count(), 25)
+
+    def test_file_that_is_not_utf8_is_rejected(self):
+        latin1 = ('timestamp,name,calories\n' + ''.join(
+            f'2024-02-{day:02d}T12:00:00Z,Crème brûlée {day},400\n' for day in range(1, 6))).encode('latin-1')
+        client = APIClient()
+        client.force_authenticate(self.user)
+        upload = io.BytesIO(latin1)
+        upload.name = 'meals.csv'
+        response = client.post('/api/import/?resource=meals', {'file': upload}, format='multipart')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("isn't UTF-8", response.json()['file'])
+
+        # In the background the task fails at once instead of being retried
+        task = enqueue('import', user=self.user, args={'resource': 'meals'},
+                       input_file=('meals.csv', 'text/csv', [latin1]))
+        run_pending()
+        task.refresh_from_db()
+        self.assertEqual((task.status, task.attempts), (Task.STATUS_FAILED, 1))
+        self.assertIn("isn't UTF-8", task.error)
+        self.assertFalse(Meal.objects.filter(user=self.user).exists())
+
+        too_long = f"timestamp,name,calories\n2024-02-01T12:00:00Z,{'x' * csv.field_size_limit()}1,400\n"
+        with self.assertRaisesMessage(ImportFormatError, "Line 2: the file isn't valid CSV"):
+            HealthDataImporter(self.user, 'meals').run(io.BytesIO(too_long.encode()))
+
+    def test_unsorted_file_refreshes_rollups_and_notifies_clients(self):
+        cache.clear()
+        client = APIClient()
+        client.force_authenticate(self.user)
+        etag = client.get('/api/metrics/')['ETag']
+        loop = asyncio.new_event_loop()
+        self.addCleanup(loop.close)
+
+        async def subscribe():
+            return hub.subscribe(self.user.pk)
+        subscription = loop.run_until_complete(subscribe())
+        self.addCleanup(hub.unsubscribe, subscription)
+
+        # Alternating between two years: each batch touches days far apart
+        lines = ['timestamp,steps']
+        for i in range(12):
+            year = 2021 if i % 2 else 2024
+            lines.append(f'{year}-03-{1 + i:02d}T08:00:00+00:00,{100 * i}')
+        with self.captureOnCommitCallbacks(execute=True):
+            HealthDataImporter(self.user, 'metrics', batch_size=4).run(io.BytesIO(('\n'.join(lines) + '\n').encode()))
+
+        stored = {rollup.date: rollup.steps_sum for rollup in DailyRollup.objects.filter(user=self.user)}
+        expected = compute_rollups(self.user.id, datetime.date(2021, 1, 1), datetime.date(2024, 12, 31))
+        self.assertEqual(stored, {day: values['steps_sum'] for day, values in expected.items()})
+        self.assertEqual(len(stored), 12)
+
+        loop.run_until_complete(asyncio.sleep(0))
+        events = []
+        while not subscription.queue.empty():
+            events.append(subscription.queue.get_nowait())
+        self.assertEqual([(event['resource'], event['action'], len(event['ids'])) for event in events],
+                         [('metrics', 'created', 4)] * 3)
+        self.assertEqual(client.get('/api/metrics/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class AsyncReadPathTests(TestCase):
+    """The ASGI read path must answer exactly like the sync views."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('async', 'async@example.com', 'pw')
+        cls.token = Token.objects.create(user=cls.user)
+        now = timezone.now()
+        HealthMetric.objects.bulk_create([
+            HealthMetric(user=cls.user, steps=i, heart_rate=70, timestamp=now - datetime.timedelta(hours=i))
+            for i in range(30)
+        ])
+        Meal.objects.create(user=cls.user, name='Soup', calories=300, timestamp=now)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def async_get(self, view, path, token=True, **kwargs):
+        headers = {'Authorization': f'Token {self.token.key}'} if token else {}
+        request = AsyncRequestFactory().get(path, headers=headers)
+        return async_to_sync(async_read_view(view))(request, **kwargs)
+
+    def test_responses_match_sync_views(self):
+        metric_list = HealthMetricViewSet.as_view({'get': 'list', 'post': 'create'})
+        metric_detail = HealthMetricViewSet.as_view({'get': 'retrieve'})
+        pk = HealthMetric.objects.filter(user=self.user).latest('timestamp').pk
+        cases = [
+            (metric_list, '/api/metrics/?page_size=5', {}),
+            (metric_list, '/api/metrics/?from=not-a-date', {}),
+            (metric_detail, f'/api/metrics/{pk}/', {'pk': str(pk)}),
+            (metric_detail, '/api/metrics/999999/', {'pk': '999999'}),
+            (DashboardView.as_view(), '/api/dashboard/?days=7', {}),
+        ]
+        for view, path, kwargs in cases:
+            with self.subTest(path=path):
+                expected = self.client.get(path)
+                response_cache.cache.clear() # Build the response again, on the async path
+                response = self.async_get(view, path, **kwargs)
+                self.assertEqual(response.status_code, expected.status_code)
+                self.assertEqual(json.loads(response.content), expected.json())
+                self.assertEqual(response.get('ETag'), expected.get('ETag'))
+
+    def test_authentication_and_caching(self):
+        metric_list = HealthMetricViewSet.as_view({'get': 'list'})
+        response = self.async_get(metric_list, '/api/metrics/', token=False)
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response['WWW-Authenticate'], 'Token')
+
+        self.assertEqual(self.async_get(metric_list, '/api/metrics/')['X-Cache'], 'MISS')
+        with self.assertNumQueries(0): # Token, version and response all come from the cache
+            self.assertEqual(self.async_get(metric_list, '/api/metrics/')['X-Cache'], 'HIT')
+
+    def test_middleware_chain_stays_async(self):
+        static_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, static_dir)
+        with open(os.path.join(static_dir, 'app.css'), 'w') as f:
+            f.write('body { color: red; }')
+
+        # One sync-only middleware would make Django run the whole chain in a worker thread.
+        # Django logs each adaptation when DEBUG is on.
+        with self.assertLogs('django.request', 'DEBUG') as logs, override_settings(DEBUG=True, STATIC_ROOT=static_dir):
+            ASGIHandler()
+            logging.getLogger('django.request').debug("Middleware loaded")
+        self.assertEqual([line for line in logs.output if 'adapted for middleware' in line], [])
+
+        # Static files are still served on the async path
+
+        async def get_response(request):
+            return HttpResponse('view')
+
+        with override_settings(STATIC_ROOT=static_dir, WHITENOISE_AUTOREFRESH=False):
+            middleware = StaticFilesMiddleware(get_response)
+        self.assertTrue(iscoroutinefunction(middleware))
+        response = async_to_sync(middleware)(AsyncRequestFactory().get('/static/app.css'))
+        self.assertEqual(b''.join(response.streaming_content), b'body { color: red; }')
+        self.assertEqual(async_to_sync(middleware)(AsyncRequestFactory().get('/api/metrics/')).content, b'view')
+
+    def test_uses_the_views_authentication_classes(self):
+        basic_only = HealthMetricViewSet.as_view({'get': 'list'}, authentication_classes=[BasicAuthentication])
+        response = self.async_get(basic_only, '/api/metrics/') # A token is no credential for this view
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response['WWW-Authenticate'], 'Basic realm="api"')
+
+        credentials = base64.b64encode(b'async:pw').decode()
+        request = AsyncRequestFactory().get('/api/metrics/', headers={'Authorization': f'Basic {credentials}'})
+        response = async_to_sync(async_read_view(basic_only))(request)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(json.loads(response.content)['results']), 30)
+
+
+class LoadToolingTests(TestCase):
+
+    def test_seed_load_data(self):
+        call_command('seed_load_data', users=3, metrics_per_user=500, meals_per_user=60, goals_per_user=4,
+                     days=30, prefix='seedtest', stdout=io.StringIO())
+        users = User.objects.filter(username__startswith='seedtest-')
+        self.assertEqual(users.count(), 3)
+        self.assertEqual(Token.objects.filter(user__in=users).count(), 3)
+        self.assertEqual(HealthMetric.objects.filter(user__in=users).count(), 1500)
+        self.assertEqual(Meal.objects.filter(user__in=users).count(), 180)
+        self.assertEqual(FitnessGoal.objects.filter(user__in=users).count(), 12)
+        self.assertTrue(users[0].check_password('load-test-password'))
+
+        # Rollups were rebuilt for the generated history
+        user = users[0]
+        self.assertEqual(sum(DailyRollup.objects.filter(user=user).values_list('meal_count', flat=True)), 60)
+
+        with self.assertRaises(CommandError):
+            call_command('seed_load_data', users=1, prefix='seedtest', stdout=io.StringIO())
+
+    def test_bench_endpoints_writes_results(self):
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'results.json')
+            call_command('bench_endpoints', users=2, metrics_per_user=50, meals_per_user=10, goals_per_user=2,
+                         requests=2, auth_requests=1, output=output, stdout=io.StringIO())
+            with open(output) as f:
+                report = json.load(f)
+        self.assertEqual(report['meta']['data']['users'], 2)
+        self.assertIn('metrics.create', report['routes'])
+        self.assertTrue(all(route['errors'] == 0 for route in report['routes'].values()), report['routes'])
+        self.assertFalse(User.objects.filter(username__startswith='bench-endpoints-').exists())
+
+
+@override_settings(REQUEST_TIMING_SAMPLE_RATE=1.0)
+class RequestTimingMiddlewareTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        response_cache.cache.clear()
+        self.user = User.objects.create_user('timing', 'timing@example.com', 'password')
+        self.token = Token.objects.create(user=self.user)
+        HealthMetric.objects.create(user=self.user, steps=100, timestamp=timezone.now())
+
+    def get(self, path):
+        client = APIClient() # A new handler, so the middleware picks up overridden settings
+        client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        return client.get(path)
+
+    def test_server_timing_header(self):
+        response = self.get('/api/metrics/')
+        self.assertEqual(response.status_code, 200)
+        metrics = {part.split(';')[0]: part for part in response['Server-Timing'].split(', ')}
+        self.assertIn('total', metrics)
+        self.assertRegex(metrics['db'], r'^db;dur=[\d.]+;desc="[1-9]\d* queries"$')
+        self.assertIn('auth', metrics)
+        self.assertIn('serialize', metrics)
+
+    def test_unsampled_requests_have_no_header(self):
+        with self.settings(REQUEST_TIMING_SAMPLE_RATE=0.0):
+            response = self.get('/api/metrics/')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Server-Timing', response)
+
+    def test_repeated_queries_and_slow_requests_are_logged(self):
+        with self.settings(REQUEST_TIMING_SLOW_MS=0, REQUEST_TIMING_REPEATED_QUERY_THRESHOLD=0):
+            with self.assertLogs('api.middleware', 'WARNING') as logs:
+                self.get('/api/metrics/')
+        self.assertTrue(any('Slow request GET /api/metrics/' in line for line in logs.output))
+        self.assertTrue(any('Possible N+1 in GET /api/metrics/' in line for line in logs.output))
+
+    def test_batched_inserts_are_not_reported_as_repeated_queries(self):
+        items = [{'steps': i, 'timestamp': (timezone.now() - datetime.timedelta(minutes=i)).isoformat()}
+                 for i in range(1200)]
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        with self.settings(REQUEST_TIMING_SLOW_MS=60000, REQUEST_TIMING_REPEATED_QUERY_THRESHOLD=1):
+            with self.assertNoLogs('api.middleware', 'WARNING'):
+                response = client.post('/api/metrics/batch/', items, format='json')
+        self.assertEqual(response.status_code, 201)
+
+
+class PrometheusMetricsTests(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        overridden = self.settings(REQUEST_METRICS_DIR=self.directory)
+        overridden.enable()
+        self.addCleanup(overridden.disable)
+        self.admin = User.objects.create_user('metrics-admin', 'admin@example.com', 'password', is_staff=True)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=self.admin).key}')
+
+    def test_counts_and_histograms_in_prometheus_format(self):
+        self.client.get('/api/metrics/')
+        self.client.get('/api/metrics/')
+        self.client.get('/api/meals/999999/')
+        self.client.get('/api/no-such-route/')
+
+        response = self.client.get('/api/_metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        lines = response.content.decode().splitlines()
+        self.assertIn('http_requests_total{route="HealthMetricViewSet.list",method="GET",status="200"} 2', lines)
+        self.assertIn('http_requests_total{route="MealViewSet.retrieve",method="GET",status="404"} 1', lines)
+        self.assertIn('http_requests_total{route="unmatched",method="GET",status="404"} 1', lines)
+        self.assertIn('http_request_duration_seconds_bucket{route="HealthMetricViewSet.list",method="GET",le="+Inf"} 2',
+                      lines)
+        self.assertIn('http_request_duration_seconds_count{route="HealthMetricViewSet.list",method="GET"} 2', lines)
+
+    def test_sums_every_worker_file(self):
+        # Another worker's file, as if written by a different gunicorn process
+        other = _ValueFile(os.path.join(self.directory, '999999.db'))
+        other.add(('requests', 'RegisterView', 'POST', '201'), 3)
+        other.add(('bucket', 'RegisterView', 'POST', '0.5'), 3)
+        other.add(('seconds', 'RegisterView', 'POST'), 0.9)
+        self.client.post('/api/register/', {'username': 'new', 'email': 'new@example.com',
+                                            'password': 'Str0ng-pass!', 'password2': 'Str0ng-pass!'})
+
+        lines = self.client.get('/api/_metrics').content.decode().splitlines()
+        self.assertIn('http_requests_total{route="RegisterView",method="POST",status="201"} 4', lines)
+        self.assertIn('http_request_duration_seconds_count{route="RegisterView",method="POST"} 4', lines)
+
+    def test_admin_only(self):
+        user = User.objects.create_user('metrics-user', 'user@example.com', 'password')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {Token.objects.create(user=user).key}')
+        self.assertEqual(self.client.get('/api/_metrics').status_code, 403)
+        self.client.credentials()
+        self.assertEqual(self.client.get('/api/_metrics').status_code, 401)
+
+
+class StructuredLoggingTests(TestCase):
+
+    def test_request_id_header(self):
+        client = APIClient()
+        generated = client.get('/api/metrics/')['X-Request-ID']
+        self.assertRegex(generated, r'^[0-9a-f]{32}$')
+        self.assertEqual(client.get('/api/metrics/', HTTP_X_REQUEST_ID='abc-123')['X-Request-ID'], 'abc-123')
+        # Anything that doesn't look like an ID is replaced
+        self.assertNotEqual(client.get('/api/metrics/', HTTP_X_REQUEST_ID='a b\x00')['X-Request-ID'], 'a b\x00')
+
+    def test_queued_json_lines_carry_the_request_id(self):
+        stream = io.StringIO()
+        handler = QueuedStreamHandler(stream)
+        handler.setFormatter(JsonFormatter())
+        logger = logging.getLogger('api.tests.structured')
+        logger.addHandler(handler)
+        logger.propagate = False
+        self.addCleanup(setattr, logger, 'propagate', True)
+        self.addCleanup(logger.removeHandler, handler)
+
+        token = set_request_id('req-1')
+        try:
+            logger.warning("Imported %d rows for %s", 3, 'alice')
+        finally:
+            reset_request_id(token)
+        logger.warning("Outside a request")
+        handler.close() # Waits for the listener thread to write everything
+
+        first, second = [json.loads(line) for line in stream.getvalue().splitlines()]
+        self.assertEqual(first['message'], 'Imported 3 rows for alice')
+        self.assertEqual(first['request_id'], 'req-1')
+        self.assertEqual(first['level'], 'WARNING')
+        self.assertEqual(first['logger'], 'api.tests.structured')
+        self.assertIsNone(second['request_id'])
+
+    def test_queued_records_are_prepared_on_the_logging_thread(self):
+        stream = io.StringIO()
+        handler = QueuedStreamHandler(stream)
+        handler.setFormatter(JsonFormatter())
+        logger = logging.getLogger('api.tests.structured')
+        logger.addHandler(handler)
+        logger.propagate = False
+        self.addCleanup(setattr, logger, 'propagate', True)
+        self.addCleanup(logger.removeHandler, handler)
+
+        rows = ['a']
+        try:
+            raise ValueError('bad row')
+        except ValueError:
+            logger.exception("Rows so far: %s", rows)
+        rows.append('b') # Changed after logging; the queued line must not see it
+        handler.close()
+
+        line = json.loads(stream.getvalue())
+        self.assertEqual(line['message'], "Rows so far: ['a']")
+        self.assertIn('ValueError: bad row', line['exception'])
+
+    def test_dropped_records_are_reported(self):
+        stream = io.StringIO()
+        handler = QueuedStreamHandler(stream, queue_size=2, report_interval=0)
+        handler.setFormatter(JsonFormatter())
+        handler.listener.stop() # Nothing is taken off the queue until close()
+        handler.listener = None
+        logger = logging.getLogger('api.tests.structured')
+        logger.addHandler(handler)
+        logger.propagate = False
+        self.addCleanup(setattr, logger, 'propagate', True)
+        self.addCleanup(logger.removeHandler, handler)
+
+        for i in range(5):
+            logger.warning("Record %d", i)
+        self.assertEqual(handler.dropped, 3)
+        handler._start()
+        handler.close()
+
+        lines = [json.loads(line) for line in stream.getvalue().splitlines()]
+        self.assertEqual([line['message'] for line in lines],
+                         ['Record 0', 'Record 1', 'Dropped 3 log records: the log queue was full'])
+        self.assertEqual(lines[-1]['logger'], 'api.structured_logging')
+        self.assertEqual(lines[-1]['level'], 'WARNING')
+
+    def test_sampling_filter(self):
+        sampling = SamplingFilter('api.views=0, api=1')
+        record = lambda name, level: logging.LogRecord(name, level, __file__, 1, 'message', (), None)
+        self.assertFalse(sampling.filter(record('api.views', logging.DEBUG)))
+        self.assertFalse(sampling.filter(record('api.views.child', logging.INFO)))
+        self.assertTrue(sampling.filter(record('api.views', logging.WARNING))) # Never sampled away
+        self.assertTrue(sampling.filter(record('api.importers', logging.DEBUG)))
+        self.assertTrue(sampling.filter(record('django.request', logging.DEBUG)))
+
+
+class PasswordHashingAdmissionTests(TestCase):
+
+    def setUp(self):
+        cache.clear() # Throttle counters
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        overridden = self.settings(PASSWORD_HASHING_LOCK_DIR=directory, PASSWORD_HASHING_MAX_CONCURRENT=1,
+                                   PASSWORD_HASHING_RETRY_AFTER=2)
+        overridden.enable()
+        self.addCleanup(overridden.disable)
+        User.objects.create_user('hasher', 'hasher@example.com', 'secret-pass-123')
+        self.client = APIClient()
+
+    def login(self, password='secret-pass-123'):
+        return self.client.post('/api/login/', {'username': 'hasher', 'password': password})
+
+    def test_busy_pool_fails_fast_with_retry_after(self):
+        slot = hashing_pool._acquire_slot() # Another worker is hashing
+        self.assertIsNotNone(slot)
+        try:
+            response = self.login()
+            self.assertEqual(response.status_code, 429)
+            self.assertEqual(response['Retry-After'], '2')
+            response = self.client.post('/api/register/', {'username': 'late', 'email': 'late@example.com',
+                                                           'password': 'Str0ng-pass!', 'password2': 'Str0ng-pass!'})
+            self.assertEqual(response.status_code, 429)
+            self.assertFalse(User.objects.filter(username='late').exists())
+        finally:
+            os.close(slot)
+
+        self.assertEqual(self.login().status_code, 200)
+        self.assertEqual(self.login(password='wrong').status_code, 400)
+
+    @override_settings(STORAGES={**settings.STORAGES, 'staticfiles': { # No collectstatic manifest in tests
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'}})
+    def test_busy_pool_fails_admin_login_without_an_error(self):
+        User.objects.filter(username='hasher').update(is_staff=True)
+        client = Client()
+        slot = hashing_pool._acquire_slot()
+        try:
+            response = client.post('/admin/login/', {'username': 'hasher', 'password': 'secret-pass-123'})
+        finally:
+            os.close(slot)
+        self.assertEqual(response.status_code, 200) # The form again, with an error; not a 500
+        self.assertTrue(response.context['form'].errors)
+
+        response = client.post('/admin/login/', {'username': 'hasher', 'password': 'secret-pass-123'})
+        self.assertEqual(response.status_code, 302)
+
+    def test_per_username_throttle(self):
+        rates = {'auth_ip': None, 'auth_username': '2/minute'}
+        with self.settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': rates}):
+            self.assertEqual(self.login(password='wrong').status_code, 400)
+            self.assertEqual(self.login(password='wrong').status_code, 400)
+            response = self.login()
+            self.assertEqual(response.status_code, 429)
+            self.assertIn('Retry-After', response)
+            # Other usernames are not affected
+            response = self.client.post('/api/login/', {'username': 'someone-else', 'password': 'x'})
+            self.assertEqual(response.status_code, 400)
+
+
+class EmailIdentityTests(TestCase):
+
+    def setUp(self):
+        cache.clear() # Throttle counters
+        self.user = User.objects.create_user('mailer', 'Mailer@Example.com', 'secret-pass-123')
+        self.client = APIClient()
+
+    def register(self, username, email):
+        return self.client.post('/api/register/', {'username': username, 'email': email,
+                                                   'password': 'Str0ng-pass!', 'password2': 'Str0ng-pass!'})
+
+    def test_registration_rejects_email_in_another_case(self):
+        response = self.register('mailer2', 'mailer@example.COM')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('email', response.data)
+        self.assertEqual(self.register('mailer3', 'other@example.com').status_code, 201)
+
+    def test_database_enforces_unique_lowercased_email(self):
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            User.objects.create_user('copy', 'MAILER@example.com', 'pw')
+        # Blank emails are not covered by the rule
+        User.objects.create_user('blank1', '', 'pw')
+        User.objects.create_user('blank2', '', 'pw')
+
+    def test_login_with_username_or_email(self):
+        for login in ('mailer', 'mailer@example.com', 'MAILER@EXAMPLE.COM'):
+            with self.subTest(login=login):
+                response = self.client.post('/api/login/', {'username': login, 'password': 'secret-pass-123'})
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.data['user_id'], self.user.pk)
+        response = self.client.post('/api/login/', {'username': 'nobody@example.com', 'password': 'secret-pass-123'})
+        self.assertEqual(response.status_code, 400)
+
+    @unittest.skipUnless(connection.vendor == 'sqlite', "SQLite query plan")
+    def test_email_lookup_uses_the_index(self):
+        plan = users_by_email('mailer@example.com').explain()
+        self.assertIn('USING INDEX user_email_lower_uniq', plan)
+
+    @unittest.skipUnless(connection.vendor == 'postgresql', "PostgreSQL query plan")
+    def test_postgres_email_lookup_uses_the_index(self):
+        with connection.cursor() as cursor:
+            cursor.execute('SET enable_seqscan = off')
+        try:
+            self.assertRegex(users_by_email('mailer@example.com').explain(), r'Index (Only )?Scan using user_email_lower_uniq')
+        finally:
+            with connection.cursor() as cursor:
+                cursor.execute('RESET enable_seqscan')
+
+
+class MetricSeriesTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('charter', 'charter@example.com', 'pw')
+        cls.start = timezone.now() - datetime.timedelta(minutes=2000)
+        HealthMetric.objects.bulk_create([
+            HealthMetric(user=cls.user, heart_rate=180 if i == 1234 else 60 + i % 7,
+                         steps=None if i % 2 else i, weight=70.25 if i % 500 == 0 else None,
+                         timestamp=cls.start + datetime.timedelta(minutes=i))
+            for i in range(2000)
+        ])
+
+    def setUp(self):
+        response_cache.cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_lttb_keeps_ends_and_peaks(self):
+        x = np.arange(10000, dtype=np.float64)
+        y = np.sin(x / 500)
+        y[4321] = 50
+        indices = lttb(x, y, 100)
+        self.assertEqual(len(indices), 100)
+        self.assertEqual((indices[0], indices[-1]), (0, 9999))
+        self.assertTrue(np.all(np.diff(indices) > 0))
+        self.assertIn(4321, indices)
+        np.testing.assert_array_equal(lttb(x[:50], y[:50], 100), np.arange(50)) # Fewer samples than points
+
+    def test_minmax_keeps_every_extreme(self):
+        y = np.tile([1.0, 5.0, 3.0, -2.0], 1000)
+        indices = minmax(np.arange(len(y)), y, 50)
+        self.assertLessEqual(len(indices), 50)
+        self.assertTrue(np.all(np.diff(indices) > 0))
+        self.assertEqual((y[indices].min(), y[indices].max()), (-2.0, 5.0))
+
+    def test_series_size_depends_on_points(self):
+        response = self.client.get('/api/metrics/series/', {'field': 'heart_rate', 'points': 100})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['samples'], 2000)
+        self.assertEqual(len(response.data['results']), 100)
+        self.assertIn(180, [point['value'] for point in response.data['results']]) # The spike survives
+        first = HealthMetric.objects.filter(user=self.user).earliest('timestamp')
+        self.assertEqual(response.data['results'][0]['timestamp'], HealthMetricSerializer(first).data['timestamp'])
+
+        # Nulls are skipped, and ?from= narrows the range
+        response = self.client.get('/api/metrics/series/', {
+            'field': 'steps', 'method': 'minmax', 'points': 3000,
+            'from': (self.start + datetime.timedelta(minutes=1000)).isoformat(),
+        })
+        self.assertEqual(response.data['samples'], 500)
+        self.assertEqual(len(response.data['results']), 500)
+
+        response = self.client.get('/api/metrics/series/', {'field': 'weight'})
+        self.assertEqual([point['value'] for point in response.data['results']], [70.25] * 4)
+
+    def test_invalid_parameters(self):
+        for params in ({}, {'field': 'calories'}, {'field': 'steps', 'points': 2},
+                       {'field': 'steps', 'points': 'many'}, {'field': 'steps', 'method': 'average'}):
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get('/api/metrics/series/', params).status_code, 400)
+
+
+class MetricArchiveTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('archivist', 'archivist@example.com', 'pw')
+        start = timezone.now() - datetime.timedelta(days=150)
+        metrics, timestamp = [], start
+        for i in range(500):
+            if i % 10: # Every tenth row shares the previous timestamp: ties are ordered by id
+                timestamp += datetime.timedelta(hours=7, microseconds=i)
+            metrics.append(HealthMetric(user=cls.user, timestamp=timestamp,
+                                        steps=None if i % 3 == 0 else i * 11,
+                                        heart_rate=None if i % 4 == 0 else 55 + i % 50,
+                                        weight=None if i % 6 else 70 + i % 9 / 4))
+        HealthMetric.objects.bulk_create(metrics)
+        call_command('rebuild_rollups', stdout=io.StringIO())
+
+    def setUp(self):
+        cache.clear()
+        response_cache.cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def snapshot(self):
+        """Everything the read endpoints return for the user's metrics."""
+        response_cache.cache.clear()
+        data = {}
+        for name, params in (('all', {}), ('range', {'from': (timezone.now() - datetime.timedelta(days=120)).date(),
+                                                     'to': (timezone.now() - datetime.timedelta(days=40)).date()})):
+            pages, url, params = [], '/api/metrics/', {**params, 'page_size': 7}
+            while url:
+                response = self.client.get(url, params)
+                pages.append(response.data['results'])
+                url, params = response.data['next'], None
+            # And back again from the last page
+            url, previous = response.data['previous'], []
+            while url:
+                response = self.client.get(url)
+                previous.append(response.data['results'])
+                url = response.data['previous']
+            self.assertEqual(previous, pages[-2::-1])
+            data[name] = pages
+        data['export'] = b''.join(iter_export(self.user, 'metrics', 'ndjson', chunk_size=50))
+        for bucket, tz in (('day', ''), ('week', 'America/New_York'), ('month', 'Asia/Kolkata')):
+            data[f'summary-{bucket}'] = self.client.get('/api/metrics/summary/', {'bucket': bucket, 'tz': tz}).data
+        data['samples'] = build_summary(self.user, bucket='day', use_rollups=False)
+        for field in ('steps', 'heart_rate', 'weight'):
+            data[f'series-{field}'] = self.client.get('/api/metrics/series/', {'field': field, 'points': 40}).data
+        return data
+
+    def test_pack_round_trip(self):
+        rows = list(HealthMetric.objects.filter(user=self.user)
+                    .values_list('id', 'timestamp', 'steps', 'heart_rate', 'weight'))
+        columns = columns_from_rows(rows)
+        unpacked = unpack_columns(pack_columns(columns))
+        for expected, actual in zip(columns, unpacked):
+            np.testing.assert_array_equal(expected, actual)
+        self.assertEqual(len(unpack_columns(pack_columns(columns_from_rows([]))).ids), 0)
+
+    def test_reads_are_unchanged_by_archiving(self):
+        before = self.snapshot()
+        late = HealthMetric.objects.filter(user=self.user).order_by('timestamp', 'id')[20]
+        late_id = late.id
+        late.delete() # Written into its month after the month was archived, below
+
+        output = io.StringIO()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('archive_metrics', older_than=60, batch_size=50, stdout=output)
+        blocks = MetricArchiveBlock.objects.filter(user=self.user)
+        self.assertGreaterEqual(blocks.count(), 2)
+        archived = sum(blocks.values_list('row_count', flat=True))
+        self.assertEqual(HealthMetric.objects.filter(user=self.user).count(), 499 - archived)
+        self.assertIn(f"archivist: {archived} metrics", output.getvalue())
+
+        HealthMetric.objects.create(id=late_id, user=self.user, timestamp=late.timestamp,
+                                    steps=late.steps, heart_rate=late.heart_rate, weight=late.weight)
+        call_command('rebuild_rollups', stdout=io.StringIO()) # Rollups recomputed over the archive
+        self.assertEqual(self.snapshot(), before)
+
+        # Archived rows are still addressable by id
+        oldest = before['all'][-1][-1]
+        self.assertFalse(HealthMetric.objects.filter(pk=oldest['id']).exists())
+        self.assertEqual(self.client.get(f"/api/metrics/{oldest['id']}/").json(), oldest)
+        self.assertEqual(self.client.get('/api/metrics/999999/').status_code, 404)
+
+        # A second run folds the late row into its month's block
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('archive_metrics', older_than=60, stdout=io.StringIO())
+        self.assertFalse(HealthMetric.objects.filter(pk=late_id).exists())
+        self.assertEqual(sum(blocks.values_list('row_count', flat=True)), archived + 1)
+        self.assertEqual(self.snapshot(), before)
+
+        # The ASGI read path merges the archive the same way
+        token = Token.objects.create(user=self.user)
+        request = AsyncRequestFactory().get('/api/metrics/?page_size=500', headers={'Authorization': f'Token {token.key}'})
+        response_cache.cache.clear()
+        response = async_to_sync(async_read_view(HealthMetricViewSet.as_view({'get': 'list'})))(request)
+        self.assertEqual(json.loads(response.content)['results'], [row for page in before['all'] for row in page])
+        request = AsyncRequestFactory().get(f"/api/metrics/{oldest['id']}/", headers={'Authorization': f'Token {token.key}'})
+        view = async_read_view(HealthMetricViewSet.as_view({'get': 'retrieve'}))
+        self.assertEqual(json.loads(async_to_sync(view)(request, pk=str(oldest['id'])).content), oldest)
+
+    def test_archived_rows_can_be_updated_and_deleted(self):
+        updated, deleted = HealthMetric.objects.filter(user=self.user).order_by('timestamp', 'id')[:2]
+        call_command('archive_metrics', older_than=60, stdout=io.StringIO())
+        blocks = MetricArchiveBlock.objects.filter(user=self.user)
+        archived = sum(blocks.values_list('row_count', flat=True))
+
+        response = self.client.patch(f'/api/metrics/{updated.pk}/', {'steps': 4321}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['steps'], 4321)
+        self.assertEqual(HealthMetric.objects.get(pk=updated.pk).steps, 4321) # Back in the table
+        self.assertEqual(self.client.delete(f'/api/metrics/{deleted.pk}/').status_code, 204)
+        self.assertTrue(Tombstone.objects.filter(resource='healthmetric', object_id=deleted.pk).exists())
+
+        self.assertEqual(sum(blocks.values_list('row_count', flat=True)), archived - 2)
+        self.assertIsNone(archived_row(self.user.id, updated.pk))
+        self.assertEqual(self.client.get(f'/api/metrics/{deleted.pk}/').status_code, 404)
+        response_cache.cache.clear()
+        rows = self.client.get('/api/metrics/', {'page_size': 1000}).data['results']
+        self.assertEqual(len(rows), 499)
+        self.assertEqual([row['steps'] for row in rows if row['id'] == updated.pk], [4321])
+        for bucket in ('day', 'month'): # The rollups followed both writes
+            self.assertEqual(build_summary(self.user, bucket=bucket),
+                             build_summary(self.user, bucket=bucket, use_rollups=False))
+
+    def test_dry_run_changes_nothing(self):
+        output = io.StringIO()
+        call_command('archive_metrics', older_than=60, dry_run=True, stdout=output)
+        self.assertIn("Would archive", output.getvalue())
+        self.assertEqual(HealthMetric.objects.filter(user=self.user).count(), 500)
+        self.assertFalse(MetricArchiveBlock.objects.exists())
+
+
+class CompactRendererTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('compact', 'compact@example.com', 'pw')
+        now = timezone.now()
+        HealthMetric.objects.bulk_create([
+            HealthMetric(user=cls.user, steps=i, heart_rate=None if i % 2 else 70,
+                         weight='71.20' if i % 3 == 0 else None, timestamp=now - datetime.timedelta(hours=i))
+            for i in range(12)
+        ])
+
+    def setUp(self):
+        cache.clear()
+        response_cache.cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_columnar_holds_the_same_rows(self):
+        expected = self.client.get('/api/metrics/', {'page_size': 5}).json()
+        response = self.client.get('/api/metrics/', {'page_size': 5, 'format': 'columnar'})
+        self.assertEqual(response['Content-Type'], 'application/vnd.health-tracker.columnar+json')
+        data = response.json()
+        self.assertEqual(data['next'], expected['next'].replace('page_size=5', 'format=columnar&page_size=5'))
+        table = data['results']
+        self.assertEqual(table['user'], 'compact') # Stated once, not per row
+        rows = [dict(zip(table['columns'], values), user=table['user']) for values in zip(*table['columns'].values())]
+        self.assertEqual(rows, expected['results'])
+
+        # Single objects and errors keep their JSON shape
+        pk = expected['results'][0]['id']
+        self.assertEqual(self.client.get(f'/api/metrics/{pk}/', {'format': 'columnar'}).json(), expected['results'][0])
+        response = self.client.get('/api/metrics/', {'format': 'columnar', 'from': 'soon'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('from', response.json())
+
+    def test_msgpack_by_accept_header(self):
+        expected = self.client.get('/api/metrics/').json() # Cached as JSON first: the formats don't mix
+        response = self.client.get('/api/metrics/', HTTP_ACCEPT='application/msgpack')
+        self.assertEqual(response['Content-Type'], 'application/msgpack')
+        self.assertEqual(msgpack.unpackb(response.content), expected)
+        self.assertNotEqual(response['ETag'], self.client.get('/api/metrics/')['ETag'])
+        self.assertEqual(self.client.get('/api/metrics/', HTTP_ACCEPT='application/msgpack').content, response.content)
+
+
+class DeltaSyncTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('syncer', 'syncer@example.com', 'pw')
+        now = timezone.now()
+        HealthMetric.objects.bulk_create([
+            HealthMetric(user=cls.user, steps=i, timestamp=now - datetime.timedelta(hours=i)) for i in range(30)
+        ])
+        Meal.objects.bulk_create([Meal(user=cls.user, name=f'Meal {i}', calories=100 + i) for i in range(5)])
+        FitnessGoal.objects.bulk_create([FitnessGoal(user=cls.user, goal_text=f'Goal {i}') for i in range(3)])
+        # Written well before the first sync, outside its settle window
+        past = now - datetime.timedelta(hours=1)
+        for model in (HealthMetric, Meal, FitnessGoal):
+            model.objects.update(updated_at=past)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def sync(self, **params):
+        response = self.client.get('/api/sync/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def sync_later(self, cursor, limit=500):
+        """A sync once the writes made so far have settled."""
+        issued, positions = decode_cursor(cursor)
+        return build_sync(self.user, issued, positions, limit, now=timezone.now() + SETTLE_TIME)
+
+    def test_full_sync_then_only_changes(self):
+        data = self.sync()
+        self.assertEqual([len(data[name]['changed']) for name in ('metrics', 'meals', 'goals')], [30, 5, 3])
+        self.assertFalse(data['has_more'])
+        cursor = data['cursor']
+
+        # Nothing changed: nothing sent
+        data = self.sync(since=cursor)
+        self.assertEqual([data[name] for name in ('metrics', 'meals', 'goals')], [{'changed': [], 'deleted': []}] * 3)
+
+        metric = HealthMetric.objects.filter(user=self.user).earliest('timestamp')
+        self.client.patch(f'/api/metrics/{metric.pk}/', {'steps': 99999}, format='json')
+        meal = self.client.post('/api/meals/', {'name': 'Soup', 'calories': 250}, format='json').data
+        goal = FitnessGoal.objects.filter(user=self.user).first()
+        self.assertEqual(self.client.delete(f'/api/goals/{goal.pk}/').status_code, 204)
+
+        self.assertEqual(self.sync(since=cursor)['metrics']['changed'], []) # Not settled yet
+        with self.assertNumQueries(4): # One keyset range per resource, one over the tombstones
+            data = self.sync_later(cursor)
+        self.assertEqual([(row['id'], row['steps']) for row in data['metrics']['changed']], [(metric.pk, 99999)])
+        self.assertEqual([row['id'] for row in data['meals']['changed']], [meal['id']])
+        self.assertEqual(data['goals'], {'changed': [], 'deleted': [goal.pk]})
+        self.assertEqual(data['metrics']['deleted'], [])
+
+    def test_full_page_stops_at_the_settle_time(self):
+        recent = list(HealthMetric.objects.filter(user=self.user).order_by('id')[:5])
+        stamp = timezone.now()
+        HealthMetric.objects.filter(pk__in=[metric.pk for metric in recent]).update(updated_at=stamp)
+        data = self.sync(limit=27) # 25 settled rows, then the page would reach into the settle window
+        self.assertEqual(len(data['metrics']['changed']), 25)
+        self.assertFalse(data['has_more'])
+        settled = timezone.now() - SETTLE_TIME
+        self.assertLess(decode_cursor(data['cursor'])[1]['metrics'][0], settled)
+
+        # Stamped before the recent rows, committed after the sync read: still ahead of the cursor
+        late = HealthMetric.objects.create(user=self.user, steps=1)
+        HealthMetric.objects.filter(pk=late.pk).update(updated_at=stamp - datetime.timedelta(seconds=1))
+        data = self.sync_later(data['cursor'], limit=27)
+        self.assertEqual({row['id'] for row in data['metrics']['changed']}, {late.pk, *(m.pk for m in recent)})
+
+    def test_pages_of_limit_rows(self):
+        seen, cursor, syncs = set(), None, 0
+        while True:
+            data = self.sync(limit=4, **({'since': cursor} if cursor else {}))
+            seen.update(row['id'] for row in data['metrics']['changed'])
+            cursor, syncs = data['cursor'], syncs + 1
+            self.assertLessEqual(len(data['metrics']['changed']), 4)
+            if not data['has_more']:
+                break
+        self.assertEqual(seen, set(HealthMetric.objects.filter(user=self.user).values_list('id', flat=True)))
+        self.assertEqual(syncs, 8)
+
+    def test_first_sync_includes_archived_metrics(self):
+        old = timezone.now() - datetime.timedelta(days=200)
+        HealthMetric.objects.bulk_create([
+            HealthMetric(user=self.user, steps=i, timestamp=old + datetime.timedelta(days=i)) for i in range(10)
+        ])
+        expected = set(HealthMetric.objects.filter(user=self.user).values_list('id', flat=True))
+        call_command('archive_metrics', older_than=60, stdout=io.StringIO())
+        self.assertEqual(HealthMetric.objects.filter(user=self.user).count(), 30)
+
+        self.assertEqual({row['id'] for row in self.sync()['metrics']['changed']}, expected)
+        seen, cursor = [], None
+        while True:
+            data = self.sync(limit=7, **({'since': cursor} if cursor else {}))
+            seen.extend(row['id'] for row in data['metrics']['changed'])
+            cursor = data['cursor']
+            if not data['has_more']:
+                break
+        self.assertEqual(sorted(seen), sorted(expected))
+        # The pass is over: later syncs only send changes
+        self.assertNotIn(ARCHIVED, decode_cursor(cursor)[1])
+        self.assertEqual(self.sync(since=cursor)['metrics']['changed'], [])
+
+    def test_invalid_and_expired_cursors(self):
+        for params in ({'since': 'garbage'}, {'since': 'e30'}, {'limit': 0}, {'limit': 'all'}):
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get('/api/sync/', params).status_code, 400)
+        expired = encode_cursor(timezone.now() - datetime.timedelta(days=settings.SYNC_TOMBSTONE_RETENTION_DAYS), {})
+        self.assertEqual(self.client.get('/api/sync/', {'since': expired}).status_code, 410)
+
+    def test_prune_tombstones(self):
+        Tombstone.objects.create(user=self.user, resource='meal', object_id=1,
+                                 deleted_at=timezone.now() - datetime.timedelta(days=400))
+        Tombstone.objects.create(user=self.user, resource='meal', object_id=2)
+        call_command('prune_tombstones', stdout=io.StringIO())
+        self.assertEqual(list(Tombstone.objects.values_list('object_id', flat=True)), [2])
+
+
+class LiveEventsTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('live', 'live@example.com', 'pw')
+        cls.token = Token.objects.create(user=cls.user)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.loop = asyncio.new_event_loop()
+        self.addCleanup(self.loop.close)
+
+    def subscribe(self, user_id, maxsize=None):
+        async def subscribe():
+            return hub.subscribe(user_id, maxsize)
+        subscription = self.loop.run_until_complete(subscribe())
+        self.addCleanup(hub.unsubscribe, subscription)
+        return subscription
+
+    def received(self, subscription):
+        self.loop.run_until_complete(asyncio.sleep(0)) # Run the deliveries scheduled from this thread
+        events = []
+        while not subscription.queue.empty():
+            events.append(subscription.queue.get_nowait())
+        return events
+
+    def test_writes_publish_change_events(self):
+        subscription = self.subscribe(self.user.pk)
+        other = self.subscribe(self.user.pk + 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            meal = self.client.post('/api/meals/', {'name': 'Soup', 'calories': 250}, format='json').data
+            self.client.patch(f"/api/meals/{meal['id']}/", {'calories': 300}, format='json')
+            self.client.delete(f"/api/meals/{meal['id']}/")
+            batch = self.client.post('/api/metrics/batch/', [{'steps': i} for i in range(3)], format='json').data
+            self.client.post('/api/metrics/batch/', [{'steps': i} for i in range(101)], format='json')
+            self.client.post('/api/goals/', {'goal_text': ''}, format='json') # Invalid: nothing changed
+        self.assertEqual(self.received(subscription), [
+            {'resource': 'meals', 'action': 'created', 'ids': [meal['id']]},
+            {'resource': 'meals', 'action': 'updated', 'ids': [meal['id']]},
+            {'resource': 'meals', 'action': 'deleted', 'ids': [meal['id']]},
+            {'resource': 'metrics', 'action': 'created', 'ids': batch['ids']},
+            {'resource': 'metrics', 'action': 'created', 'ids': None}, # Too many ids to list
+        ])
+        self.assertEqual(self.received(other), [])
+
+    def test_slow_stream_is_told_to_resync(self):
+        subscription = self.subscribe(self.user.pk, maxsize=3)
+        for i in range(10):
+            hub.deliver(self.user.pk, {'n': i})
+        self.loop.run_until_complete(asyncio.sleep(0))
+        # The backlog is dropped for one resync; the queue never holds more than maxsize
+        self.assertEqual((subscription.queue.qsize(), subscription.dropped), (1, 10))
+        self.assertIs(self.loop.run_until_complete(subscription.get(1)), RESYNC)
+        hub.deliver(self.user.pk, {'n': 10}) # Taken again once the client has the resync
+        self.assertEqual(self.loop.run_until_complete(subscription.get(1)), {'n': 10})
+        self.assertIsNone(self.loop.run_until_complete(subscription.get(0.01)))
+
+    @override_settings(LIVE_EVENTS_HEARTBEAT=0.01)
+    def test_stream(self):
+        async def read_stream():
+            stream = event_stream(self.user.pk)
+            chunks = [await anext(stream)]
+            hub.deliver(self.user.pk, {'resource': 'goals', 'action': 'deleted', 'ids': [7]})
+            chunks.append(await anext(stream))
+            chunks.append(await anext(stream)) # Idle: heartbeat
+            open_streams = hub.stream_count(self.user.pk)
+            await stream.aclose() # Client gone
+            return chunks, open_streams
+
+        chunks, open_streams = async_to_sync(read_stream)()
+        self.assertEqual(chunks, [
+            'retry: 3000\nevent: ready\ndata: {}\n\n',
+            'event: change\ndata: {"resource":"goals","action":"deleted","ids":[7]}\n\n',
+            ': ping\n\n',
+        ])
+        self.assertEqual((open_streams, hub.stream_count(self.user.pk)), (1, 0))
+
+    def test_endpoint_authentication_and_limits(self):
+        def get(path, **headers):
+            return async_to_sync(live_stream)(AsyncRequestFactory().get(path, headers=headers))
+
+        def ticket():
+            request = APIRequestFactory().post('/api/stream/ticket/')
+            force_authenticate(request, self.user)
+            response = StreamTicketView.as_view()(request)
+            self.assertEqual(response.status_code, 201)
+            return response.data['ticket']
+
+        response = get('/api/stream/', Authorization=f'Token {self.token.key}')
+        self.assertEqual((response.status_code, response['Content-Type']), (200, 'text/event-stream'))
+        self.assertTrue(response.streaming)
+        self.assertEqual(get('/api/stream/').status_code, 401)
+        self.assertEqual(get(f'/api/stream/?token={self.token.key}').status_code, 401) # Tokens stay out of URLs
+
+        # EventSource clients open the stream with a single-use ticket
+        key = ticket()
+        self.assertEqual(get(f'/api/stream/?ticket={key}').status_code, 200)
+        self.assertEqual(get(f'/api/stream/?ticket={key}').status_code, 401)
+        self.assertEqual(get('/api/stream/?ticket=wrong').status_code, 401)
+        key = ticket()
+        StreamTicket.objects.filter(pk=key).update(expires_at=timezone.now())
+        self.assertEqual(get(f'/api/stream/?ticket={key}').status_code, 401)
+        self.assertFalse(StreamTicket.objects.exists())
+
+        with override_settings(LIVE_EVENTS_MAX_STREAMS_PER_USER=1):
+            self.subscribe(self.user.pk)
+            self.assertEqual(get('/api/stream/', Authorization=f'Token {self.token.key}').status_code, 429)
+
+
+class BackgroundTaskTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('worker', 'worker@example.com', 'pw')
+        cls.other = User.objects.create_user('bystander', 'bystander@example.com', 'pw')
+        now = timezone.now()
+        HealthMetric.objects.bulk_create([
+            HealthMetric(user=cls.user, steps=i, heart_rate=60 + i % 20, timestamp=now - datetime.timedelta(hours=i))
+            for i in range(300)
+        ])
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def register(self, kind, handler):
+        task_handler(kind)(handler)
+        self.addCleanup(TASK_HANDLERS.pop, kind)
+
+    def test_export_in_background(self):
+        response = self.client.post('/api/export/?resource=metrics&format=csv')
+        self.assertEqual(response.status_code, 202)
+        task_url = response['Location']
+        self.assertTrue(task_url.endswith(f"/api/tasks/{response.data['id']}/"))
+        response = self.client.get(task_url)
+        self.assertEqual((response.data['status'], response['Retry-After']), ('queued', '2'))
+
+        self.assertEqual(run_pending(), 1)
+        response = self.client.get(task_url)
+        self.assertEqual(response.data['status'], 'succeeded')
+        self.assertNotIn('Retry-After', response)
+        expected = b''.join(iter_export(self.user, 'metrics', 'csv'))
+        download = self.client.get(response.data['download'])
+        self.assertEqual(b''.join(download.streaming_content), expected)
+        self.assertIn('metrics-', download['Content-Disposition'])
+        download = self.client.get(response.data['download'], HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(download['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(b''.join(download.streaming_content)), expected)
+
+        # Somebody else's task doesn't exist for them
+        self.client.force_authenticate(self.other)
+        self.assertEqual(self.client.get(task_url).status_code, 404)
+        self.assertEqual(self.client.get('/api/tasks/').data['results'], [])
+
+    def test_files_are_stored_in_chunks(self):
+        task = Task.objects.create(user=self.user, kind='export')
+        content = random.Random(0).randbytes(3 * FILE_CHUNK_SIZE // 2) # Incompressible
+        stored = store_file(task, TaskFile.ROLE_OUTPUT, 'noise.bin', 'application/octet-stream',
+                            (content[i:i + 1000] for i in range(0, len(content), 1000)))
+        self.assertEqual(stored.size, len(content))
+        self.assertEqual(stored.chunks.count(), 2)
+        self.assertEqual(b''.join(iter_file(stored)), content)
+        with read_file(stored) as fileobj:
+            self.assertEqual(fileobj.read(), content)
+
+        store_file(task, TaskFile.ROLE_OUTPUT, 'empty.bin', 'application/octet-stream', [])
+        stored = task.files.get()
+        self.assertEqual((stored.name, stored.size, b''.join(iter_file(stored))), ('empty.bin', 0, b''))
+
+    @override_settings(IMPORT_INLINE_MAX_BYTES=100)
+    def test_large_import_in_background(self):
+        body = 'date,steps\n' + ''.join(f'2020-01-{day:02d}T08:00:00Z,{day * 100}\n' for day in range(1, 29))
+        upload = io.BytesIO(body.encode())
+        upload.name = 'steps.csv'
+        response = self.client.post('/api/import/?resource=metrics', {'file': upload}, format='multipart')
+        self.assertEqual((response.status_code, response.data['kind']), (202, 'import'))
+        self.assertFalse(HealthMetric.objects.filter(user=self.user, timestamp__year=2020).exists())
+
+        run_pending()
+        task = Task.objects.get(pk=response.data['id'])
+        self.assertEqual(task.status, Task.STATUS_SUCCEEDED)
+        self.assertEqual((task.result['status'], task.result['rows_imported']), ('completed', 28))
+        self.assertEqual(task.progress['rows_processed'], 28)
+        self.assertEqual(HealthMetric.objects.filter(user=self.user, timestamp__year=2020).count(), 28)
+
+    @override_settings(TASK_MAX_PENDING_PER_USER=2)
+    def test_pending_limit(self):
+        for expected in (202, 202, 429):
+            self.assertEqual(self.client.post('/api/export/?resource=meals').status_code, expected)
+        run_pending()
+        self.assertEqual(self.client.post('/api/export/?resource=meals').status_code, 202)
+
+    def test_retries_with_backoff(self):
+        calls = []
+
+        def flaky(task):
+            calls.append(task.attempts)
+            if len(calls) < 3:
+                raise ConnectionError("database went away")
+            return {'ok': True}
+
+        self.register('test-flaky', flaky)
+        task = enqueue('test-flaky', user=self.user)
+        with self.assertLogs('api.tasks', 'WARNING') as logs:
+            self.assertEqual(run_pending(), 1)
+        self.assertIn('retrying in', logs.output[0])
+        task.refresh_from_db()
+        self.assertEqual((task.status, task.attempts), (Task.STATUS_QUEUED, 1))
+        self.assertEqual(task.error, 'ConnectionError: database went away')
+        self.assertGreater(task.run_at, timezone.now() + datetime.timedelta(seconds=5)) # Backing off
+        self.assertEqual(run_pending(), 0) # Not due yet
+
+        for _ in range(2):
+            Task.objects.filter(pk=task.pk).update(run_at=timezone.now())
+            with self.assertLogs('api.tasks'):
+                run_pending()
+        task.refresh_from_db()
+        self.assertEqual((task.status, task.result, task.error, calls), (Task.STATUS_SUCCEEDED, {'ok': True}, '', [1, 2, 3]))
+
+    def test_failures(self):
+        def broken(task):
+            raise ValueError("always")
+
+        def rejected(task):
+            raise TaskFailed("Bad input.")
+
+        self.register('test-broken', broken)
+        self.register('test-rejected', rejected)
+        exhausted = enqueue('test-broken', user=self.user, max_attempts=1)
+        final = enqueue('test-rejected', user=self.user)
+        with self.assertLogs('api.tasks', 'WARNING'):
+            run_pending()
+        exhausted.refresh_from_db()
+        final.refresh_from_db()
+        self.assertEqual((exhausted.status, exhausted.error), (Task.STATUS_FAILED, 'ValueError: always'))
+        self.assertEqual((final.status, final.attempts, final.error), (Task.STATUS_FAILED, 1, 'Bad input.')) # No retry
+        self.assertIsNotNone(final.finished_at)
+
+    def test_claiming_and_expired_leases(self):
+        self.register('test-noop', lambda task: None)
+        first, second = enqueue('test-noop'), enqueue('test-noop')
+        claimed = [claim('a'), claim('b'), claim('c')]
+        self.assertEqual([task.pk if task else None for task in claimed], [first.pk, second.pk, None])
+        self.assertEqual(claimed[0].worker, 'a')
+
+        # Worker 'a' died: its lease runs out and the task goes back to the queue
+        Task.objects.filter(pk=first.pk).update(lease_expires_at=timezone.now() - datetime.timedelta(seconds=1))
+        self.assertEqual(requeue_expired(), (1, 0))
+        self.assertEqual(claim('d').pk, first.pk)
+        # A late result of the dead worker is ignored
+        self.assertEqual(_finish(claimed[0], 'a', status=Task.STATUS_SUCCEEDED), 0)
+
+    def test_commands_enqueue_per_user(self):
+        old = [HealthMetric(user=self.user, steps=1, timestamp=datetime.datetime(2020, 3, day, tzinfo=datetime.timezone.utc))
+               for day in range(1, 11)]
+        HealthMetric.objects.bulk_create(old)
+        DailyRollup.objects.all().delete()
+        out = io.StringIO()
+        call_command('rebuild_rollups', '--enqueue', stdout=out)
+        self.assertIn('Queued 2 rollup rebuild tasks', out.getvalue())
+        call_command('archive_metrics', '--older-than', '90', '--enqueue', '--user', 'worker', stdout=out)
+        self.assertEqual(Task.objects.filter(kind='archive_metrics').count(), 1)
+        self.assertEqual(DailyRollup.objects.count(), 0) # Nothing ran yet
+
+        self.assertEqual(run_pending(), 3)
+        results = dict(Task.objects.filter(user=self.user).values_list('kind', 'result'))
+        self.assertEqual(results['rebuild_rollups']['days'], DailyRollup.objects.filter(user=self.user).count())
+        self.assertEqual(results['archive_metrics'], {'rows': 10, 'months': 1})
+        self.assertFalse(HealthMetric.objects.filter(user=self.user, timestamp__year=2020).exists())
@@ -0,0 +1,34 @@
+# backend/api/throttling.py
+from rest_framework.settings import api_settings
+from rest_framework.throttling import SimpleRateThrottle
+
+
+class _AuthRateThrottle(SimpleRateThrottle):
+    """
+    Rates come from REST_FRAMEWORK['DEFAULT_THROTTLE_RATES'][scope], read per
+    request so overrides apply (SimpleRateThrottle reads them once, at import).
+    A rate of None turns the throttle off. Counts live in the default cache:
+    configure a shared cache so they hold across workers.
+    """
+
+    def get_rate(self):
+        return api_settings.DEFAULT_THROTTLE_RATES.get(self.scope)
+
+
+class AuthIPThrottle(_AuthRateThrottle):
+    """Register/login attempts per client IP."""
+    scope = 'auth_ip'
+
+    def get_cache_key(self, request, view):
+        return self.cache_format % {'scope': self.scope, 'ident': self.get_ident(request)}
+
+
+class AuthUsernameThrottle(_AuthRateThrottle):
+    """Register/login attempts per username, from any IP: slows down password guessing."""
+    scope = 'auth_username'
+
+    def get_cache_key(self, request, view):
+        username = request.data.get('username') if hasattr(request.data, 'get') else None
+        if not isinstance(username, str) or not username:
+            return None # Nothing to count; the serializer rejects the request
+        return self.cache_format % {'scope': self.scope, 'ident': username.strip().lower()}
@@ -1,9 +1,13 @@
 # backend/api/urls.py
+from django.conf import settings
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
+from .async_views import async_read_urls
+from .live import live_stream
 from .views import (
-    RegisterView, CustomAuthToken, CurrentUserView,
-    HealthMetricViewSet, MealViewSet, FitnessGoalViewSet
+    RegisterView, CustomAuthToken, CurrentUserView, DashboardView, CacheStatsView, PrometheusMetricsView,
+    ExportView, ImportView, SyncView, StreamTicketView,
+    HealthMetricViewSet, MealViewSet, FitnessGoalViewSet, TaskViewSet
 )
 
 # Create a router and register our viewsets with it.
@@ -11,11 +15,27 @@ router = DefaultRouter()
 router.register(r'metrics', HealthMetricViewSet, basename='healthmetric')
 router.register(r'meals', MealViewSet, basename='meal')
 router.register(r'goals', FitnessGoalViewSet, basename='fitnessgoal')
+router.register(r'tasks', TaskViewSet, basename='task') # Background task status (api/tasks.py)
 
 # The API URLs are now determined automatically by the router.
 urlpatterns = [
     path('register/', RegisterView.as_view(), name='register'),
     path('login/', CustomAuthToken.as_view(), name='login'), # Use our custom login
     path('user/', CurrentUserView.as_view(), name='current-user'), # Get current user info
+    path('dashboard/', DashboardView.as_view(), name='dashboard'), # Everything the dashboard page shows, in one call
+    path('export/', ExportView.as_view(), name='export'), # Streamed CSV/NDJSON download of a user's history
+    path('import/', ImportView.as_view(), name='import'), # Batched CSV import from other trackers
+    path('sync/', SyncView.as_view(), name='sync'), # Rows changed/deleted since a cursor, for offline clients
+    path('_cache/', CacheStatsView.as_view(), name='cache-stats'), # Admin-only response cache counters
+    path('_metrics', PrometheusMetricsView.as_view(), name='prometheus-metrics'), # Admin-only, Prometheus text format
     path('', include(router.urls)), # Include the router URLs
-]
\ No newline at end of file
+]
+
+if settings.ASYNC_READ_VIEWS:
+    # Under ASGI, JSON GETs of the list/detail/dashboard endpoints run as native coroutines
+    urlpatterns = async_read_urls(urlpatterns)
+if settings.LIVE_EVENTS_ENABLED:
+    # Server-sent change events (api/live.py). Needs the ASGI server, where an open
+    # stream holds no thread; config/asgi.py turns this on.
+    urlpatterns.append(path('stream/', live_stream, name='live-stream'))
+    urlpatterns.append(path('stream/ticket/', StreamTicketView.as_view(), name='live-stream-ticket'))
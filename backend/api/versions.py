@@ -0,0 +1,127 @@
+# backend/api/versions.py
+
+"""
+Per-user, per-resource data version counters.
+
+Every write through a BaseUserOwnedViewSet bumps the counter of that user's
+resource (after the transaction commits). Read endpoints derive their ETags
+from it, so "has anything changed?" is a cache lookup instead of a query.
+
+Counters live in Django's cache (settings.DATA_VERSION_CACHE_ALIAS) without
+expiry. If one is evicted it restarts from the current time in nanoseconds,
+which never matches a version a client saw before, so the worst case is one
+unnecessary full response, never a stale 304. The cache must be shared by all
+worker processes (async_cache.is_shared()): a bump in one worker never reaches
+another's per-process counters, so without sharing If-None-Match is ignored.
+"""
+
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+from .async_cache import cache_call, is_shared
+
+
+def _version_cache():
+    return caches[getattr(settings, 'DATA_VERSION_CACHE_ALIAS', 'default')]
+
+
+def _key(user_id, resource):
+    return f'dataver:{resource}:{user_id}'
+
+
+def versions_shared():
+    """True when every worker process reads the same counters; ETags and cached responses depend on it."""
+    return is_shared(_version_cache())
+
+
+def get_data_version(user_id, resource):
+    cache = _version_cache()
+    key = _key(user_id, resource)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def get_data_versions(user_id, resources):
+    """Versions of several resources of one user in a single cache round trip (when all are set)."""
+    cache = _version_cache()
+    keys = {resource: _key(user_id, resource) for resource in resources}
+    found = cache.get_many(list(keys.values()))
+    return {
+        resource: found[key] if key in found else get_data_version(user_id, resource)
+        for resource, key in keys.items()
+    }
+
+
+async def aget_data_version(user_id, resource):
+    cache = _version_cache()
+    key = _key(user_id, resource)
+    version = await cache_call(cache, 'get', key)
+    if version is None:
+        await cache_call(cache, 'add', key, time.time_ns(), timeout=None)
+        version = await cache_call(cache, 'get', key)
+    return version
+
+
+async def aget_data_versions(user_id, resources):
+    cache = _version_cache()
+    keys = {resource: _key(user_id, resource) for resource in resources}
+    found = await cache_call(cache, 'get_many', list(keys.values()))
+    return {
+        resource: found[key] if key in found else await aget_data_version(user_id, resource)
+        for resource, key in keys.items()
+    }
+
+
+def bump_data_version(user_id, resource):
+    """
+    Invalidate everything derived from `resource` for this user. Runs once the
+    surrounding transaction commits, so readers never see the new version
+    paired with the old data.
+    """
+    def bump():
+        cache = _version_cache()
+        key = _key(user_id, resource)
+        try:
+            cache.incr(key)
+        except ValueError: # Missing (never read, or evicted)
+            cache.set(key, time.time_ns(), timeout=None)
+    transaction.on_commit(bump)
+
+
+def data_changed(user_id, resource, action, ids):
+    """
+    Everything a write to `resource` rows of a user invalidates, once it commits:
+    the data version (ETags, cached responses) and the user's open live streams.
+    `action` is 'created', 'updated' or 'deleted'; `ids` are the rows' primary keys.
+    """
+    from .live import publish_change # api.live imports sync and archive, which import this module
+
+    bump_data_version(user_id, resource)
+    publish_change(user_id, resource, action, ids)
+
+
+def make_etag(*parts):
+    """A strong ETag over the given version/request parts."""
+    digest = hashlib.sha1(':'.join(str(part) for part in parts).encode()).hexdigest()
+    return f'"{digest}"'
+
+
+def etag_matches(request, etag):
+    """
+    True if the request's If-None-Match header names `etag` (or '*'). Always
+    False while the counters are per process: another worker's write may be
+    missing from this one's version.
+    """
+    header = request.headers.get('If-None-Match')
+    if not header or not versions_shared():
+        return False
+    candidates = [value.strip() for value in header.split(',')]
+    # Weak comparison, as RFC 9110 prescribes for If-None-Match
+    return '*' in candidates or etag in [c[2:] if c.startswith('W/') else c for c in candidates]
@@ -1,18 +1,47 @@
 # backend/api/views.py
 
+import datetime
 import logging # Import the logging library
 from rest_framework import generics, viewsets, permissions, status
+from rest_framework.decorators import action
 from rest_framework.response import Response
+from rest_framework.negotiation import DefaultContentNegotiation
+from rest_framework.parsers import MultiPartParser
+from rest_framework.views import APIView
 from rest_framework.authtoken.models import Token
 from rest_framework.authtoken.views import ObtainAuthToken
 from rest_framework import serializers # Import for ValidationError logging
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import transaction
+from django.db.models import Value
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.urls import reverse
+from django.utils import timezone
 # Removed unused 'authenticate' import
 
-from .models import HealthMetric, Meal, FitnessGoal
+from .archive import archived_page, archived_row, restore_row
+from .authentication import cache_token
+from .exports import EXPORT_FORMATS, EXPORT_RESOURCES, gzip_stream, iter_export
+from .models import HealthMetric, Meal, FitnessGoal, Task, TaskFile, Tombstone
+from .filters import TimeRangeFilter, parse_time_range
+from .importers import IMPORT_RESOURCES, HealthDataImporter, ImportFormatError, import_result
+from .live import issue_ticket
+from .request_metrics import request_metrics
+from .rollups import refresh_rollups
+from .response_cache import ResponseCacheMixin, response_cache
+from .versions import aget_data_version, data_changed, etag_matches, get_data_version, make_etag
+from .throttling import AuthIPThrottle, AuthUsernameThrottle
+from .series import build_series, parse_series_params
+from .sync import build_sync, parse_sync_params
+from .tasks import enqueue, iter_compressed, iter_file, pending_count
+from .summaries import build_summary, parse_summary_params, resolve_time_zone
+from .pagination import TimestampCursorPagination, CreatedAtCursorPagination
 from .serializers import (
     UserSerializer, RegisterSerializer, HealthMetricSerializer,
-    MealSerializer, FitnessGoalSerializer
+    MealSerializer, FitnessGoalSerializer, TaskSerializer, row_fields, serialize_rows
 )
 
 # Get an instance of a logger for this module
@@ -39,15 +68,16 @@ class RegisterView(generics.CreateAPIView):
     """
     queryset = User.objects.all()
     permission_classes = (permissions.AllowAny,) # Allow anyone to access this endpoint
+    throttle_classes = (AuthIPThrottle, AuthUsernameThrottle) # Checked before any password hashing
     serializer_class = RegisterSerializer
 
     def create(self, request, *args, **kwargs):
         # --- ADDED LOGGING: Log incoming request data ---
         # Be cautious logging raw request data in production if it might contain sensitive info
         # beyond what's needed for debugging. Consider logging only specific fields if necessary.
-        logger.info(f"Registration attempt received for username: {request.data.get('username')}, email: {request.data.get('email')}")
+        logger.info("Registration attempt received for username: %s, email: %s", request.data.get('username'), request.data.get('email'))
         # For deeper debugging (use temporarily if needed):
-        # logger.debug(f"Full registration request data: {request.data}")
+        # logger.debug("Full registration request data: %s", request.data)
         # --- END LOGGING ---
 
         serializer = self.get_serializer(data=request.data)
@@ -56,7 +86,7 @@ class RegisterView(generics.CreateAPIView):
             serializer.is_valid(raise_exception=True)
         except serializers.ValidationError as e:
              # --- ADDED LOGGING: Log validation errors ---
-             logger.error(f"Registration validation failed for username '{request.data.get('username')}'. Errors: {e.detail}")
+             logger.error("Registration validation failed for username '%s'. Errors: %s", request.data.get('username'), e.detail)
              # --- END LOGGING ---
              raise e # Re-raise the exception to return 400 response
 
@@ -64,7 +94,7 @@ class RegisterView(generics.CreateAPIView):
         user = serializer.save()
 
         # --- ADDED LOGGING: Log successful registration ---
-        logger.info(f"User '{user.username}' registered successfully (ID: {user.id}).")
+        logger.info("User '%s' registered successfully (ID: %s).", user.username, user.id)
         # --- END LOGGING ---
 
         # Create or get an authentication token for the new user
@@ -84,20 +114,22 @@ class CustomAuthToken(ObtainAuthToken):
     Returns the auth token along with basic user details upon successful login.
     """
     permission_classes = (permissions.AllowAny,) # Allow anyone to attempt login
+    throttle_classes = (AuthIPThrottle, AuthUsernameThrottle) # Checked before any password hashing
 
     def post(self, request, *args, **kwargs):
-        logger.info(f"Login attempt received for username: {request.data.get('username')}") # Log login attempt
+        logger.info("Login attempt received for username: %s", request.data.get('username')) # Log login attempt
         serializer = self.serializer_class(data=request.data,
                                            context={'request': request})
         try:
             serializer.is_valid(raise_exception=True)
         except serializers.ValidationError as e:
-            logger.warning(f"Login validation failed for username '{request.data.get('username')}'. Errors: {e.detail}")
+            logger.warning("Login validation failed for username '%s'. Errors: %s", request.data.get('username'), e.detail)
             raise e
 
         user = serializer.validated_data['user']
         token, created = Token.objects.get_or_create(user=user)
-        logger.info(f"User '{user.username}' logged in successfully.")
+        cache_token(token) # Pre-warm: the client's next request skips the Token/User query
+        logger.info("User '%s' logged in successfully.", user.username)
         return Response({
             'token': token.key,
             'user_id': user.pk,
@@ -120,12 +152,294 @@ class CurrentUserView(generics.RetrieveAPIView):
 
     def get_object(self):
         # Returns the user associated with the current request's token
-        logger.debug(f"Fetching current user details for user: {self.request.user.username}")
+        logger.debug("Fetching current user details for user: %s", self.request.user.username)
         return self.request.user
 
+# --- Monitoring ---
+
+class CacheStatsView(APIView):
+    """
+    Hit/miss counters of this process's response cache. Admin only.
+    """
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        return Response({'response_cache': response_cache.stats()})
+
+
+class PrometheusMetricsView(APIView):
+    """
+    Request counters and latency histograms of all worker processes, in the
+    Prometheus text format. Admin only: scrape it with an admin user's token.
+    """
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        return HttpResponse(request_metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+# --- Dashboard View ---
+
+class DashboardView(ResponseCacheMixin, APIView):
+    """
+    Everything the dashboard page needs in one response:
+    the latest metrics, today's meals, open goals and a daily summary for the chart.
+    GET /api/dashboard/?metrics=N&days=D&tz=Area/City
+
+    Runs a fixed number of queries regardless of how much data the user has
+    (one per list, plus the summary's grouped queries).
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    cache_responses = True
+    cache_resources = ('healthmetric', 'meal', 'fitnessgoal')
+    default_metrics = 20
+    max_metrics = 100
+    default_days = 30
+    max_days = 366
+
+    def _bounded_int(self, name, default, maximum):
+        try:
+            value = int(self.request.query_params.get(name, default))
+        except (TypeError, ValueError):
+            raise serializers.ValidationError({name: "Expected an integer."})
+        return max(1, min(value, maximum))
+
+    def _prepare(self, request):
+        """
+        Parse the query parameters. Returns the time zone, today's date there, the
+        start of the summary window and the lazy values() querysets of each list.
+        """
+        user = request.user
+        tz = resolve_time_zone(request.query_params.get('tz'))
+        metrics_limit = self._bounded_int('metrics', self.default_metrics, self.max_metrics)
+        days = self._bounded_int('days', self.default_days, self.max_days)
+
+        # Midnight today in the user's time zone
+        today = timezone.localtime(timezone.now(), tz).date()
+        today_start = timezone.make_aware(datetime.datetime.combine(today, datetime.time.min), tz)
+        summary_start = today_start - datetime.timedelta(days=days - 1)
+
+        # Same fast read path as the list endpoints: column values, no per-row user lookup
+        metric_serializer, meal_serializer, goal_serializer = (
+            HealthMetricSerializer(), MealSerializer(), FitnessGoalSerializer()
+        )
+        lists = {
+            'metrics': (metric_serializer, HealthMetric.objects.filter(user=user).order_by('-timestamp', '-id')
+                        .values(*row_fields(metric_serializer))[:metrics_limit]),
+            'meals_today': (meal_serializer, Meal.objects.filter(user=user, timestamp__gte=today_start)
+                            .order_by('-timestamp', '-id').values(*row_fields(meal_serializer))),
+            'open_goals': (goal_serializer, FitnessGoal.objects.filter(user=user, completed=Value(False))
+                           .order_by('-created_at', '-id').values(*row_fields(goal_serializer))),
+        }
+        return tz, today, summary_start, lists
+
+    def _payload(self, user, tz, lists, rows, summary):
+        data = {name: serialize_rows(serializer, rows[name], user.username)
+                for name, (serializer, _) in lists.items()}
+        data['summary'] = {'bucket': 'day', 'time_zone': str(tz), 'results': summary}
+        return data
+
+    def get(self, request, *args, **kwargs):
+        user = request.user
+        tz, today, summary_start, lists = self._prepare(request)
+
+        def build():
+            logger.debug("Building dashboard for user: %s", user.username)
+            rows = {name: list(queryset) for name, (_, queryset) in lists.items()}
+            summary = build_summary(user, bucket='day', tz=tz, start=summary_start)
+            return Response(self._payload(user, tz, lists, rows, summary))
+
+        # "Today" is part of the key: today's meals and the summary window move at midnight
+        return self.cached(request, build, extra=(today.isoformat(),))
+
+    async def aget(self, request, *args, **kwargs):
+        """get() on the ASGI read path (api/async_views.py)."""
+        user = request.user
+        tz, today, summary_start, lists = self._prepare(request)
+
+        async def build():
+            logger.debug("Building dashboard for user: %s", user.username)
+            rows = {name: [row async for row in queryset] for name, (_, queryset) in lists.items()}
+            # The summary merges several grouped queries in Python; run it as one unit
+            summary = await sync_to_async(build_summary)(user, bucket='day', tz=tz, start=summary_start)
+            return Response(self._payload(user, tz, lists, rows, summary))
+
+        return await self.acached(request, build, extra=(today.isoformat(),))
+
+# --- Delta Sync View ---
+
+class SyncView(APIView):
+    """
+    Changes to the user's metrics, meals and goals since a cursor (api/sync.py):
+    GET /api/sync/?since=<cursor>&limit=N
+    Returns {metrics|meals|goals: {changed: [...], deleted: [ids]}, cursor, has_more}.
+    Omit ?since= for a first, full sync; pass the returned cursor next time.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request, *args, **kwargs):
+        issued, positions, limit = parse_sync_params(request.query_params)
+        data = build_sync(request.user, issued, positions, limit)
+        logger.debug("Sync for user %s: %d metrics, %d meals, %d goals changed", request.user.username,
+                     len(data['metrics']['changed']), len(data['meals']['changed']), len(data['goals']['changed']))
+        return Response(data)
+
+
+# --- Live Stream Ticket View ---
+
+class StreamTicketView(APIView):
+    """
+    POST /api/stream/ticket/: a single-use ticket for opening the live event
+    stream as GET /api/stream/?ticket=<ticket> (api/live.py), for EventSource
+    clients, which can't send the Authorization header.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request, *args, **kwargs):
+        return Response({'ticket': issue_ticket(request.user),
+                         'expires_in': getattr(settings, 'LIVE_EVENTS_TICKET_SECONDS', 30)},
+                        status=status.HTTP_201_CREATED)
+
+
+# --- Export View ---
+
+class ExportContentNegotiation(DefaultContentNegotiation):
+    """
+    On the export endpoint ?format= names the file format, not a DRF renderer;
+    error responses are always rendered as JSON.
+    """
+    def select_renderer(self, request, renderers, format_suffix=None):
+        return super().select_renderer(request, renderers, format_suffix=format_suffix or 'json')
+
+
+class ExportView(APIView):
+    """
+    Streams a user's complete history as a file download.
+    GET /api/export/?resource=metrics|meals|goals&format=csv|ndjson
+    The body is gzip-encoded on the fly when the client accepts it (?gzip=0 disables).
+    POST with the same parameters builds the file in the background instead and
+    answers 202 with the task (api/tasks.py); its `download` URL serves the file.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    content_negotiation_class = ExportContentNegotiation
+
+    def export_params(self, request):
+        resource = request.query_params.get('resource', 'metrics')
+        fmt = request.query_params.get('format', 'csv')
+        if resource not in EXPORT_RESOURCES:
+            raise serializers.ValidationError({"resource": f"Expected one of: {', '.join(EXPORT_RESOURCES)}."})
+        if fmt not in EXPORT_FORMATS:
+            raise serializers.ValidationError({"format": f"Expected one of: {', '.join(EXPORT_FORMATS)}."})
+        return resource, fmt
+
+    def post(self, request, *args, **kwargs):
+        resource, fmt = self.export_params(request)
+        return queue_task(request, 'export', args={'resource': resource, 'format': fmt})
+
+    def get(self, request, *args, **kwargs):
+        resource, fmt = self.export_params(request)
+
+        logger.info("Export of %s as %s started for user: %s", resource, fmt, request.user.username)
+        stream = iter_export(request.user, resource, fmt)
+        compress = ('gzip' in request.headers.get('Accept-Encoding', '')
+                    and request.query_params.get('gzip') != '0')
+        if compress:
+            stream = gzip_stream(stream)
+
+        response = StreamingHttpResponse(stream, content_type=EXPORT_FORMATS[fmt])
+        filename = f"{resource}-{timezone.localdate().isoformat()}.{fmt}"
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        response['Vary'] = 'Accept-Encoding'
+        if compress:
+            response['Content-Encoding'] = 'gzip'
+        return response
+
+class ImportView(APIView):
+    """
+    Imports a CSV export from another tracker for the request user.
+    POST /api/import/?resource=metrics|meals with the file in the multipart field 'file'.
+    Uploading the same file again resumes an interrupted import (or returns the finished job).
+    Files over settings.IMPORT_INLINE_MAX_BYTES (or any file with ?background=1) are
+    imported by a background task: the answer is 202 with the task (api/tasks.py),
+    whose result is the job once it has run.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    parser_classes = [MultiPartParser]
+
+    def post(self, request, *args, **kwargs):
+        resource = request.query_params.get('resource', 'metrics')
+        if resource not in IMPORT_RESOURCES:
+            raise serializers.ValidationError({"resource": f"Expected one of: {', '.join(IMPORT_RESOURCES)}."})
+        upload = request.FILES.get('file')
+        if upload is None:
+            raise serializers.ValidationError({"file": "Upload the CSV file in the 'file' field."})
+
+        if upload.size > getattr(settings, 'TASK_FILE_MAX_BYTES', 50 * 1024 * 1024):
+            raise serializers.ValidationError({"file": "The file is too large to import."})
+        if (upload.size > getattr(settings, 'IMPORT_INLINE_MAX_BYTES', 1024 * 1024)
+                or request.query_params.get('background') == '1'):
+            return queue_task(request, 'import', args={'resource': resource},
+                              input_file=(upload.name, upload.content_type or 'text/csv', upload.chunks()))
+
+        logger.info("Import of %s from '%s' started for user: %s", resource, upload.name, request.user.username)
+        try:
+            job = HealthDataImporter(request.user, resource).run(upload.file, filename=upload.name)
+        except ImportFormatError as e:
+            raise serializers.ValidationError({"file": str(e)})
+        logger.info("Import #%s for user %s: %s rows imported", job.id, request.user.username, job.rows_imported)
+        return Response(import_result(job), status=status.HTTP_200_OK)
+
+
+# --- Background tasks ---
+
+def queue_task(request, kind, **kwargs):
+    """Queue a task of `kind` for the request user; 202 with its status, or 429 with too many pending."""
+    if pending_count(request.user) >= getattr(settings, 'TASK_MAX_PENDING_PER_USER', 5):
+        return Response({"detail": "Too many background tasks are pending. Try again when they have finished."},
+                        status=status.HTTP_429_TOO_MANY_REQUESTS)
+    task = enqueue(kind, user=request.user, **kwargs)
+    data = TaskSerializer(task, context={'request': request}).data
+    return Response(data, status=status.HTTP_202_ACCEPTED,
+                    headers={'Location': request.build_absolute_uri(reverse('task-detail', args=[task.pk]))})
+
+
+class TaskViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    The request user's background tasks (api/tasks.py), newest first:
+    GET /api/tasks/ and GET /api/tasks/<id>/ to poll one. Until the task has
+    finished, the detail response carries Retry-After with the suggested poll
+    interval. GET /api/tasks/<id>/download/ serves the file an export produced.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    serializer_class = TaskSerializer
+    pagination_class = CreatedAtCursorPagination
+
+    def get_queryset(self):
+        return Task.objects.filter(user=self.request.user)
+
+    def retrieve(self, request, *args, **kwargs):
+        task = self.get_object()
+        headers = {} if task.finished else {'Retry-After': str(getattr(settings, 'TASK_POLL_INTERVAL', 2))}
+        return Response(self.get_serializer(task).data, headers=headers)
+
+    @action(detail=True, methods=['get'])
+    def download(self, request, *args, **kwargs):
+        task = self.get_object()
+        stored = TaskFile.objects.filter(task=task, role=TaskFile.ROLE_OUTPUT).first()
+        if stored is None or task.status != Task.STATUS_SUCCEEDED:
+            raise Http404("This task has no file to download.")
+        # Stored gzipped: sent as is to clients that accept it, decompressed on the fly otherwise
+        if 'gzip' in request.headers.get('Accept-Encoding', ''):
+            response = StreamingHttpResponse(iter_compressed(stored), content_type=stored.content_type)
+            response['Content-Encoding'] = 'gzip'
+        else:
+            response = StreamingHttpResponse(iter_file(stored), content_type=stored.content_type)
+        response['Content-Disposition'] = f'attachment; filename="{stored.name}"'
+        response['Vary'] = 'Accept-Encoding'
+        return response
+
 # --- CRUD ViewSets for User-Owned Data ---
 
-class BaseUserOwnedViewSet(viewsets.ModelViewSet):
+class BaseUserOwnedViewSet(ResponseCacheMixin, viewsets.ModelViewSet):
     """
     Base ViewSet that automatically filters querysets by the request user
     and assigns the request user upon creation.
@@ -133,6 +447,8 @@ class BaseUserOwnedViewSet(viewsets.ModelViewSet):
     """
     # Permissions required: Must be logged in, must own the specific object for detail views (update/delete)
     permission_classes = [permissions.IsAuthenticated, IsOwner]
+    cache_responses = True # Rendered list/detail responses are cached per user (api/response_cache.py)
+    has_archive = False # See merge_archived()
 
     def get_queryset(self):
         """
@@ -143,39 +459,376 @@ class BaseUserOwnedViewSet(viewsets.ModelViewSet):
             raise NotImplementedError("Subclasses must define a 'queryset' attribute.")
 
         user = self.request.user
-        logger.debug(f"Filtering {self.queryset.model.__name__} queryset for user: {user.username}")
+        logger.debug("Filtering %s queryset for user: %s", self.queryset.model.__name__, user.username)
         # Filter by the 'user' foreign key field on the model
         return self.queryset.filter(user=user)
 
+    # --- Conditional GET ---
+    # Responses carry an ETag derived from the user's version counter for this
+    # resource (api/versions.py), the full path and the Accept header. A matching
+    # If-None-Match gets 304 without touching the data tables.
+
+    @property
+    def resource_name(self):
+        return self.queryset.model._meta.model_name
+
+    def get_etag(self, request):
+        return self._etag(request, get_data_version(request.user.id, self.resource_name))
+
+    async def aget_etag(self, request):
+        return self._etag(request, await aget_data_version(request.user.id, self.resource_name))
+
+    def _etag(self, request, version):
+        return make_etag(self.resource_name, version, request.get_full_path(), request.headers.get('Accept', ''))
+
+    def finalize_conditional(self, response, etag):
+        if response.status_code == status.HTTP_200_OK:
+            response['ETag'] = etag
+            response['Cache-Control'] = 'private, no-cache' # Browsers may keep it, but must revalidate
+        return response
+
+    def not_modified(self, etag):
+        return Response(status=status.HTTP_304_NOT_MODIFIED,
+                         headers={'ETag': etag, 'Cache-Control': 'private, no-cache'})
+
+    def get_cache_resources(self):
+        return (self.resource_name,)
+
+    def data_changed(self, action, ids):
+        """
+        Called after every create, update, delete or batch insert of this user's rows.
+        `action` is 'created', 'updated' or 'deleted'; `ids` are the rows' primary keys.
+        """
+        data_changed(self.request.user.id, self.resource_name, action, ids)
+
+    def list(self, request, *args, **kwargs):
+        """
+        Fast read path: fetch plain column values and render them with the
+        serializer's own field rules. Skips model instantiation and the per-row
+        `user.username` lookup; the JSON output is identical to the default list.
+        """
+        etag = self.get_etag(request)
+        if etag_matches(request, etag):
+            return self.not_modified(etag)
+
+        def build():
+            serializer = self.get_serializer()
+            rows = self.filter_queryset(self.get_queryset()).values(*row_fields(serializer))
+            page_rows = self.paginator.page_queryset(rows, request) if self.paginator else None
+            if page_rows is None:
+                data = serialize_rows(serializer, rows, request.user.username)
+                return self.finalize_conditional(Response(data), etag)
+            page = self.paginator.set_page(self.merge_archived(list(page_rows)))
+            data = serialize_rows(serializer, page, request.user.username)
+            return self.finalize_conditional(self.get_paginated_response(data), etag)
+
+        return self.cached(request, build)
+
+    def merge_archived(self, page_rows):
+        """
+        Hook for resources whose older rows also live outside the table (set
+        `has_archive`): merge them into a page fetched with page_queryset().
+        """
+        return page_rows
+
+    def archived_row(self, pk):
+        """
+        Hook for resources with `has_archive`: the user's archived row with id
+        `pk` as a row dict (like the list rows), or None.
+        """
+        return None
+
+    def restore_archived(self, pk):
+        """
+        Hook for resources with `has_archive`: move the user's archived row with
+        id `pk` back into the table and return it, or return None.
+        """
+        return None
+
+    def archived_pk(self):
+        """The detail lookup as an archive id, or None if it can't be one."""
+        if not self.has_archive:
+            return None
+        try:
+            return int(self.kwargs[self.lookup_url_kwarg or self.lookup_field])
+        except (TypeError, ValueError):
+            return None
+
+    def get_object(self):
+        """
+        The row of a detail request. A row moved to the archive is rendered from
+        there on retrieve, and moved back into the table before a write.
+        """
+        try:
+            return super().get_object()
+        except Http404:
+            pk = self.archived_pk()
+            if pk is None:
+                raise
+            if self.action == 'retrieve':
+                row = self.archived_row(pk)
+                instance = None if row is None else self.queryset.model(user=self.request.user, **row)
+            else:
+                instance = self.restore_archived(pk)
+            if instance is None:
+                raise
+        self.check_object_permissions(self.request, instance)
+        return instance
+
+    def retrieve(self, request, *args, **kwargs):
+        etag = self.get_etag(request)
+        if etag_matches(request, etag):
+            return self.not_modified(etag)
+        retrieve = super().retrieve
+
+        def build():
+            return self.finalize_conditional(retrieve(request, *args, **kwargs), etag)
+
+        return self.cached(request, build)
+
+    # --- Async read path ---
+    # Used instead of list()/retrieve() for GET requests when the app is served
+    # through config/asgi.py (see api/async_views.py). Same queries, same output.
+
+    async def alist(self, request, *args, **kwargs):
+        etag = await self.aget_etag(request)
+        if etag_matches(request, etag):
+            return self.not_modified(etag)
+
+        async def build():
+            serializer = self.get_serializer()
+            rows = self.filter_queryset(self.get_queryset()).values(*row_fields(serializer))
+            page_rows = self.paginator.page_queryset(rows, request) if self.paginator else None
+            if page_rows is None:
+                data = serialize_rows(serializer, [row async for row in rows.aiterator()], request.user.username)
+                return self.finalize_conditional(Response(data), etag)
+            page_rows = [row async for row in page_rows]
+            if self.has_archive:
+                page_rows = await sync_to_async(self.merge_archived)(page_rows)
+            page = self.paginator.set_page(page_rows)
+            data = serialize_rows(serializer, page, request.user.username)
+            return self.finalize_conditional(self.get_paginated_response(data), etag)
+
+        return await self.acached(request, build)
+
+    async def aretrieve(self, request, *args, **kwargs):
+        etag = await self.aget_etag(request)
+        if etag_matches(request, etag):
+            return self.not_modified(etag)
+
+        async def build():
+            serializer = self.get_serializer()
+            rows = self.filter_queryset(self.get_queryset()).values(*row_fields(serializer))
+            lookup = self.kwargs[self.lookup_url_kwarg or self.lookup_field]
+            model = self.queryset.model
+            try:
+                row = await rows.aget(**{self.lookup_field: lookup})
+            except model.DoesNotExist:
+                pk = self.archived_pk()
+                row = None if pk is None else await sync_to_async(self.archived_row)(pk)
+                if row is None:
+                    raise Http404(f"No {model._meta.object_name} matches the given query.")
+            except (TypeError, ValueError, DjangoValidationError):
+                raise Http404
+            data = serialize_rows(serializer, [row], request.user.username)[0]
+            return self.finalize_conditional(Response(data), etag)
+
+        return await self.acached(request, build)
+
     def perform_create(self, serializer):
         """
         Automatically associate the object with the logged-in user upon creation.
         """
         user = self.request.user
         instance = serializer.save(user=user) # Pass the user object to the serializer's save method
-        logger.info(f"{self.queryset.model.__name__} created (ID: {instance.id}) for user: {user.username}")
+        self.data_changed('created', [instance.pk])
+        logger.info("%s created (ID: %s) for user: %s", self.queryset.model.__name__, instance.id, user.username)
+
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+        self.data_changed('updated', [serializer.instance.pk])
+
+    def perform_destroy(self, instance):
+        pk = instance.pk
+        with transaction.atomic():
+            super().perform_destroy(instance)
+            # Tells synced clients to drop their copy (api/sync.py)
+            Tombstone.objects.create(user=self.request.user, resource=self.resource_name, object_id=pk)
+            self.data_changed('deleted', [pk])
+
+    def perform_bulk_create(self, instances, batch_size):
+        """
+        Insert already-validated, unsaved instances with multi-row INSERTs.
+        Returns the saved instances (with primary keys where the backend reports them).
+        """
+        with transaction.atomic():
+            created = self.queryset.model.objects.bulk_create(instances, batch_size=batch_size)
+            self.data_changed('created', [obj.pk for obj in created if obj.pk is not None])
+        return created
 
     # Standard list, retrieve, update, destroy actions inherit permission checks.
     # get_queryset ensures list/retrieve only show user's own data.
     # IsOwner permission ensures update/destroy only work on user's own specific object.
 
 
-class HealthMetricViewSet(BaseUserOwnedViewSet):
+class BatchCreateMixin:
+    """
+    Adds `POST <resource>/batch/` to a BaseUserOwnedViewSet for bulk ingest.
+
+    The body is a JSON list of objects in the same shape as a single POST. Each
+    item is validated with the viewset's serializer; valid items are inserted
+    with `bulk_create` in chunks inside one transaction, invalid ones are
+    reported back by their index. One request and one transaction instead of
+    one per sample.
+    """
+    batch_max_items = 5000   # Largest list accepted in one request
+    batch_chunk_size = 500   # Rows per INSERT statement
+
+    @action(detail=False, methods=['post'], url_path='batch')
+    def batch(self, request, *args, **kwargs):
+        items = request.data
+        if not isinstance(items, list):
+            raise serializers.ValidationError({"non_field_errors": ["Expected a list of items."]})
+        if len(items) > self.batch_max_items:
+            raise serializers.ValidationError(
+                {"non_field_errors": [f"A batch may contain at most {self.batch_max_items} items."]}
+            )
+
+        # Validate item by item with the list serializer's child so one bad row
+        # doesn't reject the whole batch.
+        child = self.get_serializer(data=items, many=True).child
+        model = self.queryset.model
+        user = request.user
+        instances, errors = [], []
+        for index, item in enumerate(items):
+            try:
+                validated = child.run_validation(item)
+            except serializers.ValidationError as e:
+                errors.append({'index': index, 'errors': e.detail})
+                continue
+            instances.append(model(user=user, **validated))
+
+        created = self.perform_bulk_create(instances, self.batch_chunk_size) if instances else []
+        logger.info("%s batch for user %s: %d created, %d rejected", model.__name__, user.username, len(created), len(errors))
+
+        return Response({
+            'created': len(created),
+            'ids': [obj.pk for obj in created],
+            'errors': errors,
+        }, status=status.HTTP_201_CREATED if created or not errors else status.HTTP_400_BAD_REQUEST)
+
+
+class DailyRollupMixin:
+    """
+    Keeps the user's DailyRollup rows in step with every create, update, delete
+    and batch insert made through a timestamped BaseUserOwnedViewSet. The raw
+    write and the rollup refresh share one transaction.
+    """
+
+    def perform_create(self, serializer):
+        with transaction.atomic():
+            super().perform_create(serializer)
+            refresh_rollups(self.request.user.id, [serializer.instance.timestamp])
+
+    def perform_update(self, serializer):
+        previous = serializer.instance.timestamp # The row may move to another day
+        with transaction.atomic():
+            super().perform_update(serializer)
+            refresh_rollups(self.request.user.id, [previous, serializer.instance.timestamp])
+
+    def perform_destroy(self, instance):
+        timestamp = instance.timestamp
+        with transaction.atomic():
+            super().perform_destroy(instance)
+            refresh_rollups(self.request.user.id, [timestamp])
+
+    def perform_bulk_create(self, instances, batch_size):
+        with transaction.atomic():
+            created = super().perform_bulk_create(instances, batch_size)
+            refresh_rollups(self.request.user.id, [obj.timestamp for obj in created])
+        return created
+
+
+class HealthMetricViewSet(DailyRollupMixin, BatchCreateMixin, BaseUserOwnedViewSet):
     """
     API endpoint that allows users to CREATE, READ, UPDATE, DELETE their health metrics.
     Inherits user filtering and ownership permissions from BaseUserOwnedViewSet.
     """
     queryset = HealthMetric.objects.all() # Base queryset (will be filtered by user)
     serializer_class = HealthMetricSerializer
+    pagination_class = TimestampCursorPagination # Keyset pages on (timestamp, id)
+    filter_backends = [TimeRangeFilter] # ?from= / ?to= on timestamp
+    time_range_field = 'timestamp'
+    has_archive = True # Months packed by `manage.py archive_metrics` (api/archive.py)
+
+    def merge_archived(self, page_rows):
+        paginator = self.paginator
+        limit = paginator.page_size + 1
+        start, end = parse_time_range(self.request.query_params)
+        # A full page of hot rows only leaves room for archived rows that sort before its last one
+        stop = page_rows[-1]['timestamp'] if len(page_rows) == limit else None
+        reverse = paginator.cursor.reverse if paginator.cursor else False
+        archived = archived_page(self.request.user.id, limit, start=start, end=end,
+                                 after=paginator.position, stop=stop, reverse=reverse)
+        return paginator.merge_rows(page_rows, archived) if archived else page_rows
+
+    def archived_row(self, pk):
+        return archived_row(self.request.user.id, pk)
+
+    def restore_archived(self, pk):
+        return restore_row(self.request.user.id, pk)
+
+    @action(detail=False, methods=['get'])
+    def summary(self, request, *args, **kwargs):
+        """
+        Per-period totals computed in the database:
+        GET /api/metrics/summary/?bucket=day|week|month&from=&to=&tz=
+        Returns steps, heart rate avg/min/max, last weight and meal calories per period.
+        """
+        bucket, tz, start, end = parse_summary_params(request.query_params)
+
+        def build():
+            results = build_summary(request.user, bucket=bucket, tz=tz, start=start, end=end)
+            return Response({
+                'bucket': bucket,
+                'time_zone': str(tz),
+                'results': results,
+            })
+
+        # Summaries combine metrics and meals, so either kind of write invalidates them
+        return self.cached(request, build, resources=('healthmetric', 'meal'))
+
+    @action(detail=False, methods=['get'])
+    def series(self, request, *args, **kwargs):
+        """
+        One metric downsampled for charting:
+        GET /api/metrics/series/?field=heart_rate|steps|weight&from=&to=&points=N&method=lttb|minmax
+        Returns at most N samples (default 500), however many the range holds.
+        """
+        field, method, points, start, end = parse_series_params(request.query_params)
 
+        def build():
+            results, total = build_series(request.user, field, method=method, points=points, start=start, end=end)
+            return Response({
+                'field': field,
+                'method': method,
+                'samples': total,
+                'results': results,
+            })
 
-class MealViewSet(BaseUserOwnedViewSet):
+        return self.cached(request, build)
+
+
+class MealViewSet(DailyRollupMixin, BatchCreateMixin, BaseUserOwnedViewSet):
     """
     API endpoint that allows users to CREATE, READ, UPDATE, DELETE their meal logs.
     Inherits user filtering and ownership permissions from BaseUserOwnedViewSet.
     """
     queryset = Meal.objects.all()
     serializer_class = MealSerializer
+    pagination_class = TimestampCursorPagination
+    filter_backends = [TimeRangeFilter]
+    time_range_field = 'timestamp'
 
 
 class FitnessGoalViewSet(BaseUserOwnedViewSet):
@@ -184,4 +837,17 @@ class FitnessGoalViewSet(BaseUserOwnedViewSet):
     Inherits user filtering and ownership permissions from BaseUserOwnedViewSet.
     """
     queryset = FitnessGoal.objects.all()
-    serializer_class = FitnessGoalSerializer
\ No newline at end of file
+    serializer_class = FitnessGoalSerializer
+    pagination_class = CreatedAtCursorPagination # Keyset pages on (created_at, id)
+
+    def get_queryset(self):
+        """
+        Optionally narrow to open or completed goals with ?completed=true|false.
+        """
+        queryset = super().get_queryset()
+        completed = self.request.query_params.get('completed')
+        if completed is not None:
+            # Compare against a literal: a bare boolean renders as `NOT completed` on
+            # SQLite, which can't use the (user, completed, created_at) index
+            queryset = queryset.filter(completed=Value(completed.lower() in ('1', 'true', 'yes')))
+        return queryset
@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+os.environ.setdefault('ASYNC_READ_VIEWS', 'True') # Native async read endpoints (api/async_views.py)
+os.environ.setdefault('LIVE_EVENTS_ENABLED', 'True') # Server-sent events at /api/stream/ (api/live.py)
 
 application = get_asgi_application()
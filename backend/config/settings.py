@@ -63,10 +63,15 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.RequestIdMiddleware', # X-Request-ID, included in JSON logs
+    # Early, so their latencies and Server-Timing 'total' cover the rest of the stack
+    'api.middleware.RequestMetricsMiddleware',
+    'api.middleware.RequestTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     # Whitenoise Middleware - Place high up, right after SecurityMiddleware
-    # To serve static files efficiently, especially in production
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    # To serve static files efficiently, especially in production. The subclass is
+    # async-capable: under ASGI, every middleware here must be (see api/middleware.py)
+    'api.middleware.StaticFilesMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     # CORS Middleware - Place before views that need CORS headers (e.g., CommonMiddleware)
     'corsheaders.middleware.CorsMiddleware',
@@ -166,7 +171,8 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 REST_FRAMEWORK = {
     # Use TokenAuthentication globally
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        # TokenAuthentication with token -> user lookups cached (see CACHES below)
+        'api.authentication.CachedTokenAuthentication',
         # Consider SessionAuthentication if you need browser session login (e.g., for Browsable API)
         # 'rest_framework.authentication.SessionAuthentication',
     ],
@@ -174,11 +180,138 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
-    # Optional: Add pagination, throttling, etc. globally if desired
-    # 'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
-    # 'PAGE_SIZE': 10
+    # JSON and the browsable API as before, plus opt-in compact formats (api/renderers.py):
+    # ?format=columnar (one array per field) and Accept: application/msgpack
+    'DEFAULT_RENDERER_CLASSES': [
+        'rest_framework.renderers.JSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+        'api.renderers.ColumnarJSONRenderer',
+        'api.renderers.MessagePackRenderer',
+    ],
+    # Keyset (cursor) pagination for list endpoints, see api/pagination.py.
+    # Clients may ask for up to `max_page_size` rows per page with ?page_size=.
+    'DEFAULT_PAGINATION_CLASS': 'api.pagination.TimestampCursorPagination',
+    'PAGE_SIZE': 50,
+    # Register/login throttles (api/throttling.py); set a rate to '' to turn it off
+    'DEFAULT_THROTTLE_RATES': {
+        'auth_ip': os.environ.get('AUTH_THROTTLE_IP_RATE', '30/minute') or None,
+        'auth_username': os.environ.get('AUTH_THROTTLE_USERNAME_RATE', '10/minute') or None,
+    },
 }
 
+# Authenticate through the password hashing pool below (api/backends.py)
+AUTHENTICATION_BACKENDS = ['api.backends.PooledHashingModelBackend']
+
+# Password hashing (api/hashing.py): at most PASSWORD_HASHING_MAX_CONCURRENT
+# register/login requests hash at once across all worker processes; the rest
+# get 429 with Retry-After. The hash runs on the request thread.
+PASSWORD_HASHING_MAX_CONCURRENT = int(os.environ.get('PASSWORD_HASHING_MAX_CONCURRENT', '4'))
+PASSWORD_HASHING_RETRY_AFTER = int(os.environ.get('PASSWORD_HASHING_RETRY_AFTER', '1')) # Seconds
+PASSWORD_HASHING_LOCK_DIR = os.environ.get('PASSWORD_HASHING_LOCK_DIR') # Default: /dev/shm/health-tracker-hashing
+
+# Delta sync (api/sync.py): tombstones of deleted rows are kept this long
+# (`manage.py prune_tombstones`); older sync cursors get 410 and start over
+SYNC_TOMBSTONE_RETENTION_DAYS = int(os.environ.get('SYNC_TOMBSTONE_RETENTION_DAYS', '90'))
+
+# Background tasks (api/tasks.py), run by `manage.py run_worker`: exports queued
+# with POST /api/export/, imports of large files, and rollup rebuilds and archive
+# runs queued with --enqueue. Failed attempts are retried after TASK_RETRY_BACKOFF
+# seconds, doubling up to TASK_RETRY_BACKOFF_MAX. A task whose worker stopped
+# renewing its lease for TASK_LEASE_SECONDS is run again.
+TASK_WORKER_CONCURRENCY = int(os.environ.get('TASK_WORKER_CONCURRENCY', '2')) # Threads per run_worker process
+TASK_MAX_ATTEMPTS = 3
+TASK_RETRY_BACKOFF = 10 # Seconds
+TASK_RETRY_BACKOFF_MAX = 600 # Seconds
+TASK_LEASE_SECONDS = 300
+TASK_RETENTION_DAYS = int(os.environ.get('TASK_RETENTION_DAYS', '7')) # Finished tasks and their files, then deleted
+TASK_MAX_PENDING_PER_USER = 5 # Further requests get 429
+TASK_POLL_INTERVAL = 2 # Seconds; sent as Retry-After while a task is pending
+TASK_FILE_MAX_BYTES = 50 * 1024 * 1024 # Largest upload stored for a task
+IMPORT_INLINE_MAX_BYTES = int(os.environ.get('IMPORT_INLINE_MAX_BYTES', str(1024 * 1024))) # Larger: background task
+
+
+# --- Caching ---
+# https://docs.djangoproject.com/en/X.Y/topics/cache/
+# Per-process memory cache by default. Set CACHE_BACKEND / CACHE_LOCATION to a shared
+# backend (e.g. 'django.core.cache.backends.redis.RedisCache') when running several
+# workers or instances, so invalidations reach all of them.
+# A per-process cache is only as good as a shared one when a single process serves
+# every request (runserver, one worker): say so with SINGLE_WORKER_PROCESS. Otherwise
+# the caches below that need sharing fall back to short TTLs or are switched off.
+# Local development (DEBUG) runs runserver, one process.
+SINGLE_WORKER_PROCESS = os.environ.get('SINGLE_WORKER_PROCESS', str(DEBUG)) == 'True'
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', 'health-tracker'),
+    },
+    # Rendered API responses (api/response_cache.py). Keys embed the data versions,
+    # so this store may be per process as long as the versions ('default') are
+    # shared; see RESPONSE_CACHE_ENABLED. LocMemCache evicts least recently used
+    # entries beyond MAX_ENTRIES.
+    'responses': {
+        'BACKEND': os.environ.get('RESPONSE_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('RESPONSE_CACHE_LOCATION', 'health-tracker-responses'),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.environ.get('RESPONSE_CACHE_MAX_ENTRIES', '1000')),
+        },
+    },
+}
+
+# Token authentication cache (api.authentication.CachedTokenAuthentication). A
+# deleted token or deactivated user is dropped from it at once, in every worker
+# only if the alias is shared; a per-process cache keeps entries for
+# AUTH_TOKEN_LOCAL_CACHE_TTL seconds at most.
+AUTH_TOKEN_CACHE_ALIAS = 'default'
+AUTH_TOKEN_CACHE_TTL = int(os.environ.get('AUTH_TOKEN_CACHE_TTL', '300')) # Seconds
+AUTH_TOKEN_LOCAL_CACHE_TTL = 5 # Seconds
+
+# Per-user data version counters behind the list/detail ETags (api/versions.py).
+# Must be a cache shared by all workers, or a worker may answer 304 for data
+# another worker has just changed. With a per-process cache (LocMemCache, the
+# default, unless SINGLE_WORKER_PROCESS) If-None-Match is ignored: always a 200.
+DATA_VERSION_CACHE_ALIAS = 'default'
+
+# Per-user response cache for list/detail/summary/dashboard reads. Its keys are
+# only invalidated everywhere when the data versions above are shared, so it is
+# off by default (and skipped even if enabled) with a per-process 'default' cache
+# and several workers: other workers would serve bodies up to RESPONSE_CACHE_TTL old.
+RESPONSE_CACHE_ENABLED = os.environ.get('RESPONSE_CACHE_ENABLED', str(
+    SINGLE_WORKER_PROCESS or not CACHES['default']['BACKEND'].endswith('.LocMemCache'))) == 'True'
+RESPONSE_CACHE_ALIAS = 'responses'
+RESPONSE_CACHE_TTL = 3600 # Seconds
+RESPONSE_CACHE_MAX_ENTRY_BYTES = 256 * 1024 # Larger responses are not cached
+
+# Per-request instrumentation (api/middleware.py): Server-Timing header plus
+# slow-request and repeated-query (N+1) warnings on the 'api' logger. A sampled
+# request has every query wrapped and sends its internal timings to the client,
+# so only a small fraction is measured by default.
+REQUEST_TIMING_SAMPLE_RATE = float(os.environ.get('REQUEST_TIMING_SAMPLE_RATE', '0.01')) # Fraction of requests measured
+REQUEST_TIMING_SLOW_MS = int(os.environ.get('REQUEST_TIMING_SLOW_MS', '500'))
+REQUEST_TIMING_REPEATED_QUERY_THRESHOLD = int(os.environ.get('REQUEST_TIMING_REPEATED_QUERY_THRESHOLD', '10'))
+
+# Request counters and latency histograms (api/request_metrics.py), served to
+# Prometheus at /api/_metrics. Each worker process keeps its own file in this
+# directory; use a tmpfs path and empty it when the service is redeployed.
+REQUEST_METRICS_DIR = os.environ.get('REQUEST_METRICS_DIR') # Default: /dev/shm/health-tracker-metrics
+
+# Serve JSON GETs of the list/detail/dashboard endpoints with native async views
+# (api/async_views.py). config/asgi.py turns this on; leave it off under WSGI,
+# where every async view would need its own event loop.
+ASYNC_READ_VIEWS = os.environ.get('ASYNC_READ_VIEWS', 'False') == 'True'
+
+# Live change events at /api/stream/ (api/live.py). config/asgi.py turns the
+# endpoint on. Writes publish events either way. With several processes, set
+# LIVE_EVENTS_BACKEND to 'api.live.PostgresBackend' (NOTIFY/LISTEN), so a write
+# in one process reaches streams held by another.
+LIVE_EVENTS_ENABLED = os.environ.get('LIVE_EVENTS_ENABLED', 'False') == 'True'
+LIVE_EVENTS_BACKEND = os.environ.get('LIVE_EVENTS_BACKEND', 'api.live.LocalBackend')
+LIVE_EVENTS_QUEUE_SIZE = int(os.environ.get('LIVE_EVENTS_QUEUE_SIZE', '100')) # Per stream; beyond it the client resyncs
+LIVE_EVENTS_HEARTBEAT = 15 # Seconds between keep-alive comments on an idle stream
+LIVE_EVENTS_MAX_SECONDS = 3600 # Streams are closed (EventSource reconnects) after this long
+LIVE_EVENTS_MAX_STREAMS_PER_USER = 10
+LIVE_EVENTS_TICKET_SECONDS = 30 # Lifetime of the single-use tickets browsers open streams with
+
 
 # --- CORS (Cross-Origin Resource Sharing) Settings ---
 # https://github.com/adamchainz/django-cors-headers
@@ -200,6 +333,13 @@ CORS_ALLOW_CREDENTIALS = True
 # --- Logging Configuration (Enhanced) ---
 # Basic configuration to log INFO and higher level messages to the console
 # Render captures console output, so this is usually sufficient for deployment logs.
+# LOG_FORMAT=json switches the console handler to queued JSON lines with request IDs:
+# formatting and writing happen on a background thread (api/structured_logging.py).
+LOG_FORMAT = os.environ.get('LOG_FORMAT', 'text') # 'text' or 'json'
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'DEBUG' if DEBUG else 'INFO') # Root and 'api' loggers
+# Keep only a fraction of the DEBUG/INFO records of busy loggers, e.g. 'api.views=0.1'
+LOG_SAMPLE_RATES = os.environ.get('LOG_SAMPLE_RATES', '')
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False, # Keep Django's default loggers
@@ -212,17 +352,31 @@ LOGGING = {
             'format': '{levelname} {asctime} {module} {message}',
             'style': '{',
         },
+        'json': {
+            '()': 'api.structured_logging.JsonFormatter',
+        },
+    },
+    'filters': {
+        'sampling': {
+            '()': 'api.structured_logging.SamplingFilter',
+            'rates': LOG_SAMPLE_RATES,
+        },
     },
     'handlers': {
         'console': {
             'class': 'logging.StreamHandler', # Output logs to stderr/stdout
             'formatter': 'simple', # Use the simple format for console
+            'filters': ['sampling'],
+        } if LOG_FORMAT != 'json' else {
+            'class': 'api.structured_logging.QueuedStreamHandler', # Writes on a background thread
+            'formatter': 'json',
+            'filters': ['sampling'],
         },
     },
     'root': { # Catch-all logger
         'handlers': ['console'],
         # Set level based on DEBUG: INFO for production, DEBUG for local dev
-        'level': 'DEBUG' if DEBUG else 'INFO',
+        'level': LOG_LEVEL,
     },
     'loggers': { # Configure specific loggers if needed
         'django': { # Configure Django's internal logs
@@ -232,7 +386,7 @@ LOGGING = {
         },
          'api': { # Configure logs specifically from your 'api' app
             'handlers': ['console'],
-            'level': 'DEBUG' if DEBUG else 'INFO', # More verbose for api app in dev
+            'level': LOG_LEVEL, # More verbose for api app in dev
             'propagate': False,
         },
     }
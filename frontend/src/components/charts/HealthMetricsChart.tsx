@@ -1,14 +1,14 @@
 import React from 'react';
 import { ResponsiveContainer, LineChart, Line, XAxis, YAxis, CartesianGrid, Tooltip, Legend, TooltipProps } from 'recharts'; // Import TooltipProps
-import { format } from 'date-fns';
+import { format, parseISO } from 'date-fns';
 // Import type
-import { HealthMetric } from '@/types'; // Adjust path
+import { MetricSummary } from '@/types'; // Adjust path
 // Import types for recharts Tooltip payload
 import { ValueType, NameType } from 'recharts/types/component/DefaultTooltipContent';
 
 // Define props type
 interface HealthMetricsChartProps {
-    data: HealthMetric[];
+    data: MetricSummary[]; // Daily buckets from /metrics/summary/, oldest first
 }
 
 // Define type for processed chart data point
@@ -20,16 +20,13 @@ interface ChartDataPoint {
 }
 
 const HealthMetricsChart: React.FC<HealthMetricsChartProps> = ({ data }) => {
-  // Prepare data for the chart
-  const chartData: ChartDataPoint[] = data
-    .slice() // Create a copy
-    .sort((a, b) => new Date(a.timestamp).getTime() - new Date(b.timestamp).getTime()) // Ensure correct date sorting
-    .map(metric => ({
-      timestamp: format(new Date(metric.timestamp), 'MMM d'),
+  // Prepare data for the chart: one point per period, already aggregated and sorted by the API
+  const chartData: ChartDataPoint[] = data.map(bucket => ({
+      timestamp: format(parseISO(bucket.period), 'MMM d'),
       // Use undefined if value is null/invalid so recharts skips the point
-      Weight: metric.weight !== null ? Number(metric.weight) : undefined,
-      Steps: metric.steps !== null ? Number(metric.steps) : undefined,
-      'Heart Rate': metric.heart_rate !== null ? Number(metric.heart_rate) : undefined,
+      Weight: bucket.weight_last !== null ? Number(bucket.weight_last) : undefined,
+      Steps: bucket.steps_total !== null ? Number(bucket.steps_total) : undefined,
+      'Heart Rate': bucket.heart_rate_avg !== null ? Number(bucket.heart_rate_avg) : undefined,
     }));
 
    // Custom Tooltip Component - Type using TooltipProps
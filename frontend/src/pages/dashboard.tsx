@@ -9,7 +9,7 @@ import type { NextPage } from 'next';
 import axios from 'axios'; // Import axios for type checking
 
 // Import types
-import { HealthMetric, Meal, FitnessGoal } from '@/types'; // Adjust path as needed
+import { HealthMetric, Meal, FitnessGoal, MetricSummary, DashboardResponse } from '@/types'; // Adjust path as needed
 
 // Import Components
 import HealthMetricsChart from '@/components/charts/HealthMetricsChart';
@@ -25,21 +25,22 @@ const DashboardPage: NextPage = () => {
   const [metrics, setMetrics] = useState<HealthMetric[]>([]);
   const [meals, setMeals] = useState<Meal[]>([]);
   const [goals, setGoals] = useState<FitnessGoal[]>([]);
+  const [summary, setSummary] = useState<MetricSummary[]>([]);
   const [loading, setLoading] = useState<boolean>(true);
   const [error, setError] = useState<string | null>(null);
 
-  const fetchData = async () => {
-    setLoading(true);
+  const fetchData = async (showSpinner: boolean = true) => {
+    if (showSpinner) setLoading(true);
     setError(null);
     try {
-      const [metricsRes, mealsRes, goalsRes] = await Promise.all([
-        apiClient.get<HealthMetric[]>('/metrics/'),
-        apiClient.get<Meal[]>('/meals/'),
-        apiClient.get<FitnessGoal[]>('/goals/'),
-      ]);
-      setMetrics(metricsRes.data);
-      setMeals(mealsRes.data);
-      setGoals(goalsRes.data);
+      // One request for the whole page: latest metrics, today's meals, open goals
+      // and 30 daily buckets for the chart, in the browser's time zone
+      const tz = Intl.DateTimeFormat().resolvedOptions().timeZone;
+      const { data } = await apiClient.get<DashboardResponse>('/dashboard/', { params: { days: 30, tz } });
+      setMetrics(data.metrics);
+      setMeals(data.meals_today);
+      setGoals(data.open_goals);
+      setSummary(data.summary.results);
     } catch (error) { // Use generic error, check type below
       console.error("Error fetching dashboard data:", error);
       let errorMsg = "Failed to load dashboard data. Please try again later.";
@@ -59,6 +60,55 @@ const DashboardPage: NextPage = () => {
     fetchData();
   }, []);
 
+  // Live updates from the user's other tabs and devices: the server pushes a small
+  // event on /stream/ for every change, and a burst of them causes one quiet refetch.
+  // Where the stream isn't served, the ticket request fails and the page works as before.
+  useEffect(() => {
+    if (!localStorage.getItem('authToken') || typeof EventSource === 'undefined') return;
+    let source: EventSource | undefined;
+    let timer: ReturnType<typeof setTimeout> | undefined;
+    let retry: ReturnType<typeof setTimeout> | undefined;
+    let connected = false;
+    let closed = false;
+    const refetchSoon = (): void => {
+      clearTimeout(timer);
+      timer = setTimeout(() => fetchData(false), 250);
+    };
+    // EventSource can't send an Authorization header, and the token must stay out of
+    // URLs, so every connection opens with a single-use ticket. The browser's own
+    // reconnect would reuse a spent one: reconnect here instead, with a new ticket.
+    const connect = async (): Promise<void> => {
+      let ticket: string;
+      try {
+        ticket = (await apiClient.post<{ ticket: string }>('/stream/ticket/')).data.ticket;
+      } catch (error) {
+        if (!closed && !(axios.isAxiosError(error) && error.response?.status === 404)) {
+          retry = setTimeout(connect, 3000);
+        }
+        return;
+      }
+      if (closed) return;
+      source = new EventSource(`${process.env.NEXT_PUBLIC_API_URL}/stream/?ticket=${encodeURIComponent(ticket)}`);
+      source.addEventListener('ready', () => {
+        if (connected) refetchSoon(); // Reconnected: changes may have been missed meanwhile
+        connected = true;
+      });
+      source.addEventListener('change', refetchSoon);
+      source.addEventListener('resync', refetchSoon); // We fell behind; the server dropped our backlog
+      source.onerror = () => {
+        source?.close();
+        if (!closed) retry = setTimeout(connect, 3000);
+      };
+    };
+    connect();
+    return () => {
+      closed = true;
+      clearTimeout(timer);
+      clearTimeout(retry);
+      source?.close();
+    };
+  }, []);
+
   const refreshData = (): void => {
       fetchData();
   }
@@ -146,7 +196,7 @@ const DashboardPage: NextPage = () => {
               </div>
               {metrics.length > 0 ? (
                  <div className='mb-6 h-64 md:h-80'>
-                     <HealthMetricsChart data={metrics} />
+                     <HealthMetricsChart data={summary} />
                  </div>
               ) : (
                  <p className="text-text_secondary italic mb-4">No metrics logged yet. Add one to see the chart!</p>
@@ -157,7 +207,7 @@ const DashboardPage: NextPage = () => {
             {/* Section 2: Meal Log */}
             <section className="bg-surface p-6 rounded-lg shadow-md">
                <div className="flex justify-between items-center mb-4">
-                  <h2 className="text-xl font-semibold text-primary">Meal Log</h2>
+                  <h2 className="text-xl font-semibold text-primary">Today&apos;s Meals</h2>
                   <Link href="/add-meal" className="bg-secondary hover:bg-secondary-dark text-white px-3 py-1.5 rounded-md text-sm font-medium inline-flex items-center space-x-1">
                      <PlusIcon className="h-4 w-4" />
                      <span>Add Meal</span>
@@ -169,7 +219,7 @@ const DashboardPage: NextPage = () => {
             {/* Section 3: Fitness Goals */}
             <section className="bg-surface p-6 rounded-lg shadow-md">
                 <div className="flex justify-between items-center mb-4">
-                    <h2 className="text-xl font-semibold text-primary">Fitness Goals</h2>
+                    <h2 className="text-xl font-semibold text-primary">Open Fitness Goals</h2>
                     <Link href="/add-goal" className="bg-secondary hover:bg-secondary-dark text-white px-3 py-1.5 rounded-md text-sm font-medium inline-flex items-center space-x-1">
                        <PlusIcon className="h-4 w-4" />
                        <span>Add Goal</span>
@@ -28,6 +28,39 @@ export interface FitnessGoal {
     completed_at: string | null; // Can be null
 }
 
+// List endpoints return keyset-paginated pages; follow `next` for older rows
+export interface Paginated<T> {
+    next: string | null;
+    previous: string | null;
+    results: T[];
+}
+
+// One period of /metrics/summary/ (aggregated server-side)
+export interface MetricSummary {
+    period: string; // Start date of the bucket, YYYY-MM-DD in the requested time zone
+    steps_total: number | null;
+    heart_rate_avg: number | null;
+    heart_rate_min: number | null;
+    heart_rate_max: number | null;
+    weight_last: string | null; // Decimal serialized as string
+    calories_total: number | null;
+    meal_count: number;
+}
+
+export interface SummaryResponse {
+    bucket: 'day' | 'week' | 'month';
+    time_zone: string;
+    results: MetricSummary[];
+}
+
+// Response of /dashboard/: everything the dashboard page shows, in one request
+export interface DashboardResponse {
+    metrics: HealthMetric[]; // Newest first
+    meals_today: Meal[];
+    open_goals: FitnessGoal[];
+    summary: SummaryResponse;
+}
+
 // You might also reuse the User type from AuthContext here
 export interface User {
   id: number;